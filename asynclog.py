@@ -0,0 +1,95 @@
+import logging
+import threading
+import Queue
+
+""" Logging that stays off the FUSE hot path.
+
+FUSE handler threads only put log records on a queue; a background thread
+formats them and writes them to the log file. Records below the configured
+level are never created in the first place, so as long as callers pass
+arguments instead of preformatted strings (logging.debug("x %s", y)) and use
+exc_info=True instead of traceback.format_exc(), a disabled message costs a
+single level check.
+
+"""
+
+class QueueHandler(logging.Handler):
+    """ Puts records on a queue for a QueueListener to write. """
+
+    def __init__(self, queue):
+        logging.Handler.__init__(self)
+        self.queue = queue
+
+    def emit(self, record):
+        # Tracebacks refer to live frames, so render them before the record
+        # leaves this thread. The message itself is formatted by the listener.
+        if record.exc_info:
+            record.exc_text = logging._defaultFormatter.formatException(record.exc_info)
+            record.exc_info = None
+        self.queue.put(record)
+
+class QueueListener:
+    """ Writes records from a queue to a handler on a background thread. """
+
+    # Put on the queue to make the listener stop.
+    sentinel = None
+
+    def __init__(self, queue, handler):
+        self.queue = queue
+        self.handler = handler
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='squeakfs-log')
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            record = self.queue.get()
+            if record is self.sentinel:
+                break
+            try:
+                self.handler.handle(record)
+            except Exception:
+                self.handler.handleError(record)
+        self.handler.flush()
+
+    def stop(self):
+        """ Writes out everything queued so far and stops the thread. """
+
+        if self.thread is not None:
+            self.queue.put(self.sentinel)
+            self.thread.join()
+            self.thread = None
+        self.handler.close()
+
+def configure(filename, level=logging.INFO):
+    """ Sends all logging to filename through a background thread.
+
+    Arguments:
+        filename    the log file, opened in append mode.
+        level       a logging level or its name, such as 'DEBUG'.
+
+    Returns:
+                    the QueueListener. Records queue up until it is started,
+                    which must happen after FUSE has daemonized (fsinit).
+
+    """
+
+    if isinstance(level, basestring):
+        level = logging.getLevelName(level.upper())
+        if not isinstance(level, int):
+            raise ValueError('Unknown log level %s' % level)
+
+    queue = Queue.Queue()
+    target = logging.FileHandler(filename, 'a')
+    target.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+    listener = QueueListener(queue, target)
+
+    root = logging.getLogger()
+    for h in root.handlers[:]:
+        root.removeHandler(h)
+    root.addHandler(QueueHandler(queue))
+    root.setLevel(level)
+    return listener
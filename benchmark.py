@@ -0,0 +1,331 @@
+import os
+import sys
+import time
+import gc
+import json
+import random
+import shutil
+import tempfile
+import optparse
+import subprocess
+
+import standin
+
+""" Workload benchmarks for SqueakFS.
+
+Serves a synthetic image from the stand-in server, mounts the real SqueakFS
+against it and times the workloads people actually run on the mount. Results
+are written as JSON so that revisions can be compared:
+
+    python benchmark.py --classes 500 --output testresults/bench.json
+
+With --index, nothing is mounted: the image is indexed for search/,
+implementors/ and senders/ in the benchmark process itself, and the RSS the
+indexes take is reported instead:
+
+    python benchmark.py --classes 2000 --index
+
+With --decode, a listing of --entries names is decoded as the line protocol
+and as binary framing answer it, raw and converted to file names, and the
+entries decoded per second are reported:
+
+    python benchmark.py --decode --entries 50000
+
+Every workload starts with cold client caches (/.squeakfs/flush) and zeroed
+counters (/.squeakfs/reset). Round trips are counted by the stand-in server,
+FUSE operations are read back from /.squeakfs/stats.
+
+"""
+
+TREES = ['flat', 'hierarchy', 'category']
+WORKLOADS = ['cp', 'ls', 'find', 'grep', 'stat']
+
+def revision():
+    try:
+        p = subprocess.Popen(['git', 'describe', '--always', '--dirty'],
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        out = p.communicate()[0].strip()
+        if p.returncode == 0:
+            return out
+    except OSError:
+        pass
+    return 'unknown'
+
+def memory(pid):
+    """ Returns (rss, peak rss) of a process in kB, from /proc. """
+
+    rss = peak = 0
+    try:
+        f = open('/proc/%d/status' % pid)
+        for line in f:
+            if line.startswith('VmRSS:'):
+                rss = int(line.split()[1])
+            elif line.startswith('VmHWM:'):
+                peak = int(line.split()[1])
+        f.close()
+    except IOError:
+        pass
+    return rss, peak
+
+class Mount:
+    """ A SqueakFS process mounted against a stand-in server. """
+
+    def __init__(self, port, mountpoint, options=''):
+        self.mountpoint = mountpoint
+        squeakfs = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'squeakfs.py')
+        opts = 'squeakport=%d' % port
+        if options:
+            opts += ',' + options
+        self.process = subprocess.Popen([sys.executable, squeakfs, mountpoint, '-f', '-o', opts])
+        deadline = time.time() + 30
+        while not os.path.ismount(mountpoint):
+            if self.process.poll() is not None or time.time() > deadline:
+                raise RuntimeError('SqueakFS did not mount at %s' % mountpoint)
+            time.sleep(0.1)
+
+    def control(self, name, data=None):
+        path = os.path.join(self.mountpoint, '.squeakfs', name)
+        if data is None:
+            f = open(path)
+            result = f.read()
+        else:
+            f = open(path, 'w')
+            result = f.write(data)
+        f.close()
+        return result
+
+    def operations(self):
+        """ Returns the number of FUSE operations since the last reset. """
+
+        total = 0
+        for line in self.control('stats').split('\n'):
+            if line.startswith('['):
+                if line != '[operations]':
+                    break
+                continue
+            for field in line.split():
+                if field.startswith('count='):
+                    total += int(field[6:])
+        return total
+
+    def unmount(self):
+        subprocess.call(['fusermount', '-u', self.mountpoint])
+        self.process.wait()
+
+def paths(image, tree, count, rnd):
+    """ Picks count random existing paths below tree for the stat workload. """
+
+    classes = image.getAllClasses()
+    result = []
+    while len(result) < count:
+        cls = image.classes[rnd.choice(classes)]
+        methods = sorted(cls.instanceMethods)
+        if not methods:
+            continue
+        sel = rnd.choice(methods)
+        if '/' in sel or '*' in sel or '\\' in sel:
+            continue
+        if tree == 'flat':
+            result.append('flat/%s/instance/%s' % (cls.name, sel))
+        elif tree == 'category':
+            result.append('category/%s/%s/instance/%s/%s' \
+                    % (cls.category, cls.name, cls.instanceMethods[sel][0], sel))
+        else:
+            chain = []
+            c = cls
+            while c is not None:
+                chain.insert(0, c.name)
+                c = c.superclass and image.classes[c.superclass]
+            result.append('hierarchy/' + '/subclasses/'.join(chain) + '/instance/' + sel)
+    return result
+
+def run(mount, image, tree, workload, scratch, rnd, statcount):
+    root = os.path.join(mount.mountpoint, tree)
+    devnull = open(os.devnull, 'w')
+    if workload == 'cp':
+        dest = tempfile.mkdtemp(dir=scratch)
+        cmd = ['cp', '-R', root, dest]
+    elif workload == 'ls':
+        cmd = ['ls', '-lR', root]
+    elif workload == 'find':
+        cmd = ['find', root]
+    elif workload == 'grep':
+        cmd = ['grep', '-r', '-c', 'primitiveFailed', root]
+    else:
+        cmd = None
+
+    start = time.time()
+    if cmd is not None:
+        status = subprocess.call(cmd, stdout=devnull, stderr=devnull)
+    else:
+        status = 0
+        for p in paths(image, tree, statcount, rnd):
+            try:
+                os.stat(os.path.join(mount.mountpoint, p))
+            except OSError:
+                status = 1
+    elapsed = time.time() - start
+    devnull.close()
+    if workload == 'cp':
+        shutil.rmtree(dest, True)
+    return status, elapsed
+
+def index(port):
+    """ Fully indexes the image served on port in this process.
+
+    Returns the seconds taken and the growth of RSS in kB.
+
+    """
+
+    import indexer, search, squeakNet, xref
+    gc.collect()
+    before = memory(os.getpid())[0]
+    start = time.time()
+    ix = indexer.Indexer(lambda: squeakNet.SqueakNet(port))
+    ix.addConsumer(search.SearchIndex())
+    ix.addConsumer(xref.XrefIndex())
+    ix.scan(ix.connect())
+    elapsed = time.time() - start
+    gc.collect()
+    after = memory(os.getpid())[0]
+    return elapsed, after - before
+
+def decode(port, entries, repeat=10):
+    """ Times decoding a listing of entries names in each framing.
+
+    Returns {name: entries per second}, the best of repeat runs.
+
+    """
+
+    import framing, squeakNet
+    sn = squeakNet.SqueakNet(port)
+    names = ['method%d:with:' % i for i in range(entries)]
+    text = '\r'.join(names)
+    payload = framing.encodeFields(names)
+    cases = [('text', lambda: squeakNet.lines(text)),
+             ('binary', lambda: framing.decodeResponse(framing.LIST, payload)),
+             ('text_converted', lambda: sn.convertArraySpecial(text)),
+             ('binary_converted', lambda: sn.convertArraySpecial(framing.decodeResponse(framing.LIST, payload)))]
+    rates = {}
+    for name, fn in cases:
+        assert(len(fn()) == entries)
+        best = None
+        for i in range(repeat):
+            start = time.time()
+            fn()
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        rates[name] = entries / max(best, 1e-9)
+    return rates
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('--classes', type='int', default=100)
+    parser.add_option('--methods', type='int', default=20)
+    parser.add_option('--categories', type='int', default=10)
+    parser.add_option('--depth', type='int', default=5)
+    parser.add_option('--traits', type='int', default=2)
+    parser.add_option('--comment', type='int', default=200)
+    parser.add_option('--trees', default=','.join(TREES))
+    parser.add_option('--workloads', default=','.join(WORKLOADS))
+    parser.add_option('--stats', type='int', default=200,
+                      help='Number of paths for the stat workload.')
+    parser.add_option('--seed', type='int', default=0)
+    parser.add_option('--options', default='',
+                      help='Extra SqueakFS mount options.')
+    parser.add_option('--index', action='store_true', default=False,
+                      help='Measure the memory of the indexes instead of mounting.')
+    parser.add_option('--decode', action='store_true', default=False,
+                      help='Measure decoding a listing instead of mounting.')
+    parser.add_option('--entries', type='int', default=50000,
+                      help='Number of names in the listing decoded by --decode.')
+    parser.add_option('--output', help='Write results here instead of stdout.')
+    opts, args = parser.parse_args()
+
+    image = standin.synthesize(opts.classes, opts.methods, opts.categories,
+                               opts.depth, opts.traits, opts.comment)
+    server = standin.StandInServer(image)
+    server.start()
+
+    if opts.index:
+        try:
+            elapsed, rss = index(server.port)
+        finally:
+            server.stop()
+        results = [{'workload': 'index', 'seconds': round(elapsed, 4), 'index_rss_kb': rss}]
+        print >> sys.stderr, 'index %8.2fs %10d kB' % (elapsed, rss)
+        report(opts, results)
+        return
+
+    if opts.decode:
+        try:
+            rates = decode(server.port, opts.entries)
+        finally:
+            server.stop()
+        results = []
+        for name in sorted(rates):
+            results.append({'workload': 'decode', 'framing': name, 'entries': opts.entries,
+                            'entries_per_sec': round(rates[name], 1)})
+            print >> sys.stderr, 'decode %-16s %12.1f entries/s' % (name, rates[name])
+        report(opts, results)
+        return
+
+    scratch = tempfile.mkdtemp(prefix='squeakfs-bench-')
+    mountpoint = os.path.join(scratch, 'mnt')
+    os.mkdir(mountpoint)
+    mount = Mount(server.port, mountpoint, opts.options)
+    rnd = random.Random(opts.seed)
+
+    results = []
+    try:
+        for tree in opts.trees.split(','):
+            for workload in opts.workloads.split(','):
+                mount.control('flush', '1')
+                mount.control('reset', '1')
+                requests = server.requests
+                status, elapsed = run(mount, image, tree, workload, scratch, rnd, opts.stats)
+                roundtrips = server.requests - requests
+                ops = mount.operations()
+                rss, peak = memory(mount.process.pid)
+                result = {'tree': tree,
+                          'workload': workload,
+                          'status': status,
+                          'seconds': round(elapsed, 4),
+                          'operations': ops,
+                          'ops_per_sec': round(ops / max(elapsed, 1e-9), 1),
+                          'roundtrips': roundtrips,
+                          'rss_kb': rss,
+                          'peak_rss_kb': peak}
+                results.append(result)
+                print >> sys.stderr, '%-9s %-5s %8.2fs %8d ops %10.1f ops/s %8d round trips' \
+                        % (tree, workload, elapsed, ops, result['ops_per_sec'], roundtrips)
+    finally:
+        mount.unmount()
+        server.stop()
+        shutil.rmtree(scratch, True)
+
+    report(opts, results)
+
+def report(opts, results):
+    summary = {'revision': revision(),
+               'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'image': {'classes': opts.classes,
+                         'methods': opts.methods,
+                         'categories': opts.categories,
+                         'depth': opts.depth,
+                         'traits': opts.traits,
+                         'comment': opts.comment},
+               'options': opts.options,
+               'results': results}
+    data = json.dumps(summary, indent=2, sort_keys=True)
+    if opts.output:
+        f = open(opts.output, 'w')
+        f.write(data + '\n')
+        f.close()
+    else:
+        print data
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+import math
+import time
+import struct
+import hashlib
+import logging
+import threading
+from array import array
+
+from squeakNet import SqueakNetException
+
+""" Answering "does it exist?" for names the image does not have, locally.
+
+Shells, editors and build tools stat many paths that do not exist, such as
+backup files next to methods or classes from another image, and each of those
+costs a round trip. Membership keeps Bloom filters of
+
+    classes         every class and trait name
+    methods         every (class, side, selector)
+    categories      every (category, class)
+
+loaded in bulk at mount with pipelined listings. Every refresh seconds
+Membership asks the image for its change stamp, a single small command, and
+reloads the filters only when the stamp moved. When an indexer.Indexer is
+running, Membership is also one of its consumers, so methods it finds are
+added at once.
+
+FilteredSqueakNet answers a check locally when the filter has never seen the
+name and the filters were confirmed current less than fresh seconds ago;
+everything else, including the false positives of the filters, goes to the
+image. So a name created in the image is found by asking it until the next
+check has reloaded the filters. Until the filters are loaded, and with images
+that have no change stamp, every check goes to the image.
+
+Filters cannot forget names, so a removed method keeps going to the image
+until the next reload.
+
+"""
+
+# The filters of a Membership.
+CLASSES = 0
+METHODS = 1
+CATEGORIES = 2
+
+class BloomFilter:
+    """ A set of strings that may answer true for strings never added.
+
+    Arguments:
+        capacity    the number of strings expected.
+        rate        the wanted false positive rate at that capacity.
+
+    """
+
+    def __init__(self, capacity, rate=0.01):
+        capacity = max(capacity, 1)
+        self.size = int(math.ceil(-capacity * math.log(rate) / math.log(2) ** 2))
+        self.hashes = max(1, int(round(self.size / float(capacity) * math.log(2))))
+        self.bits = array('B', [0]) * ((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, key):
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        # Double hashing: the k positions are a + i * b.
+        a, b = struct.unpack('<QQ', hashlib.md5(key).digest())
+        return [(a + i * b) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for p in self.positions(key):
+            self.bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        for p in self.positions(key):
+            if not self.bits[p >> 3] & (1 << (p & 7)):
+                return False
+        return True
+
+def methodKey(cls, classSide, selector):
+    return '%s\t%s\t%s' % (cls, classSide and 'class' or 'instance', selector)
+
+def categoryKey(category, cls):
+    return '%s\t%s' % (category, cls)
+
+class Membership:
+    """ The filters of an image, checked every refresh seconds on a connection from connect().
+
+    Arguments:
+        spare       how many times the names found at load the filters are
+                    sized for, leaving room for names added by the indexer.
+        fresh       seconds after the last check during which misses are
+                    answered locally, twice refresh and a second by default.
+
+    """
+
+    def __init__(self, connect, refresh=2, depth=32, rate=0.01, spare=2, fresh=None):
+        self.connect = connect
+        self.refresh = refresh
+        if fresh is None:
+            fresh = 2 * refresh + 1
+        self.fresh = fresh
+        self.depth = max(depth, 1)
+        self.rate = rate
+        self.spare = spare
+        self.lock = threading.Lock()
+        self.filters = None     # (classes, methods, categories) once loaded
+        self.stamp = None       # the change stamp of the image they were loaded at
+        self.checked = 0        # when the image last had that stamp
+        self.ready = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def fetch(self, sn, commands):
+        results = []
+        for i in range(0, len(commands), self.depth):
+            results.extend(sn.pipeline(commands[i:i + self.depth]))
+        return results
+
+    def load(self, sn):
+        """ Builds the filters from a full listing of the image. """
+
+        start = time.time()
+        stamp = sn.getChangeStamp()
+        classes = sn.getAllClasses() + sn.getAllTraits()
+        categories = sn.getCategories()
+        commands = []
+        for cls in classes:
+            commands.append('getInstanceMethodsInClass:\t%s' % cls)
+            commands.append('getClassMethodsInClass:\t%s' % cls)
+        for category in categories:
+            commands.append('getClassesInCategory:\t%s' % category)
+        responses = self.fetch(sn, commands)
+
+        methods = []
+        for i, cls in enumerate(classes):
+            for side in (False, True):
+                r = responses[2 * i + side]
+                if not isinstance(r, SqueakNetException):
+                    methods.extend([methodKey(cls, side, sel) for sel in sn.convertArraySpecial(r)])
+        members = []
+        for category, r in zip(categories, responses[2 * len(classes):]):
+            if not isinstance(r, SqueakNetException):
+                members.extend([categoryKey(category, cls) for cls in sn.convertArraySpecial(r)])
+
+        filters = []
+        for keys in (classes, methods, members):
+            f = BloomFilter(len(keys) * self.spare, self.rate)
+            for key in keys:
+                f.add(key)
+            filters.append(f)
+        self.lock.acquire()
+        self.filters = tuple(filters)
+        self.stamp = stamp
+        self.checked = start
+        self.lock.release()
+        self.ready.set()
+        logging.info("Loaded filters of %d classes and %d methods", len(classes), len(methods))
+
+    def check(self, sn):
+        """ Confirms that the filters are current, reloading them if the image changed. """
+
+        start = time.time()
+        if self.filters is not None and sn.getChangeStamp() == self.stamp:
+            self.checked = start
+        else:
+            self.load(sn)
+
+    def methodsChanged(self, cls, classSide, changed, removed):
+        self.lock.acquire()
+        try:
+            if self.filters is None:
+                return
+            classes, methods, categories = self.filters
+            classes.add(cls)
+            for sel in changed:
+                methods.add(methodKey(cls, classSide, sel))
+        finally:
+            self.lock.release()
+
+    def excludes(self, which, key):
+        """ Returns True if the filter which (CLASSES, METHODS or CATEGORIES) has never seen key. """
+
+        filters = self.filters
+        return filters is not None and time.time() - self.checked < self.fresh \
+            and key not in filters[which]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='squeakfs-filters')
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        sn = None
+        while not self.stopped.isSet():
+            try:
+                if sn is None:
+                    sn = self.connect()
+                self.check(sn)
+            except SqueakNetException, e:
+                if 'Unknown command' in e.errmsg:
+                    logging.warning("The image has no change stamp, lookups are not filtered")
+                    return
+                logging.warning("Loading the filters failed", exc_info=True)
+                sn = None
+            except Exception:
+                logging.error("Loading the filters failed", exc_info=True)
+            self.stopped.wait(self.refresh)
+
+class FilteredSqueakNet:
+    """ Answers existence checks the filters of membership rule out without the image. """
+
+    def __init__(self, sn, membership, stats=None):
+        self.sn = sn
+        self.membership = membership
+        self.stats = stats
+
+    def __getattr__(self, name):
+        return getattr(self.sn, name)
+
+    def excludes(self, which, key):
+        if self.membership.excludes(which, key):
+            if self.stats is not None:
+                self.stats.increment('filtered')
+            return True
+        return False
+
+    def isClassAvailable(self, inClass):
+        if self.excludes(CLASSES, inClass):
+            return False
+        return self.sn.isClassAvailable(inClass)
+
+    def isInstanceMethodAvailable(self, inClass, method):
+        if self.excludes(METHODS, methodKey(inClass, False, method)):
+            return False
+        return self.sn.isInstanceMethodAvailable(inClass, method)
+
+    def isClassMethodAvailable(self, inClass, method):
+        if self.excludes(METHODS, methodKey(inClass, True, method)):
+            return False
+        return self.sn.isClassMethodAvailable(inClass, method)
+
+    def isClassInCategory(self, category, inClass):
+        if self.excludes(CATEGORIES, categoryKey(category, inClass)):
+            return False
+        return self.sn.isClassInCategory(category, inClass)
+
+    def getInstanceMethod(self, inClass, method):
+        if self.excludes(METHODS, methodKey(inClass, False, method)):
+            raise SqueakNetException("Error: No such method", -1)
+        return self.sn.getInstanceMethod(inClass, method)
+
+    def getClassMethod(self, inClass, method):
+        if self.excludes(METHODS, methodKey(inClass, True, method)):
+            raise SqueakNetException("Error: No such method", -1)
+        return self.sn.getClassMethod(inClass, method)
+
+    def getLatestMethodStamp(self, inClass):
+        if self.excludes(CLASSES, inClass):
+            raise SqueakNetException("Error: No such class", -1)
+        return self.sn.getLatestMethodStamp(inClass)
+
+    def getInstanceMethodStat(self, inClass, method):
+        if self.excludes(METHODS, methodKey(inClass, False, method)):
+            raise SqueakNetException("Error: No such method", -1)
+        return self.sn.getInstanceMethodStat(inClass, method)
+
+    def getClassMethodStat(self, inClass, method):
+        if self.excludes(METHODS, methodKey(inClass, True, method)):
+            raise SqueakNetException("Error: No such method", -1)
+        return self.sn.getClassMethodStat(inClass, method)
+
+    def getInstanceMethodSize(self, inClass, method):
+        if self.excludes(METHODS, methodKey(inClass, False, method)):
+            raise SqueakNetException("Error: No such method", -1)
+        return self.sn.getInstanceMethodSize(inClass, method)
+
+    def getClassMethodSize(self, inClass, method):
+        if self.excludes(METHODS, methodKey(inClass, True, method)):
+            raise SqueakNetException("Error: No such method", -1)
+        return self.sn.getClassMethodSize(inClass, method)
@@ -0,0 +1,149 @@
+import threading
+import time
+
+""" Client side caches.
+
+Every Cache registers itself in the module registry so that it shows up in
+/.squeakfs/stats and is dropped by a write to /.squeakfs/flush.
+
+"""
+
+registry = []
+
+def flush():
+    """ Drops the contents of every registered cache. """
+
+    for c in registry:
+        c.clear()
+
+class Cache:
+    """ A thread safe dictionary with optional expiry and hit/miss counters.
+
+    A ttl of None means that entries never expire on their own. Expired
+    entries are kept until they are replaced, discarded or flushed, so that
+    they can be revalidated instead of fetched again.
+
+    With group, a function from a key to the key of its group, the keys of
+    each group are indexed, so that the expired entries of one group are
+    found without looking at the others.
+
+    """
+
+    def __init__(self, name, ttl=None, group=None):
+        self.name = name
+        self.ttl = ttl
+        self.group = group
+        self.groups = {}    # group key -> set of keys, with group
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        registry.append(self)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """ Returns the value stored for key or raises KeyError. """
+
+        self.lock.acquire()
+        try:
+            try:
+                value, stamp = self.entries[key]
+            except KeyError:
+                self.misses += 1
+                raise
+            if self.ttl is not None and time.time() - stamp > self.ttl:
+                self.misses += 1
+                raise KeyError(key)
+            self.hits += 1
+            return value
+        finally:
+            self.lock.release()
+
+    def lookup(self, key):
+        """ Returns the value stored for key and its age in seconds, expired or not.
+
+        Raises KeyError if there is none. Callers decide what is too old, so
+        every lookup that finds a value counts as a hit.
+
+        """
+
+        self.lock.acquire()
+        try:
+            try:
+                value, stamp = self.entries[key]
+            except KeyError:
+                self.misses += 1
+                raise
+            self.hits += 1
+            return value, time.time() - stamp
+        finally:
+            self.lock.release()
+
+    def stale(self, key):
+        """ Returns the value stored for key even if it expired, or raises KeyError. """
+
+        self.lock.acquire()
+        try:
+            return self.entries[key][0]
+        finally:
+            self.lock.release()
+
+    def expired(self):
+        """ Returns the keys of the entries that expired. """
+
+        if self.ttl is None:
+            return []
+        now = time.time()
+        self.lock.acquire()
+        try:
+            return [k for k, (value, stamp) in self.entries.items() if now - stamp > self.ttl]
+        finally:
+            self.lock.release()
+
+    def expiredIn(self, group):
+        """ Returns the keys of the entries of a group that expired, with their values. """
+
+        if self.ttl is None:
+            return []
+        now = time.time()
+        self.lock.acquire()
+        try:
+            result = []
+            for k in self.groups.get(group, ()):
+                value, stamp = self.entries[k]
+                if now - stamp > self.ttl:
+                    result.append((k, value))
+            return result
+        finally:
+            self.lock.release()
+
+    def put(self, key, value):
+        self.lock.acquire()
+        try:
+            self.entries[key] = (value, time.time())
+            if self.group is not None:
+                self.groups.setdefault(self.group(key), set()).add(key)
+        finally:
+            self.lock.release()
+
+    def discard(self, key):
+        self.lock.acquire()
+        try:
+            if self.entries.pop(key, None) is not None and self.group is not None:
+                g = self.group(key)
+                keys = self.groups[g]
+                keys.discard(key)
+                if not keys:
+                    del self.groups[g]
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            self.entries.clear()
+            self.groups.clear()
+        finally:
+            self.lock.release()
@@ -1,10 +1,10 @@
 import re
 import resource
+import timestamps
 import errno
-import traceback
 import logging
 from defstat import *
-from squeakNet import SqueakNetException
+from squeakNet import SqueakNetException, errorCode
 
 class CategoryClassCommentResource(resource.ClassCommentResource):
     def __init__(self, sn, category, cls):
@@ -85,11 +85,11 @@ class CategoryClassProtocolResource(resource.Resource):
         if not self.sn.isClassInCategory(self.category, self.cls):
             return -errno.ENOENT
         try:
-            nlink = len(self.sn.getMethodsInClassProtocol(self.cls, self.protocol)) + 2
-        except SqueakNetException:
-            logging.debug(traceback.format_exc())
-            return -errno.ENOENT
-        return DirStat(nlink)
+            methods = self.sn.getMethodsInClassProtocol(self.cls, self.protocol)
+        except SqueakNetException, e:
+            logging.debug("SqueakNet request failed", exc_info=True)
+            return errorCode(e)
+        return DirStat(len(methods) + 2, timestamps.latest(self.sn, self.cls, True, methods))
 
     def readdir(self, offset):
         return self.sn.getMethodsInClassProtocol(self.cls, self.protocol)
@@ -107,11 +107,11 @@ class CategoryInstanceProtocolResource(resource.Resource):
         if not self.sn.isClassInCategory(self.category, self.cls):
             return -errno.ENOENT
         try:
-            nlink = len(self.sn.getMethodsInInstanceProtocol(self.cls, self.protocol)) + 2
-        except SqueakNetException:
-            logging.debug(traceback.format_exc())
-            return -errno.ENOENT
-        return DirStat(nlink)
+            methods = self.sn.getMethodsInInstanceProtocol(self.cls, self.protocol)
+        except SqueakNetException, e:
+            logging.debug("SqueakNet request failed", exc_info=True)
+            return errorCode(e)
+        return DirStat(len(methods) + 2, timestamps.latest(self.sn, self.cls, False, methods))
 
     def readdir(self, offset):
         return self.sn.getMethodsInInstanceProtocol(self.cls, self.protocol)
@@ -147,10 +147,10 @@ class CategoryInstanceProtocolListResource(resource.Resource):
             return -errno.ENOENT
         try:
             nlink = len(self.sn.getInstanceProtocols(self.cls)) + 3
-        except SqueakNetException:
-            logging.debug(traceback.format_exc())
-            return -errno.ENOENT
-        return DirStat(nlink)
+        except SqueakNetException, e:
+            logging.debug("SqueakNet request failed", exc_info=True)
+            return errorCode(e)
+        return DirStat(nlink, timestamps.latest(self.sn, self.cls, False))
 
     def readdir(self, offset):
         return self.sn.getInstanceProtocols(self.cls) + ['--all--']
@@ -166,14 +166,38 @@ class CategoryClassProtocolListResource(resource.Resource):
             return -errno.ENOENT
         try:
             nlink = len(self.sn.getClassProtocols(self.cls)) + 3
-        except SqueakNetException:
-            logging.debug(traceback.format_exc())
-            return -errno.ENOENT
-        return DirStat(nlink)
+        except SqueakNetException, e:
+            logging.debug("SqueakNet request failed", exc_info=True)
+            return errorCode(e)
+        return DirStat(nlink, timestamps.latest(self.sn, self.cls, True))
 
     def readdir(self, offset):
         return self.sn.getClassProtocols(self.cls) + ['--all--']
 
+class CategoryClassFileOutResource(resource.FileOutResource):
+    def __init__(self, sn, category, cls):
+        resource.FileOutResource.__init__(self, sn, cls)
+        self.category = category
+
+    def exists(self):
+        return self.sn.isClassInCategory(self.category, self.cls)
+
+class CategoryFileOutResource(resource.FileOutResource):
+    """ Represents the fileout of every class in a category. """
+
+    def __init__(self, sn, category):
+        resource.FileOutResource.__init__(self, sn, None)
+        self.category = category
+
+    def exists(self):
+        return self.sn.isCategoryAvailable(self.category)
+
+    def mtime(self):
+        return 0
+
+    def fetch(self):
+        return self.sn.fileOutCategory(self.category)
+
 class CategoryClassDirectoryResource(resource.ClassDirectoryResource):
 
     def __init__(self, sn, category, cls):
@@ -197,7 +221,7 @@ class CategoryResource(resource.Resource):
         return DirStat(nlink)
 
     def readdir(self, offset):
-        return self.sn.getClassesInCategory(self.category)
+        return self.sn.getClassesInCategory(self.category) + ['source.st']
 
 class CategoryListResource(resource.Resource):
     def getattr(self):
@@ -210,11 +234,12 @@ class CategoryListResource(resource.Resource):
 class CategoryPathParser(resource.Parser):
     """ Converts a path into a resource. """
 
-    category = '[\w\s-]+'
+    category = '[\w\s%s]+' % resource.Parser.special_chars
     protocol = '[\w\s%s]+' % resource.Parser.special_chars
 
     path_exp = re.compile('^/((?P<category>(%s))(/(?P<class>(%s))(/((?P<file>(%s))|((?P<dir>(%s))(/(?P<protocol>(%s))(/(?P<method>(%s)))?)?)))?)?)?$' \
             % (category, resource.Parser.cls, resource.Parser.file, resource.Parser.dir, protocol, resource.Parser.method))
+    fileout_exp = re.compile('^/(?P<category>(%s))/source\.st$' % category)
 
     def __init__(self, sn):
         self.sn = sn
@@ -223,6 +248,9 @@ class CategoryPathParser(resource.Parser):
         return self.path_exp.match(path).groupdict()
 
     def parse(self, path):
+        fileout = self.fileout_exp.match(path)
+        if fileout is not None:
+            return CategoryFileOutResource(self.sn, fileout.group('category'))
         try:
             res = self.match(path)
         except AttributeError:
@@ -255,6 +283,8 @@ class CategoryPathParser(resource.Parser):
             return CategoryClassMembersResource(self.sn, res['category'], res['class'])
         if res['file'] == 'instancemembers':
             return CategoryInstanceMembersResource(self.sn, res['category'], res['class'])
+        if res['file'] == 'source.st':
+            return CategoryClassFileOutResource(self.sn, res['category'], res['class'])
 
     def method(self, res):
         if res['dir'] == 'instance':
@@ -0,0 +1,109 @@
+import re
+import errno
+import resource
+import cache
+from defstat import *
+
+""" The hidden /.squeakfs control tree.
+
+Files in here do not represent anything in the Squeak image. They expose the
+state of the running filesystem and let an administrator poke at it:
+
+    /.squeakfs/stats    counters and latency histograms (read only)
+    /.squeakfs/flush    any write drops all client side caches
+    /.squeakfs/reset    any write zeroes the counters in stats
+
+"""
+
+class ControlFileInfo:
+    """ Returned from open so that reads bypass the kernel page cache.
+
+    Control files are generated on every read and their size changes between
+    getattr and read, so the kernel must not trust st_size or cached pages.
+
+    """
+
+    direct_io = True
+    keep_cache = False
+
+class ControlDirectoryResource(resource.StaticDirectoryResource):
+    """ The /.squeakfs directory itself. """
+
+    contents = ['stats', 'flush', 'reset']
+
+class StatsResource(resource.FileResource):
+    """ A read only snapshot of the instrumentation counters. """
+
+    def __init__(self, stats):
+        resource.FileResource.__init__(self)
+        self.stats = stats
+
+    def render(self):
+        return self.stats.report(cache.registry)
+
+    def getattr(self):
+        return FileStat(len(self.render()))
+
+    def open(self, flags):
+        accmode = os.O_RDONLY | os.O_WRONLY | os.O_RDWR
+        if (flags & accmode) != os.O_RDONLY:
+            return -errno.EACCES
+        return ControlFileInfo()
+
+    def read(self, size, offset):
+        return self.extract(self.render(), size, offset)
+
+class TriggerResource(resource.FileResource):
+    """ A write only file that runs an action whenever it is written to. """
+
+    def __init__(self, action):
+        resource.FileResource.__init__(self)
+        self.action = action
+
+    def getattr(self):
+        st = FileStat(0)
+        st.st_mode = stat.S_IFREG | 0200
+        return st
+
+    def open(self, flags):
+        accmode = os.O_RDONLY | os.O_WRONLY | os.O_RDWR
+        if (flags & accmode) == os.O_RDONLY:
+            return -errno.EACCES
+        return ControlFileInfo()
+
+    def read(self, size, offset):
+        return -errno.EACCES
+
+    def write(self, buf, offset):
+        self.action()
+        return len(buf)
+
+    def truncate(self, size):
+        # Shells truncate before writing (echo 1 > flush), let that through.
+        return 0
+
+class ControlPathParser(resource.Parser):
+    """ Converts a path below /.squeakfs into a resource. """
+
+    path_exp = re.compile('^/((?P<file>\w+))?$')
+
+    def __init__(self, sn, stats):
+        self.sn = sn
+        self.stats = stats
+
+    def parse(self, path):
+        try:
+            res = self.path_exp.match(path).groupdict()
+        except AttributeError:
+            return resource.IllegalResource()
+
+        if res['file'] == 'stats':
+            return StatsResource(self.stats)
+        elif res['file'] == 'flush':
+            return TriggerResource(cache.flush)
+        elif res['file'] == 'reset':
+            return TriggerResource(self.stats.reset)
+        elif res['file']:
+            return resource.IllegalResource()
+        else:
+            return ControlDirectoryResource(self.sn)
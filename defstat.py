@@ -36,15 +36,27 @@ class DefaultStat(fuse.Stat):
 class FileStat(DefaultStat):
     """ A stat entry for a typical file. """
 
-    def __init__(self, size):
+    def __init__(self, size, mtime=0):
         DefaultStat.__init__(self)
         self.st_mode = stat.S_IFREG | 0644
         self.st_nlink = 2
         self.st_size = size
+        self.st_mtime = mtime
+        self.st_ctime = mtime
 
 class DirStat(DefaultStat):
     """ A stat entry for a typical directory. """
-    def __init__(self, nlink):
+    def __init__(self, nlink, mtime=0):
         DefaultStat.__init__(self)
         self.st_mode = stat.S_IFDIR | 0755
         self.st_nlink = nlink
+        self.st_mtime = mtime
+        self.st_ctime = mtime
+
+class LinkStat(DefaultStat):
+    """ A stat entry for a symbolic link. """
+    def __init__(self, size):
+        DefaultStat.__init__(self)
+        self.st_mode = stat.S_IFLNK | 0777
+        self.st_nlink = 1
+        self.st_size = size
@@ -0,0 +1,338 @@
+import os
+import sys
+import time
+import Queue
+import threading
+import optparse
+
+import squeakNet
+from squeakNet import SqueakNetException
+from stats import Stats
+
+""" Mirrors a Squeak image to disk without going through FUSE.
+
+cp -R of a mount fetches every class once per tree it appears in and pays a
+round trip per getattr, open and read. The exporter talks to the image
+directly instead: it lists the classes once, lets a pool of workers (each with
+its own connection) fetch every class with pipelined commands, writes the flat/
+layout and then builds category/ and hierarchy/ locally out of hardlinks or
+symlinks into flat/. The result has the same layout SqueakFS shows.
+
+"""
+
+class ClassInfo:
+    """ What the layouts other than flat/ need to know about an exported class. """
+
+    def __init__(self, name):
+        self.name = name
+        self.superclass = None
+        self.traits = []
+        self.instanceProtocols = {}     # protocol -> [selector]
+        self.classProtocols = {}
+
+class Exporter:
+    """ Exports an image reachable at port into the directory dest.
+
+    A class whose connection is lost is tried again on a fresh connection,
+    up to RETRIES times in all.
+
+    Arguments:
+        workers     number of worker threads, each with its own connection.
+        depth       number of commands in flight per connection.
+        layouts     which of flat, category and hierarchy to write.
+        link        'hard' or 'sym', how category/ and hierarchy/ refer to flat/.
+
+    """
+
+    RETRIES = 3
+
+    def __init__(self, port, dest, workers=8, depth=32,
+                 layouts=('flat', 'category', 'hierarchy'), link='hard', out=sys.stderr):
+        self.port = port
+        self.dest = dest
+        self.workers = workers
+        self.depth = max(depth, 1)
+        self.layouts = layouts
+        self.link = link
+        self.out = out
+        self.stats = Stats()
+        self.lock = threading.Lock()
+        self.classes = {}
+        self.failed = []
+        self.done = 0
+        self.methods = 0
+        self.bytes = 0
+        self.total = 0
+
+    def connect(self):
+        return squeakNet.SqueakNet(self.port, self.stats)
+
+    def run(self):
+        """ Performs the export and returns the number of failed commands. """
+
+        start = time.time()
+        sn = self.connect()
+        names = sn.getAllClasses() + sn.getAllTraits()
+        self.total = len(names)
+        categories = {}
+        if 'category' in self.layouts:
+            categories = self.fetchCategories(sn)
+
+        queue = Queue.Queue()
+        for name in names:
+            queue.put((name, 1))
+        threads = []
+        for i in range(self.workers):
+            t = threading.Thread(target=self.work, args=(queue,))
+            t.setDaemon(True)
+            t.start()
+            threads.append(t)
+        while [t for t in threads if t.isAlive()]:
+            for t in threads:
+                t.join(1)
+            self.progress(start)
+
+        if 'category' in self.layouts:
+            self.writeCategories(categories)
+        if 'hierarchy' in self.layouts:
+            self.writeHierarchy()
+        self.progress(start, True)
+        return len(self.failed)
+
+    def fetchCategories(self, sn):
+        categories = sn.getCategories()
+        result = {}
+        for i in range(0, len(categories), self.depth):
+            batch = categories[i:i + self.depth]
+            responses = sn.pipeline(['getClassesInCategory:\t%s' % c for c in batch])
+            for category, response in zip(batch, responses):
+                if isinstance(response, SqueakNetException):
+                    self.fail('getClassesInCategory', category)
+                else:
+                    result[category] = sn.convertArraySpecial(response)
+        return result
+
+    def work(self, queue):
+        sn = None
+        while True:
+            try:
+                name, tries = queue.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                if sn is None:
+                    sn = self.connect()
+                info = self.exportClass(sn, name)
+            except SqueakNetException:
+                # The connection is gone; put the class back and reconnect.
+                sn = None
+                if tries < self.RETRIES:
+                    queue.put((name, tries + 1))
+                else:
+                    self.fail('connection', name)
+                continue
+            self.lock.acquire()
+            try:
+                self.classes[name] = info
+                self.done += 1
+            finally:
+                self.lock.release()
+
+    def fetch(self, sn, commands):
+        results = []
+        for i in range(0, len(commands), self.depth):
+            results.extend(sn.pipeline(commands[i:i + self.depth]))
+        return results
+
+    def exportClass(self, sn, name):
+        info = ClassInfo(name)
+        commands = ['getSuperClass:\t%s' % name,
+                    'getClassComment:\t%s' % name,
+                    'getInstanceMembers:\t%s' % name,
+                    'getClassMembers:\t%s' % name,
+                    'getInstanceMethodsInClass:\t%s' % name,
+                    'getClassMethodsInClass:\t%s' % name,
+                    'getTraits:\t%s' % name]
+        if 'category' in self.layouts:
+            commands += ['getInstanceProtocols:\t%s' % name,
+                         'getClassProtocols:\t%s' % name]
+        r = self.fetch(sn, commands)
+        for command, response in zip(commands, r):
+            if isinstance(response, SqueakNetException):
+                self.fail(command.split('\t')[0], name)
+
+        base = os.path.join(self.dest, 'flat', name)
+        files = {}
+        if not isinstance(r[0], SqueakNetException):
+            info.superclass = r[0]
+            files['superclass'] = r[0] + '\n'
+        if not isinstance(r[1], SqueakNetException):
+            files['comment'] = sn.convertNL(r[1])
+        for i, fname in ((2, 'instancemembers'), (3, 'classmembers')):
+            if not isinstance(r[i], SqueakNetException):
+                files[fname] = '\n'.join(sn.convertArraySpecial(r[i])) + '\n'
+        instance = self.listing(sn, r[4])
+        classSide = self.listing(sn, r[5])
+        info.traits = self.listing(sn, r[6])
+
+        self.makedirs(os.path.join(base, 'instance'))
+        self.makedirs(os.path.join(base, 'class'))
+        self.makedirs(os.path.join(base, 'traits'))
+        size = 0
+        for fname, data in files.items():
+            size += self.write(os.path.join(base, fname), data)
+        for trait in info.traits:
+            # Left by an earlier try of this class.
+            if not os.path.islink(os.path.join(base, 'traits', trait)):
+                os.symlink(os.path.join('..', '..', trait), os.path.join(base, 'traits', trait))
+
+        for side, selectors, command in (('instance', instance, 'getInstanceMethod:InClass:'),
+                                         ('class', classSide, 'getClassMethod:InClass:')):
+            sources = self.fetch(sn, ['%s\t%s\t%s' % (command, sel, name) for sel in selectors])
+            for sel, source in zip(selectors, sources):
+                if isinstance(source, SqueakNetException):
+                    self.fail(command, '%s>>%s' % (name, sel))
+                    continue
+                size += self.write(os.path.join(base, side, sel), sn.convertNL(source))
+
+        if 'category' in self.layouts:
+            info.instanceProtocols = self.protocols(sn, name, r[7], 'getMethodsInInstanceProtocol:InClass:')
+            info.classProtocols = self.protocols(sn, name, r[8], 'getMethodsInClassProtocol:InClass:')
+
+        self.lock.acquire()
+        try:
+            self.methods += len(instance) + len(classSide)
+            self.bytes += size
+        finally:
+            self.lock.release()
+        return info
+
+    def listing(self, sn, response):
+        if isinstance(response, SqueakNetException):
+            return []
+        return sn.convertArraySpecial(response)
+
+    def protocols(self, sn, name, response, command):
+        protocols = self.listing(sn, response)
+        methods = self.fetch(sn, ['%s\t%s\t%s' % (command, p, name) for p in protocols])
+        result = {}
+        for protocol, response in zip(protocols, methods):
+            if isinstance(response, SqueakNetException):
+                self.fail(command, '%s %s' % (name, protocol))
+            else:
+                result[protocol] = sn.convertArraySpecial(response)
+        return result
+
+    def writeCategories(self, categories):
+        for category, names in categories.items():
+            for name in names:
+                info = self.classes.get(name)
+                if info is None:
+                    continue
+                base = os.path.join(self.dest, 'category', category, name)
+                self.linkClassFiles(name, base)
+                for side, protocols in (('instance', info.instanceProtocols),
+                                        ('class', info.classProtocols)):
+                    flat = os.path.join(self.dest, 'flat', name, side)
+                    for protocol, selectors in protocols.items() + [('--all--', os.listdir(flat))]:
+                        pdir = os.path.join(base, side, protocol)
+                        self.makedirs(pdir)
+                        for sel in selectors:
+                            if os.path.exists(os.path.join(flat, sel)):
+                                self.linkFile(os.path.join(flat, sel), os.path.join(pdir, sel))
+
+    def writeHierarchy(self):
+        children = {}
+        for info in self.classes.values():
+            children.setdefault(info.superclass, []).append(info.name)
+        todo = [(os.path.join(self.dest, 'hierarchy', 'ProtoObject'), 'ProtoObject')]
+        while todo:
+            base, name = todo.pop()
+            if name not in self.classes:
+                continue
+            self.linkClassFiles(name, base)
+            for side in ('instance', 'class'):
+                flat = os.path.join(self.dest, 'flat', name, side)
+                self.makedirs(os.path.join(base, side))
+                for sel in os.listdir(flat):
+                    self.linkFile(os.path.join(flat, sel), os.path.join(base, side, sel))
+            self.makedirs(os.path.join(base, 'subclasses'))
+            for sub in children.get(name, []):
+                todo.append((os.path.join(base, 'subclasses', sub), sub))
+
+    def linkClassFiles(self, name, base):
+        """ Links the plain files and traits of a flat/ class into base. """
+
+        flat = os.path.join(self.dest, 'flat', name)
+        self.makedirs(os.path.join(base, 'traits'))
+        for fname in ('superclass', 'comment', 'instancemembers', 'classmembers'):
+            if os.path.exists(os.path.join(flat, fname)):
+                self.linkFile(os.path.join(flat, fname), os.path.join(base, fname))
+        for trait in self.classes[name].traits:
+            target = os.path.join(self.dest, 'flat', trait)
+            link = os.path.join(base, 'traits', trait)
+            os.symlink(os.path.relpath(target, os.path.dirname(link)), link)
+
+    def linkFile(self, src, dst):
+        if self.link == 'hard':
+            os.link(src, dst)
+        else:
+            os.symlink(os.path.relpath(src, os.path.dirname(dst)), dst)
+
+    def makedirs(self, path):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def write(self, path, data):
+        f = open(path, 'wb')
+        f.write(data)
+        f.close()
+        return len(data)
+
+    def fail(self, command, what):
+        self.lock.acquire()
+        try:
+            self.failed.append((command, what))
+        finally:
+            self.lock.release()
+
+    def progress(self, start, final=False):
+        if self.out is None:
+            return
+        elapsed = max(time.time() - start, 1e-9)
+        self.out.write('%s%d/%d classes, %d methods, %.1f KB, %.1f methods/s, %.1f KB/s%s' \
+                % (final and '\n' or '\r', self.done, self.total, self.methods, self.bytes / 1024.0,
+                   self.methods / elapsed, self.bytes / 1024.0 / elapsed, final and '\n' or ''))
+        self.out.flush()
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options] DEST')
+    parser.add_option('--port', type='int', default=40000,
+                      help='The port the squeak server is running on.[default: %default]')
+    parser.add_option('--workers', type='int', default=8,
+                      help='Number of parallel connections.[default: %default]')
+    parser.add_option('--depth', type='int', default=32,
+                      help='Commands in flight per connection, 1 disables pipelining.[default: %default]')
+    parser.add_option('--layouts', default='flat,category,hierarchy',
+                      help='Layouts to write.[default: %default]')
+    parser.add_option('--symlinks', action='store_true', default=False,
+                      help='Use symlinks instead of hardlinks into flat/.')
+    opts, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error('Need a destination directory')
+    if os.path.exists(args[0]) and os.listdir(args[0]):
+        parser.error('%s is not empty' % args[0])
+
+    layouts = opts.layouts.split(',')
+    if 'flat' not in layouts:
+        # The other layouts link into flat/, so it is always written.
+        layouts.append('flat')
+    exporter = Exporter(opts.port, args[0], opts.workers, opts.depth, layouts,
+                        opts.symlinks and 'sym' or 'hard')
+    failed = exporter.run()
+    for command, what in exporter.failed:
+        print >> sys.stderr, 'failed: %s %s' % (command, what)
+    sys.exit(failed and 1 or 0)
+
+if __name__ == '__main__':
+    main()
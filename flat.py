@@ -52,6 +52,8 @@ class FlatPathParser(resource.Parser):
                 return resource.SuperClassResource(self.sn, res['class'])
             elif res['file'] == 'comment':
                 return resource.ClassCommentResource(self.sn, res['class'])
+            elif res['file'] == 'source.st':
+                return resource.FileOutResource(self.sn, res['class'])
         elif res['class']:
             return resource.ClassDirectoryResource(self.sn, res['class'])
         else:
@@ -0,0 +1,113 @@
+import sys
+import struct
+from array import array
+
+""" The binary framing of SqueakNet commands and responses.
+
+The line protocol joins arguments with tabs and lists with CR, so names
+containing either cannot be sent or listed, and every list is rstripped and
+split on the client. After a SqueakNet connects it asks for binary framing
+with the text command 'setFraming:\tbinary'; a server that knows it answers
+'binary' and both sides switch for the rest of the connection. Servers that
+do not answer with an error and the connection stays in text.
+
+A binary request is its fields, the command name first:
+
+    !I      length of the rest
+    fields  see below
+
+and a binary response is typed:
+
+    !cI     type and length of the payload
+    STRING  the bytes
+    LIST    fields
+    BOOL    one byte, 0 or 1
+    INT     !q
+    ERROR   !I code (FAILED or UNKNOWN) followed by the message
+
+where fields are a count, the offsets at which the fields start and the
+one at which the last ends as a block of count + 1 !I, and then the fields
+back to back. A list is decoded by reading the offsets block into an array
+and slicing the fields out with map, both loops running in C.
+
+"""
+
+STRING = 's'
+LIST = 'l'
+BOOL = 'b'
+INT = 'i'
+ERROR = 'e'
+
+# Error codes.
+FAILED = 0
+UNKNOWN = 1
+
+header = struct.Struct('!cI')
+length = struct.Struct('!I')
+integer = struct.Struct('!q')
+
+def encodeFields(fields):
+    offsets = array('I', [0])
+    end = 0
+    for f in fields:
+        end += len(f)
+        offsets.append(end)
+    if sys.byteorder == 'little':
+        offsets.byteswap()
+    return length.pack(len(fields)) + offsets.tostring() + ''.join(fields)
+
+def decodeFields(data):
+    count, = length.unpack_from(data, 0)
+    start = length.size + 4 * (count + 1)
+    # Signed, so that the offsets come out as ints rather than longs.
+    offsets = array('i', data[length.size:start])
+    if sys.byteorder == 'little':
+        offsets.byteswap()
+    return map(data[start:].__getslice__, offsets[:-1], offsets[1:])
+
+def encodeRequest(fields):
+    payload = encodeFields(fields)
+    return length.pack(len(payload)) + payload
+
+def encodeResponse(value):
+    """ Frames a result: a string, a list of strings, a bool or an int. """
+
+    if value is True or value is False:
+        return header.pack(BOOL, 1) + chr(value)
+    if isinstance(value, (int, long)):
+        return header.pack(INT, integer.size) + integer.pack(value)
+    if isinstance(value, list):
+        payload = encodeFields(value)
+        return header.pack(LIST, len(payload)) + payload
+    value = str(value)
+    return header.pack(STRING, len(value)) + value
+
+def encodeError(message, code=FAILED):
+    payload = length.pack(code) + message
+    return header.pack(ERROR, len(payload)) + payload
+
+def decodeResponse(kind, payload):
+    """ Returns the value of a response, or (code, message) for an ERROR. """
+
+    if kind == STRING:
+        return payload
+    if kind == LIST:
+        return decodeFields(payload)
+    if kind == BOOL:
+        return payload == '\x01'
+    if kind == INT:
+        return integer.unpack(payload)[0]
+    if kind == ERROR:
+        return length.unpack_from(payload, 0)[0], payload[length.size:]
+    raise ValueError("Unknown response type %r" % kind)
+
+def text(value):
+    """ Returns what the line protocol answers for a decoded value. """
+
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'Error: false'
+    if isinstance(value, list):
+        return '\r'.join(value)
+    return str(value)
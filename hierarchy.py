@@ -4,23 +4,28 @@ import fuse
 import logging
 import errno
 import resource
-import traceback
+import timestamps
 from defstat import *
-from squeakNet import SqueakNetException
+from squeakNet import SqueakNetException, errorCode
 
 class HierarchyClassDirectoryResource(resource.StaticDirectoryResource):
     """ Represents the base directory of a class as used by SqueakFS. """
 
-    contents = ['superclass', 'instancemembers', 'classmembers', 'comment', 'instance', 'class', 'subclasses', 'traits']
+    contents = ['superclass', 'instancemembers', 'classmembers', 'comment', 'source.st', 'instance', 'class', 'subclasses', 'traits']
 
     def __init__(self, sn, cls):
         resource.StaticDirectoryResource.__init__(self, sn)
         self.cls = cls
 
     def getattr(self):
-        if not self.sn.isClassAvailable(self.cls):
-            return -errno.NOENT
-        return resource.StaticDirectoryResource.getattr(self)
+        try:
+            mtime = timestamps.classTime(self.sn, self.cls)
+        except SqueakNetException, e:
+            logging.debug("SqueakNet request failed", exc_info=True)
+            return errorCode(e)
+        st = resource.StaticDirectoryResource.getattr(self)
+        st.st_mtime = st.st_ctime = mtime
+        return st
 
 class ClassRootResource(resource.StaticDirectoryResource):
     """ Represents the top most root of the inheritence tree. """
@@ -74,7 +79,7 @@ class HierarchyPathParser(resource.Parser):
             try:
                 superclass = self.sn.getSuperClass(cls)
             except SqueakNetException:
-                logging.debug(traceback.format_exc())
+                logging.debug("SqueakNet request failed", exc_info=True)
                 return False
 
             if cls != 'ProtoObject' and superclass != hierarchy[-1]:
@@ -117,6 +122,8 @@ class HierarchyPathParser(resource.Parser):
                 return resource.SuperClassResource(self.sn, res['class'])
             elif res['file'] == 'comment':
                 return resource.ClassCommentResource(self.sn, res['class'])
+            elif res['file'] == 'source.st':
+                return resource.FileOutResource(self.sn, res['class'])
         elif res['class']:
             return HierarchyClassDirectoryResource(self.sn, res['class'])
         else:
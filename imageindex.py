@@ -0,0 +1,733 @@
+import sys
+import mmap
+import threading
+import struct
+import optparse
+
+import namecodec
+import timestamps
+from squeakNet import SqueakNet, SqueakNetException, contentHash, lines
+from stats import Stats
+
+""" Offline mounts from a single image-index file.
+
+An image-index file holds everything SqueakFS asks the server for, laid out
+so that it can be memory mapped and searched in place:
+
+    header      magic, version, section counts and offsets
+    strings     (offset, length) of every distinct name, protocol and stamp
+    classes     fixed size class records, sorted by name
+    methods     fixed size method records, each class' sorted by selector
+    categories  category name and the list of its classes
+    lists       arrays of string indexes (variables, traits, subclasses, sends)
+    blob        the bytes of all strings, sources and comments
+
+ImageIndex serves the SqueakNet interface from such a file, so all trees
+mount from it instantly and without a running image. Names are binary
+searched in the mapping; nothing is loaded up front and the only copy made is
+the string handed back to the caller. Build files with
+
+    squeakfs-index --port 40000 image.sqfs
+
+and mount them with -o imagefile=image.sqfs.
+
+"""
+
+MAGIC = 'SQFSIDX1'
+VERSION = 1
+NONE = 0xffffffff
+
+HEADER = struct.Struct('<8s11I')
+STRING = struct.Struct('<II')
+CLASS = struct.Struct('<18I')
+METHOD = struct.Struct('<7I')
+CATEGORY = struct.Struct('<3I')
+INDEX = struct.Struct('<I')
+
+FLAG_TRAIT = 1
+
+class ClassRecord:
+    """ A class as collected for writing. """
+
+    def __init__(self, name):
+        self.name = name
+        self.superclass = None
+        self.category = ''
+        self.isTrait = False
+        self.comment = ''
+        self.instanceVariables = []
+        self.classVariables = []
+        self.traits = []
+        # classSide -> {selector: (protocol, stamp, source, sends)}
+        self.methods = {False: {}, True: {}}
+
+def write(path, classes, categories):
+    """ Writes an image-index file.
+
+    Arguments:
+        classes     a list of ClassRecord, with raw (unconverted) names.
+        categories  a list of (category, [class name]) in image order.
+
+    """
+
+    strings = {}
+    spans = []
+    blob = []
+    size = [0]
+
+    def append(data):
+        offset = size[0]
+        blob.append(data)
+        size[0] += len(data)
+        return offset
+
+    def intern(s):
+        if s not in strings:
+            strings[s] = len(spans)
+            spans.append((append(s), len(s)))
+        return strings[s]
+
+    lists = []
+    def makeList(items):
+        offset = len(lists)
+        lists.extend([intern(s) for s in items])
+        return offset, len(items)
+
+    classes = sorted(classes, key=lambda c: c.name)
+    subclasses = {}
+    for c in classes:
+        if c.superclass is not None:
+            subclasses.setdefault(c.superclass, []).append(c.name)
+
+    classRecords = []
+    methodRecords = []
+    for c in classes:
+        fields = [intern(c.name),
+                  c.superclass is None and NONE or intern(c.superclass),
+                  intern(c.category),
+                  c.isTrait and FLAG_TRAIT or 0]
+        fields.append(append(c.comment))
+        fields.append(len(c.comment))
+        for items in (c.instanceVariables, c.classVariables, c.traits, subclasses.get(c.name, [])):
+            fields.extend(makeList(items))
+        for classSide in (False, True):
+            methods = c.methods[classSide]
+            fields.extend([len(methodRecords), len(methods)])
+            for sel in sorted(methods):
+                protocol, stamp, source, sends = methods[sel]
+                record = [intern(sel), intern(protocol), intern(stamp), append(source), len(source)]
+                record.extend(makeList(sends))
+                methodRecords.append(record)
+        classRecords.append(fields)
+
+    categoryRecords = []
+    for category, names in categories:
+        categoryRecords.append([intern(category)] + list(makeList(names)))
+
+    stringsOffset = HEADER.size
+    classesOffset = stringsOffset + STRING.size * len(spans)
+    methodsOffset = classesOffset + CLASS.size * len(classRecords)
+    categoriesOffset = methodsOffset + METHOD.size * len(methodRecords)
+    listsOffset = categoriesOffset + CATEGORY.size * len(categoryRecords)
+    blobOffset = listsOffset + INDEX.size * len(lists)
+
+    f = open(path, 'wb')
+    try:
+        f.write(HEADER.pack(MAGIC, VERSION, len(spans), len(classRecords), len(methodRecords),
+                            len(categoryRecords), stringsOffset, classesOffset, methodsOffset,
+                            categoriesOffset, listsOffset, blobOffset))
+        for offset, length in spans:
+            f.write(STRING.pack(blobOffset + offset, length))
+        for fields in classRecords:
+            fields[4] += blobOffset
+            f.write(CLASS.pack(*fields))
+        for fields in methodRecords:
+            fields[3] += blobOffset
+            f.write(METHOD.pack(*fields))
+        for fields in categoryRecords:
+            f.write(CATEGORY.pack(*fields))
+        f.write(struct.pack('<%dI' % len(lists), *lists))
+        for data in blob:
+            f.write(data)
+    finally:
+        f.close()
+
+class Builder:
+    """ Collects an image over a SqueakNet connection for write(). """
+
+    def __init__(self, sn, depth=32):
+        self.sn = sn
+        self.depth = max(depth, 1)
+
+    def fetch(self, commands):
+        results = []
+        for i in range(0, len(commands), self.depth):
+            results.extend(self.sn.pipeline(commands[i:i + self.depth]))
+        return results
+
+    def lines(self, response):
+        if isinstance(response, SqueakNetException):
+            return []
+        return lines(response)
+
+    def fields(self, response):
+        """ Splits a stamps or sends response into {selector: [field]}. """
+
+        return dict([(l.split('\t')[0], l.split('\t')[1:]) for l in self.lines(response)])
+
+    def build(self):
+        """ Returns the (classes, categories) of the image for write(). """
+
+        classNames, traitNames, categoryNames = map(self.lines,
+                self.fetch(['getAllClasses', 'getAllTraits', 'getCategories']))
+        names = classNames + traitNames
+        categories = zip(categoryNames, [self.lines(r) for r in
+                         self.fetch(['getClassesInCategory:\t%s' % c for c in categoryNames])])
+        categoryOf = {}
+        for category, members in categories:
+            for name in members:
+                categoryOf[name] = category
+        classes = []
+        for name in names:
+            c = self.buildClass(name)
+            c.category = categoryOf.get(name, '')
+            classes.append(c)
+        return classes, categories
+
+    def buildClass(self, name):
+        c = ClassRecord(name)
+        commands = [command % name for command in
+                    ('getSuperClass:\t%s', 'getClassComment:\t%s', 'getInstanceMembers:\t%s',
+                     'getClassMembers:\t%s', 'getTraits:\t%s', 'isTrait:\t%s',
+                     'getInstanceMethodsInClass:\t%s', 'getClassMethodsInClass:\t%s',
+                     'getInstanceProtocols:\t%s', 'getClassProtocols:\t%s',
+                     'getInstanceMethodStamps:\t%s', 'getClassMethodStamps:\t%s',
+                     'getInstanceMessagesSent:\t%s', 'getClassMessagesSent:\t%s')]
+        r = self.fetch(commands)
+        if not isinstance(r[0], SqueakNetException) and r[0] != 'nil':
+            c.superclass = r[0]
+        if not isinstance(r[1], SqueakNetException):
+            c.comment = r[1]
+        c.instanceVariables = self.lines(r[2])
+        c.classVariables = self.lines(r[3])
+        c.traits = self.lines(r[4])
+        c.isTrait = not isinstance(r[5], SqueakNetException) and r[5] is not False
+
+        for classSide, selectors, protocols, stamps, sends, side in \
+                ((False, r[6], r[8], r[10], r[12], 'Instance'), (True, r[7], r[9], r[11], r[13], 'Class')):
+            selectors = self.lines(selectors)
+            protocols = self.lines(protocols)
+            stamps = self.fields(stamps)
+            sends = self.fields(sends)
+            protocolOf = {}
+            members = self.fetch(['getMethodsIn%sProtocol:InClass:\t%s\t%s' % (side, p, name) for p in protocols])
+            for protocol, response in zip(protocols, members):
+                for sel in self.lines(response):
+                    protocolOf[sel] = protocol
+            sources = self.fetch(['get%sMethod:InClass:\t%s\t%s' % (side, sel, name) for sel in selectors])
+            for sel, source in zip(selectors, sources):
+                if isinstance(source, SqueakNetException):
+                    continue
+                c.methods[classSide][sel] = (protocolOf.get(sel, 'as yet unclassified'),
+                                             (stamps.get(sel) or [''])[0], source, sends.get(sel, []))
+        return c
+
+class ImageIndex(SqueakNet):
+    """ Serves the SqueakNet interface from a memory mapped image-index file. """
+
+    # Maps command names on the wire to (method, argument order) for pipeline.
+    commands = {
+        'getSuperClass:': ('getSuperClass', (0,)),
+        'getSubClasses:': ('getSubClasses', (0,)),
+        'getDirectSubClasses:': ('getDirectSubClasses', (0,)),
+        'getAllClasses': ('getAllClasses', ()),
+        'getInstanceMethod:InClass:': ('instanceSource', (1, 0)),
+        'getClassMethod:InClass:': ('classSource', (1, 0)),
+        'getCategories': ('getCategories', ()),
+        'getClassMembers:': ('getClassMembers', (0,)),
+        'getInstanceMembers:': ('getInstanceMembers', (0,)),
+        'getInstanceProtocols:': ('getInstanceProtocols', (0,)),
+        'getClassProtocols:': ('getClassProtocols', (0,)),
+        'getMethodsInInstanceProtocol:InClass:': ('getMethodsInInstanceProtocol', (1, 0)),
+        'getMethodsInClassProtocol:InClass:': ('getMethodsInClassProtocol', (1, 0)),
+        'getClassComment:': ('comment', (0,)),
+        'fileOutClass:': ('fileOut', (0,)),
+        'fileOutCategory:': ('fileOutAll', (0,)),
+        'getClassesInCategory:': ('getClassesInCategory', (0,)),
+        'getInstanceMethodsInClass:': ('getInstanceMethodsInClass', (0,)),
+        'getClassMethodsInClass:': ('getClassMethodsInClass', (0,)),
+        'getTraits:': ('getTraits', (0,)),
+        'getAllTraits': ('getAllTraits', ()),
+        'getTraitUsers:': ('getTraitUsers', (0,)),
+        'isTrait:': ('isTrait', (0,)),
+        'isClassAvailable:': ('isClassAvailable', (0,)),
+        'isInstanceMethodAvailable:inClass:': ('isInstanceMethodAvailable', (1, 0)),
+        'isClassMethodAvailable:inClass:': ('isClassMethodAvailable', (1, 0)),
+        'isInstanceProtocolAvailable:inClass:': ('isInstanceProtocolAvailable', (0, 1)),
+        'isClassProtocolAvailable:inClass:': ('isClassProtocolAvailable', (0, 1)),
+        'isCategoryAvailable:': ('isCategoryAvailable', (0,)),
+        'isClassMethod:InProtocol:inClass:': ('isClassMethodInProtocol', (0, 1, 2)),
+        'isInstanceMethod:InProtocol:inClass:': ('isInstanceMethodInProtocol', (0, 1, 2)),
+        'isClass:InCategory:': ('isClassInCategory', (1, 0)),
+        'getNumberOfClasses': ('getNumberOfClasses', ()),
+        'getInstanceMethodStamps:': ('getInstanceMethodStamps', (0,)),
+        'getClassMethodStamps:': ('getClassMethodStamps', (0,)),
+        'getInstanceMessagesSent:': ('getInstanceMessagesSent', (0,)),
+        'getClassMessagesSent:': ('getClassMessagesSent', (0,)),
+    }
+
+    def __init__(self, path, stats=None):
+        if stats is None:
+            stats = Stats()
+        self.path = path
+        self.port = None
+        self.stats = stats
+        self.recorder = None
+        self.sock = None
+        self.local = threading.local()
+
+        f = open(path, 'rb')
+        try:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
+        header = HEADER.unpack_from(self.map, 0)
+        if header[0] != MAGIC or header[1] != VERSION:
+            raise SqueakNetException("Error: %s is not an image-index file" % path, -2)
+        (self.nstrings, self.nclasses, self.nmethods, self.ncategories, self.stringsOffset,
+         self.classesOffset, self.methodsOffset, self.categoriesOffset, self.listsOffset,
+         self.blobOffset) = header[2:]
+
+    def close(self):
+        self.map.close()
+
+    # Reading the file
+
+    def string(self, index):
+        offset, length = STRING.unpack_from(self.map, self.stringsOffset + STRING.size * index)
+        return self.map[offset:offset + length]
+
+    def strings(self, offset, count):
+        if not count:
+            return []
+        indexes = struct.unpack_from('<%dI' % count, self.map, self.listsOffset + INDEX.size * offset)
+        return [self.string(i) for i in indexes]
+
+    def classRecord(self, i):
+        return CLASS.unpack_from(self.map, self.classesOffset + CLASS.size * i)
+
+    def methodRecord(self, i):
+        return METHOD.unpack_from(self.map, self.methodsOffset + METHOD.size * i)
+
+    def search(self, name, lo, hi, key):
+        """ Binary searches records lo..hi-1, sorted by the name key(i) returns. """
+
+        while lo < hi:
+            mid = (lo + hi) // 2
+            found = key(mid)
+            if found < name:
+                lo = mid + 1
+            elif found > name:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def unconvert(self, name):
+        return namecodec.decode(name)
+
+    def cls(self, name):
+        i = self.search(self.unconvert(name), 0, self.nclasses, lambda i: self.string(self.classRecord(i)[0]))
+        if i is None:
+            raise SqueakNetException("Error: No such class %s" % name, -1)
+        return self.classRecord(i)
+
+    def methodRange(self, record, classSide):
+        if classSide:
+            return record[16], record[16] + record[17]
+        return record[14], record[14] + record[15]
+
+    def methods(self, record, classSide):
+        lo, hi = self.methodRange(record, classSide)
+        return [self.methodRecord(i) for i in range(lo, hi)]
+
+    def method(self, inClass, method, classSide):
+        lo, hi = self.methodRange(self.cls(inClass), classSide)
+        i = self.search(self.unconvert(method), lo, hi, lambda i: self.string(self.methodRecord(i)[0]))
+        if i is None:
+            raise SqueakNetException("Error: No such method %s" % method, -1)
+        return self.methodRecord(i)
+
+    def source(self, m):
+        return self.map[m[3]:m[3] + m[4]]
+
+    def instanceSource(self, inClass, method):
+        return self.source(self.method(inClass, method, False))
+
+    def classSource(self, inClass, method):
+        return self.source(self.method(inClass, method, True))
+
+    def comment(self, inClass):
+        record = self.cls(inClass)
+        return self.map[record[4]:record[4] + record[5]]
+
+    def category(self, category):
+        category = self.unconvert(category)
+        for i in range(self.ncategories):
+            record = CATEGORY.unpack_from(self.map, self.categoriesOffset + CATEGORY.size * i)
+            if self.string(record[0]) == category:
+                return record
+        raise SqueakNetException("Error: No such category %s" % category, -1)
+
+    def names(self, items):
+        return namecodec.encodeAll(items)
+
+    def protocols(self, inClass, classSide):
+        return sorted(set([self.string(m[1]) for m in self.methods(self.cls(inClass), classSide)]))
+
+    def methodsInProtocol(self, inClass, protocol, classSide):
+        protocol = self.unconvert(protocol)
+        found = [self.string(m[0]) for m in self.methods(self.cls(inClass), classSide)
+                 if self.string(m[1]) == protocol]
+        if not found:
+            raise SqueakNetException("Error: No such protocol %s" % protocol, -1)
+        return self.names(found)
+
+    def chunk(self, text):
+        return text.replace('!', '!!') + '!'
+
+    def fileOut(self, inClass):
+        """ Returns a class in chunk format, as the server's fileOutClass: does. """
+
+        record = self.cls(inClass)
+        name = self.string(record[0])
+        category = self.string(record[2])
+        if record[3] & FLAG_TRAIT:
+            out = [self.chunk("Trait named: #%s\r\tuses: {}\r\tcategory: '%s'" % (name, category))]
+        else:
+            out = [self.chunk("%s subclass: #%s\r\tinstanceVariableNames: '%s'\r\tclassVariableNames: '%s'"
+                              "\r\tpoolDictionaries: ''\r\tcategory: '%s'"
+                              % (self.getSuperClass(inClass), name, ' '.join(self.strings(record[6], record[7])),
+                                 ' '.join(self.strings(record[8], record[9])), category))]
+        out.append("\r\r!%s commentStamp: '<historical>' prior: 0!\r%s\r"
+                   % (name, self.chunk(self.comment(inClass))))
+        for classSide in (False, True):
+            target = classSide and '%s class' % name or name
+            methods = self.methods(record, classSide)
+            for protocol in self.protocols(inClass, classSide):
+                for m in [m for m in methods if self.string(m[1]) == protocol]:
+                    out.append("\r!%s methodsFor: '%s' stamp: '%s'!\r%s !\r"
+                               % (target, protocol, self.string(m[2]), self.chunk(self.source(m))))
+        return ''.join(out)
+
+    def fileOutAll(self, category):
+        return '\r\r'.join([self.fileOut(name) for name in self.getClassesInCategory(category)])
+
+    def subclasses(self, inClass):
+        record = self.cls(inClass)
+        return self.names(self.strings(record[12], record[13]))
+
+    def allNames(self, traits):
+        names = []
+        for i in range(self.nclasses):
+            record = self.classRecord(i)
+            if bool(record[3] & FLAG_TRAIT) == traits:
+                names.append(self.string(record[0]))
+        return self.names(names)
+
+    def stamps(self, inClass, classSide):
+        return dict([(self.convertSpecial(self.string(m[0])), self.string(m[2]))
+                     for m in self.methods(self.cls(inClass), classSide)])
+
+    def sends(self, inClass, classSide):
+        return dict([(self.convertSpecial(self.string(m[0])), self.names(self.strings(m[5], m[6])))
+                     for m in self.methods(self.cls(inClass), classSide)])
+
+    # The SqueakNet interface
+
+    def pipeline(self, commands):
+        results = []
+        for command in commands:
+            args = command.split('\t')
+            try:
+                name, order = self.commands[args[0]]
+            except KeyError:
+                results.append(SqueakNetException('Error: Unknown command', -1))
+                continue
+            try:
+                result = getattr(self, name)(*[args[1 + i] for i in order])
+            except SqueakNetException, e:
+                results.append(e)
+                continue
+            except IndexError:
+                results.append(SqueakNetException('Error: Wrong number of arguments', -1))
+                continue
+            # Typed like the responses of a binary framed connection.
+            if isinstance(result, dict):
+                result = ['\t'.join([k] + (isinstance(v, list) and v or [v]))
+                          for k, v in sorted(result.items())]
+            elif not isinstance(result, (bool, int, long, list)):
+                result = str(result)
+            results.append(result)
+        return results
+
+    def getSuperClass(self, inClass):
+        record = self.cls(inClass)
+        if record[1] == NONE:
+            return 'nil'
+        return self.string(record[1])
+
+    def getSubClasses(self, inClass):
+        result = []
+        todo = self.subclasses(inClass)
+        while todo:
+            name = todo.pop(0)
+            result.append(name)
+            todo.extend(self.subclasses(name))
+        return result
+
+    def getDirectSubClasses(self, inClass):
+        return self.subclasses(inClass)
+
+    def getAllClasses(self):
+        return self.allNames(False)
+
+    def getInstanceMethod(self, inClass, method):
+        return self.convertNL(self.instanceSource(inClass, method))
+
+    def getClassMethod(self, inClass, method):
+        return self.convertNL(self.classSource(inClass, method))
+
+    def getCategories(self):
+        names = []
+        for i in range(self.ncategories):
+            record = CATEGORY.unpack_from(self.map, self.categoriesOffset + CATEGORY.size * i)
+            names.append(self.string(record[0]))
+        return self.names(names)
+
+    def getClassMembers(self, inClass):
+        record = self.cls(inClass)
+        return self.names(self.strings(record[8], record[9]))
+
+    def getInstanceMembers(self, inClass):
+        record = self.cls(inClass)
+        return self.names(self.strings(record[6], record[7]))
+
+    def getInstanceProtocols(self, inClass):
+        return self.names(self.protocols(inClass, False))
+
+    def getClassProtocols(self, inClass):
+        return self.names(self.protocols(inClass, True))
+
+    def getMethodsInInstanceProtocol(self, inClass, inProtocol):
+        return self.methodsInProtocol(inClass, inProtocol, False)
+
+    def getMethodsInClassProtocol(self, inClass, inProtocol):
+        return self.methodsInProtocol(inClass, inProtocol, True)
+
+    def getClassComment(self, inClass):
+        return self.convertNL(self.comment(inClass))
+
+    def getInstanceMethodSize(self, inClass, method):
+        return len(self.instanceSource(inClass, method)) + 1
+
+    def getClassMethodSize(self, inClass, method):
+        return len(self.classSource(inClass, method)) + 1
+
+    def getClassCommentSize(self, inClass):
+        return len(self.comment(inClass)) + 1
+
+    def getInstanceMethodStat(self, inClass, method):
+        m = self.method(inClass, method, False)
+        return m[4] + 1, self.string(m[2])
+
+    def getClassMethodStat(self, inClass, method):
+        m = self.method(inClass, method, True)
+        return m[4] + 1, self.string(m[2])
+
+    def getLatestMethodStamp(self, inClass):
+        record = self.cls(inClass)
+        stamps = [self.string(m[2]) for classSide in (False, True) for m in self.methods(record, classSide)]
+        return max([''] + stamps, key=timestamps.parseStamp)
+
+    def getInstanceMethodRange(self, inClass, method, offset, size):
+        return self.getInstanceMethod(inClass, method)[offset:offset + size]
+
+    def getClassMethodRange(self, inClass, method, offset, size):
+        return self.getClassMethod(inClass, method)[offset:offset + size]
+
+    def getClassCommentRange(self, inClass, offset, size):
+        return self.getClassComment(inClass)[offset:offset + size]
+
+    def getInstanceMethodHash(self, inClass, method):
+        return contentHash(self.getInstanceMethod(inClass, method))
+
+    def getClassMethodHash(self, inClass, method):
+        return contentHash(self.getClassMethod(inClass, method))
+
+    def getClassCommentHash(self, inClass):
+        return contentHash(self.getClassComment(inClass))
+
+    def unlessHash(self, text, hash):
+        if contentHash(text) == hash:
+            return None
+        return text
+
+    def getInstanceMethodIfChanged(self, inClass, method, hash):
+        return self.unlessHash(self.getInstanceMethod(inClass, method), hash)
+
+    def getClassMethodIfChanged(self, inClass, method, hash):
+        return self.unlessHash(self.getClassMethod(inClass, method), hash)
+
+    def getClassCommentIfChanged(self, inClass, hash):
+        return self.unlessHash(self.getClassComment(inClass), hash)
+
+    def changed(self, inClass, hashes, classSide):
+        result = []
+        for sel, hash in hashes.items():
+            try:
+                source = self.convertNL(self.source(self.method(inClass, sel, classSide)))
+            except SqueakNetException:
+                source = None
+            if source is None or contentHash(source) != hash:
+                result.append(sel)
+        return result
+
+    def getInstanceMethodsIfChanged(self, inClass, hashes):
+        return self.changed(inClass, hashes, False)
+
+    def getClassMethodsIfChanged(self, inClass, hashes):
+        return self.changed(inClass, hashes, True)
+
+    def fileOutClass(self, inClass):
+        return self.convertNL(self.fileOut(inClass))
+
+    def fileOutCategory(self, category):
+        return self.convertNL(self.fileOutAll(category))
+
+    def getClassesInCategory(self, category):
+        record = self.category(category)
+        return self.names(self.strings(record[1], record[2]))
+
+    def getInstanceMethodsInClass(self, inClass):
+        return namecodec.encodeAll([self.string(m[0]) for m in self.methods(self.cls(inClass), False)])
+
+    def getClassMethodsInClass(self, inClass):
+        return namecodec.encodeAll([self.string(m[0]) for m in self.methods(self.cls(inClass), True)])
+
+    def getTraits(self, inClass):
+        record = self.cls(inClass)
+        return self.names(self.strings(record[10], record[11]))
+
+    def getAllTraits(self):
+        return self.allNames(True)
+
+    def getTraitUsers(self, inTrait):
+        self.cls(inTrait)
+        users = []
+        for i in range(self.nclasses):
+            record = self.classRecord(i)
+            if self.unconvert(inTrait) in self.strings(record[10], record[11]):
+                users.append(self.string(record[0]))
+        return self.names(users)
+
+    def isTrait(self, inClass):
+        try:
+            return bool(self.cls(inClass)[3] & FLAG_TRAIT)
+        except SqueakNetException:
+            return False
+
+    def isClassAvailable(self, inClass):
+        try:
+            self.cls(inClass)
+        except SqueakNetException:
+            return False
+        return True
+
+    def isInstanceMethodAvailable(self, inClass, method):
+        try:
+            self.method(inClass, method, False)
+        except SqueakNetException:
+            return False
+        return True
+
+    def isClassMethodAvailable(self, inClass, method):
+        try:
+            self.method(inClass, method, True)
+        except SqueakNetException:
+            return False
+        return True
+
+    def isInstanceProtocolAvailable(self, protocol, inClass):
+        try:
+            return self.unconvert(protocol) in self.protocols(inClass, False)
+        except SqueakNetException:
+            return False
+
+    def isClassProtocolAvailable(self, protocol, inClass):
+        try:
+            return self.unconvert(protocol) in self.protocols(inClass, True)
+        except SqueakNetException:
+            return False
+
+    def isClassMethodInProtocol(self, method, protocol, inClass):
+        try:
+            return self.string(self.method(inClass, method, True)[1]) == self.unconvert(protocol)
+        except SqueakNetException:
+            return False
+
+    def isInstanceMethodInProtocol(self, method, protocol, inClass):
+        try:
+            return self.string(self.method(inClass, method, False)[1]) == self.unconvert(protocol)
+        except SqueakNetException:
+            return False
+
+    def isClassInCategory(self, category, inClass):
+        try:
+            return self.string(self.cls(inClass)[2]) == self.unconvert(category)
+        except SqueakNetException:
+            return False
+
+    def isCategoryAvailable(self, category):
+        try:
+            self.category(category)
+        except SqueakNetException:
+            return False
+        return True
+
+    def getInstanceMethodStamps(self, inClass):
+        return self.stamps(inClass, False)
+
+    def getClassMethodStamps(self, inClass):
+        return self.stamps(inClass, True)
+
+    def getInstanceMessagesSent(self, inClass):
+        return self.sends(inClass, False)
+
+    def getClassMessagesSent(self, inClass):
+        return self.sends(inClass, True)
+
+    def getNumberOfClasses(self):
+        return len(self.getAllClasses())
+
+    def getChangeStamp(self):
+        # The index is a snapshot, it never changes.
+        return '0'
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options] FILE')
+    parser.add_option('--port', type='int', default=40000,
+                      help='The port the squeak server is running on.[default: %default]')
+    parser.add_option('--depth', type='int', default=32,
+                      help='Commands in flight, 1 disables pipelining.[default: %default]')
+    opts, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error('Need an output file')
+
+    classes, categories = Builder(SqueakNet(opts.port), opts.depth).build()
+    write(args[0], classes, categories)
+    print >> sys.stderr, '%d classes, %d methods written to %s' \
+            % (len(classes), sum([len(c.methods[False]) + len(c.methods[True]) for c in classes]), args[0])
+
+if __name__ == '__main__':
+    main()
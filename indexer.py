@@ -0,0 +1,171 @@
+import time
+import logging
+import threading
+
+import names
+from squeakNet import SqueakNetException
+
+""" Background scanning of every method in the image.
+
+An Indexer walks all classes on its own connection, using pipelined commands,
+and tells its consumers which methods appeared, changed or disappeared. The
+first pass reports every method; later passes compare method stamps and only
+report what was edited since, so consumers such as the search index can be
+kept current without refetching the image.
+
+A consumer implements
+
+    methodsChanged(cls, classSide, changed, removed)
+
+where changed maps selectors to Method objects and removed is a list of
+selectors. A Method's source is only fetched if some consumer has a true
+wantsSources attribute, and the selectors it sends only if some consumer has a
+true wantsMessages attribute; otherwise they are None. Calls come from the
+indexer thread.
+
+"""
+
+class Method:
+    """ What the indexer learned about a new or edited method. """
+
+    def __init__(self, source=None, messages=None):
+        self.source = source
+        self.messages = messages
+
+class Indexer:
+    """ Scans the image every interval seconds on a connection from connect(). """
+
+    def __init__(self, connect, interval=300, depth=32, table=names.table):
+        self.connect = connect
+        self.table = table
+        self.interval = interval
+        self.depth = max(depth, 1)
+        self.consumers = []
+        # (class, classSide) -> (selectors, stamps), all as name IDs
+        self.known = {}
+        self.passes = 0
+        self.ready = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def addConsumer(self, consumer):
+        self.consumers.append(consumer)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='squeakfs-indexer')
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        sn = None
+        while not self.stopped.isSet():
+            try:
+                if sn is None:
+                    sn = self.connect()
+                start = time.time()
+                self.scan(sn)
+                logging.info("Indexed %d classes in %.1fs", len(self.known) / 2, time.time() - start)
+            except SqueakNetException:
+                logging.warning("Index pass failed", exc_info=True)
+                sn = None
+            except Exception:
+                logging.error("Index pass failed", exc_info=True)
+            self.ready.set()
+            self.stopped.wait(self.interval)
+
+    def fetch(self, sn, commands):
+        results = []
+        for i in range(0, len(commands), self.depth):
+            results.extend(sn.pipeline(commands[i:i + self.depth]))
+        return results
+
+    def scan(self, sn):
+        """ Performs a single pass over the image. """
+
+        wants = (bool([c for c in self.consumers if getattr(c, 'wantsSources', False)]),
+                 bool([c for c in self.consumers if getattr(c, 'wantsMessages', False)]))
+        classes = sn.getAllClasses() + sn.getAllTraits()
+
+        gone = set([cls for cls, side in self.known]) - set([self.table.intern(c) for c in classes])
+        for cls in gone:
+            for side in (False, True):
+                removed = self.stamps(self.known.pop((cls, side), None))
+                self.notify(self.table.name(cls), side, {}, removed.keys())
+
+        for i in range(0, len(classes), self.depth):
+            batch = classes[i:i + self.depth]
+            commands = []
+            for cls in batch:
+                commands.append('getInstanceMethodStamps:\t%s' % cls)
+                commands.append('getClassMethodStamps:\t%s' % cls)
+            responses = self.fetch(sn, commands)
+            if [r for r in responses if isinstance(r, SqueakNetException) and 'Unknown command' in r.errmsg]:
+                # An older server without stamps: compare method lists only.
+                commands = [c.replace('MethodStamps:', 'MethodsInClass:') for c in commands]
+                responses = [isinstance(r, SqueakNetException) and r or
+                             dict([(sel, '') for sel in sn.convertArraySpecial(r)])
+                             for r in self.fetch(sn, commands)]
+            else:
+                responses = [isinstance(r, SqueakNetException) and r or sn.convertStamps(r)
+                             for r in responses]
+
+            for j, cls in enumerate(batch):
+                for side, stamps in ((False, responses[2 * j]), (True, responses[2 * j + 1])):
+                    if isinstance(stamps, SqueakNetException):
+                        continue
+                    self.update(sn, cls, side, stamps, wants)
+        self.passes += 1
+
+    def update(self, sn, cls, side, stamps, wants):
+        wantsSources, wantsMessages = wants
+        key = (self.table.intern(cls), side)
+        old = self.stamps(self.known.get(key))
+        changed = [sel for sel, stamp in stamps.items() if old.get(sel) != stamp]
+        removed = [sel for sel in old if sel not in stamps]
+        self.known[key] = (self.table.encode(stamps.keys()), self.table.encode(stamps.values()))
+        if not changed and not removed:
+            return
+
+        methods = dict([(sel, Method()) for sel in changed])
+        if changed and wantsMessages:
+            # One command answers the sends of every method on this side.
+            try:
+                if side:
+                    sends = sn.getClassMessagesSent(cls)
+                else:
+                    sends = sn.getInstanceMessagesSent(cls)
+            except SqueakNetException:
+                logging.debug("No sent messages for %s", cls, exc_info=True)
+                sends = {}
+            for sel in changed:
+                methods[sel].messages = sends.get(sel, [])
+        if wantsSources:
+            if side:
+                command = 'getClassMethod:InClass:'
+            else:
+                command = 'getInstanceMethod:InClass:'
+            responses = self.fetch(sn, ['%s\t%s\t%s' % (command, sel, cls) for sel in changed])
+            for sel, source in zip(changed, responses):
+                if isinstance(source, SqueakNetException):
+                    del methods[sel]
+                else:
+                    methods[sel].source = sn.convertNL(source)
+        self.notify(cls, side, methods, removed)
+
+    def stamps(self, known):
+        """ Returns the {selector: stamp} of an entry of known. """
+
+        if known is None:
+            return {}
+        selectors, stamps = known
+        return dict(zip(self.table.decode(selectors), self.table.decode(stamps)))
+
+    def notify(self, cls, side, changed, removed):
+        for consumer in self.consumers:
+            try:
+                consumer.methodsChanged(cls, side, changed, removed)
+            except Exception:
+                logging.error("Index consumer failed", exc_info=True)
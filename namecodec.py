@@ -0,0 +1,87 @@
+import re
+import string
+
+""" File names for Squeak names that are not valid or not practical in a path.
+
+Binary selectors such as / and // cannot be file names, and * and \ break
+shells and the path expressions of the parsers. Names are displayed with
+those characters replaced by tokens:
+
+    /   __SLASH__
+    *   __STAR__
+    \   __BACKSLASH__
+
+A real name that contains __ could be mistaken for one with tokens, so in
+such names every _ is replaced by __UNDERSCORE__ as well; decoding reads
+the tokens from left to right and leaves every other _ as it is.
+
+encodeAll() checks a whole listing at once, joined into one string, with a
+single translate that deletes everything but the special characters. Most
+listings have none, nor a __, and are returned as they are; only listings
+with some are converted name by name, with str.replace. Every displayed name that
+differs from its real name is kept in a map, so decode() is a dictionary
+lookup; names never listed are decoded by replacing the tokens.
+
+"""
+
+SPECIAL = '/*\\'
+
+# (character, token); _ first, so that the other tokens are not escaped.
+tokens = [('_', '__UNDERSCORE__'), ('\\', '__BACKSLASH__'), ('/', '__SLASH__'), ('*', '__STAR__')]
+
+chars = dict([(token, char) for char, token in tokens])
+pattern = re.compile('|'.join([token for char, token in tokens]))
+
+# Deletes everything but the special characters.
+others = ''.join([c for c in map(chr, range(256)) if c not in SPECIAL])
+identity = string.maketrans('', '')
+
+class NameCodec:
+    """ Converts real names to displayed names and back. """
+
+    def __init__(self):
+        self.real = {}      # displayed name -> real name, where they differ
+
+    def __len__(self):
+        return len(self.real)
+
+    def encode(self, name):
+        escape = '__' in name
+        if not escape and not name.translate(identity, others):
+            return name
+        display = name
+        for char, token in tokens:
+            if char != '_' or escape:
+                display = display.replace(char, token)
+        self.real[display] = name
+        return display
+
+    def encodeAll(self, names):
+        """ Returns the displayed names of a list of real names. """
+
+        joined = '\0'.join(names)
+        if '__' not in joined and not joined.translate(identity, others):
+            return list(names)
+        return [self.encode(name) for name in names]
+
+    def decode(self, display):
+        """ Returns the real name of a displayed name. """
+
+        try:
+            return self.real[display]
+        except KeyError:
+            pass
+        if '__' not in display:
+            return display
+        return pattern.sub(lambda m: chars[m.group(0)], display)
+
+codec = NameCodec()
+
+def encode(name):
+    return codec.encode(name)
+
+def encodeAll(names):
+    return codec.encodeAll(names)
+
+def decode(display):
+    return codec.decode(display)
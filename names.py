@@ -0,0 +1,109 @@
+import threading
+from array import array
+
+""" One shared copy of every class, selector and category name.
+
+An image has tens of thousands of selectors, and each name turns up in many
+listings, caches and indexes. Holding a Python string per occurrence costs
+about 40 bytes of object header on top of the name itself, so these keep
+integer IDs from a NameTable instead, in array('I') vectors of 4 bytes per
+name:
+
+    ids = names.table.encode(['printOn:', 'yourself'])
+    names.table.decode(ids) == ['printOn:', 'yourself']
+
+The table stores the UTF-8 bytes of all names back to back in one buffer,
+with the start of every name in an offsets array. Names are never removed,
+so an ID stays valid for the life of the process.
+
+"""
+
+class NameTable:
+    """ Maps names to small integer IDs and back. """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buffer = array('c')
+        self.offsets = array('I', [0])  # name i is buffer[offsets[i]:offsets[i + 1]]
+        self.slots = {}                 # hash of name -> id, or a tuple of ids
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def size(self):
+        """ Returns the bytes used by the buffer and the offsets. """
+
+        return len(self.buffer) + len(self.offsets) * self.offsets.itemsize
+
+    def name(self, id):
+        return self.buffer[self.offsets[id]:self.offsets[id + 1]].tostring()
+
+    def find(self, name):
+        """ Returns the ID of name, or None if it was never interned. """
+
+        if isinstance(name, unicode):
+            name = name.encode('utf-8')
+        slot = self.slots.get(hash(name))
+        if slot is None:
+            return None
+        if not isinstance(slot, tuple):
+            slot = (slot,)
+        for id in slot:
+            if self.name(id) == name:
+                return id
+        return None
+
+    def intern(self, name):
+        """ Returns the ID of name, adding it to the table if it is new. """
+
+        if isinstance(name, unicode):
+            name = name.encode('utf-8')
+        id = self.find(name)
+        if id is not None:
+            return id
+        self.lock.acquire()
+        try:
+            # Another thread may have added it meanwhile.
+            id = self.find(name)
+            if id is not None:
+                return id
+            id = len(self.offsets) - 1
+            self.buffer.fromstring(name)
+            self.offsets.append(len(self.buffer))
+            h = hash(name)
+            slot = self.slots.get(h)
+            if slot is None:
+                self.slots[h] = id
+            elif isinstance(slot, tuple):
+                self.slots[h] = slot + (id,)
+            else:
+                self.slots[h] = (slot, id)
+            return id
+        finally:
+            self.lock.release()
+
+    def encode(self, names):
+        """ Returns the IDs of a list of names as an array('I'). """
+
+        return array('I', [self.intern(n) for n in names])
+
+    def decode(self, ids):
+        """ Returns the names of a sequence of IDs as a list. """
+
+        return [self.name(id) for id in ids]
+
+table = NameTable()
+
+def pack(value):
+    """ Returns value with lists of names replaced by ID vectors, for caching. """
+
+    if isinstance(value, list) and not [n for n in value if not isinstance(n, basestring)]:
+        return table.encode(value)
+    return value
+
+def unpack(value):
+    """ Undoes pack. """
+
+    if isinstance(value, array):
+        return table.decode(value)
+    return value
@@ -0,0 +1,72 @@
+import os
+import time
+import threading
+import cProfile
+import logging
+
+""" Optional profiling of the FUSE handler threads.
+
+FUSE calls into SqueakFS from threads we do not create ourselves, so every
+thread lazily gets its own cProfile.Profile the first time it handles an
+operation. A profile is only ever enabled, disabled and dumped by the thread it
+belongs to, which keeps us clear of cProfile's per-thread hooks. The dumps are
+ordinary pstats files and can be merged with pstats.Stats(*files).
+
+"""
+
+class Profiler:
+    """ Profiles FUSE operations and periodically writes pstats files. """
+
+    def __init__(self, directory, interval=60):
+        """ Creates a profiler writing into directory every interval seconds. """
+
+        self.directory = directory
+        self.interval = interval
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.profiles = []
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def __profile(self):
+        try:
+            return self.local.profile
+        except AttributeError:
+            prof = cProfile.Profile()
+            self.local.profile = prof
+            self.local.path = os.path.join(self.directory, 'squeakfs-%d-%s.pstats' \
+                    % (os.getpid(), threading.currentThread().getName()))
+            self.local.dumped = time.time()
+            self.lock.acquire()
+            try:
+                self.profiles.append((prof, self.local.path))
+            finally:
+                self.lock.release()
+            return prof
+
+    def runcall(self, fn, *args):
+        """ Runs fn(*args) under this thread's profile. """
+
+        prof = self.__profile()
+        try:
+            return prof.runcall(fn, *args)
+        finally:
+            if time.time() - self.local.dumped >= self.interval:
+                self.local.dumped = time.time()
+                self.dump(prof, self.local.path)
+
+    def dump(self, prof, path):
+        try:
+            prof.dump_stats(path)
+        except (IOError, OSError):
+            logging.warning("Could not write profile %s", path)
+
+    def dumpAll(self):
+        """ Writes every thread's profile. Only call this when FUSE is idle. """
+
+        self.lock.acquire()
+        try:
+            for prof, path in self.profiles:
+                self.dump(prof, path)
+        finally:
+            self.lock.release()
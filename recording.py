@@ -0,0 +1,126 @@
+import gzip
+import time
+import struct
+import threading
+import optparse
+
+import standin
+
+""" Recording and replaying SqueakNet sessions.
+
+A SqueakNet created with a recorder writes every command it sends, the raw
+response and the round trip time to a trace file. A trace is a gzip stream of
+records, each a header packed as '!fII' (seconds, command length, response
+length) followed by the command and the response.
+
+A ReplayImage answers the recorded commands from a trace, so it can be served
+by standin.StandInServer in place of a synthetic image. That gives tests and
+benchmarks realistic data and timings without a running Squeak.
+
+"""
+
+header = struct.Struct('!fII')
+
+class Recorder:
+    """ Appends (command, response, seconds) records to a trace file. """
+
+    def __init__(self, path):
+        self.file = gzip.open(path, 'ab')
+        self.lock = threading.Lock()
+
+    def record(self, command, response, elapsed):
+        self.lock.acquire()
+        try:
+            self.file.write(header.pack(elapsed, len(command), len(response)))
+            self.file.write(command)
+            self.file.write(response)
+        finally:
+            self.lock.release()
+
+    def close(self):
+        self.lock.acquire()
+        try:
+            self.file.close()
+        finally:
+            self.lock.release()
+
+def readTrace(path):
+    """ Yields the (command, response, seconds) records of a trace file. """
+
+    f = gzip.open(path, 'rb')
+    try:
+        while True:
+            h = f.read(header.size)
+            if len(h) < header.size:
+                break
+            elapsed, clen, rlen = header.unpack(h)
+            command = f.read(clen)
+            response = f.read(rlen)
+            yield command, response, elapsed
+    finally:
+        f.close()
+
+class ReplayImage:
+    """ Answers commands with the responses recorded in a trace.
+
+    The same command may have been recorded several times with different
+    answers (the image changed in between); those are replayed in order and the
+    last one is repeated after that. Commands missing from the trace get an
+    error, just like an unknown class would.
+
+    Arguments:
+        path        the trace file.
+        latency     sleep this many seconds before every response, or
+        scale       sleep the recorded round trip time multiplied by scale.
+
+    """
+
+    def __init__(self, path, latency=None, scale=None):
+        self.latency = latency
+        self.scale = scale
+        self.responses = {}
+        self.lock = threading.Lock()
+        for command, response, elapsed in readTrace(path):
+            self.responses.setdefault(command, []).append((response, elapsed))
+
+    def __len__(self):
+        return len(self.responses)
+
+    def respond(self, line):
+        self.lock.acquire()
+        try:
+            try:
+                answers = self.responses[line]
+            except KeyError:
+                return 'Error: Not recorded'
+            if len(answers) > 1:
+                response, elapsed = answers.pop(0)
+            else:
+                response, elapsed = answers[0]
+        finally:
+            self.lock.release()
+
+        if self.latency is not None:
+            time.sleep(self.latency)
+        elif self.scale is not None:
+            time.sleep(elapsed * self.scale)
+        return response
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options] TRACE')
+    parser.add_option('--port', type='int', default=40000)
+    parser.add_option('--latency', type='float',
+                      help='Fixed delay in seconds before every response.')
+    parser.add_option('--scale', type='float',
+                      help='Replay recorded round trip times multiplied by this.')
+    opts, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error('Need exactly one trace file')
+
+    image = ReplayImage(args[0], opts.latency, opts.scale)
+    server = standin.StandInServer(image, opts.port)
+    print "Replaying %d commands on port %d" % (len(image), server.port)
+    server.serve_forever()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+import socket
+import logging
+import threading
+
+from squeakNet import SqueakNet, SqueakNetException
+
+""" Spreading commands over several images serving identical code.
+
+A Squeak image answers one command at a time, so a mount shared by several
+users is limited by a single image process. A ReplicaPool stands in for a
+SqueakNet and sends every command to one of several endpoints: the healthy
+endpoint with the fewest commands outstanding. Each endpoint keeps a set of
+idle connections, so concurrent FUSE threads use concurrent connections.
+
+An endpoint is taken out of rotation as soon as a connection to it fails or
+times out, and the command is retried on the next endpoint. A health check
+thread probes endpoints that are down and puts them back once they answer
+again.
+
+"""
+
+def parseEndpoints(spec, host='localhost'):
+    """ Parses 'port', 'host:port' or a comma separated list of them. """
+
+    endpoints = []
+    for item in spec.split(','):
+        item = item.strip()
+        if ':' in item:
+            h, port = item.rsplit(':', 1)
+        else:
+            h, port = host, item
+        endpoints.append((h, int(port)))
+    return endpoints
+
+class Endpoint:
+    """ One image process and the idle connections to it. """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.healthy = True
+        self.outstanding = 0
+        self.served = 0
+        self.idle = []
+
+    def __str__(self):
+        return '%s:%d' % (self.host, self.port)
+
+class ReplicaPool:
+    """ A SqueakNet replacement that routes commands over several endpoints.
+
+    Arguments:
+        endpoints   a list of (host, port).
+        interval    seconds between health checks of endpoints that are down.
+        timeout     seconds each command may take, or None to wait forever.
+        framing     the framing connections ask for, see SqueakNet.
+
+    """
+
+    def __init__(self, endpoints, stats=None, recorder=None, interval=5, timeout=None, framing='binary'):
+        self.endpoints = [Endpoint(host, port) for host, port in endpoints]
+        self.stats = stats
+        self.recorder = recorder
+        self.interval = interval
+        self.timeout = timeout
+        self.framing = framing
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.converter = None
+        # Fail now rather than at the first FUSE call if nothing answers.
+        self.check(self.endpoints)
+        if not [e for e in self.endpoints if e.healthy]:
+            raise SqueakNetException("No replica available", -2)
+
+    def __getattr__(self, name):
+        if name.startswith('convert'):
+            # Conversions do not touch the network; any connection will do.
+            return getattr(self.converter, name)
+        if name == 'pipeline' or name.startswith('get') or name.startswith('is') \
+                or name.startswith('fileOut'):
+            return lambda *args: self.call(name, *args)
+        raise AttributeError(name)
+
+    def connect(self, endpoint):
+        return SqueakNet(endpoint.port, self.stats, self.recorder, endpoint.host, self.timeout,
+                          self.framing)
+
+    def acquire(self):
+        """ Picks the least loaded healthy endpoint and one of its connections. """
+
+        while True:
+            self.lock.acquire()
+            try:
+                healthy = [e for e in self.endpoints if e.healthy]
+                if not healthy:
+                    raise SqueakNetException("No replica available", -2)
+                endpoint = min(healthy, key=lambda e: (e.outstanding, e.served))
+                endpoint.outstanding += 1
+                endpoint.served += 1
+                conn = endpoint.idle and endpoint.idle.pop() or None
+            finally:
+                self.lock.release()
+            if conn is not None:
+                return endpoint, conn
+            try:
+                return endpoint, self.connect(endpoint)
+            except (socket.error, SqueakNetException):
+                self.release(endpoint, None, False)
+
+    def release(self, endpoint, conn, healthy):
+        self.lock.acquire()
+        try:
+            endpoint.outstanding -= 1
+            if healthy:
+                endpoint.idle.append(conn)
+            elif endpoint.healthy:
+                logging.warning("Replica %s failed, taking it out of rotation", endpoint)
+                endpoint.healthy = False
+                endpoint.idle = []
+                if self.stats is not None:
+                    self.stats.increment('failovers')
+        finally:
+            self.lock.release()
+
+    def call(self, name, *args):
+        while True:
+            endpoint, conn = self.acquire()
+            conn.beginOperation(getattr(self.local, 'trace', None) is not None)
+            try:
+                result = getattr(conn, name)(*args)
+            except SqueakNetException, e:
+                self.count(conn)
+                if e.errnum == -1:
+                    # The image answered with an error; the connection is fine.
+                    self.release(endpoint, conn, True)
+                    raise
+                self.release(endpoint, conn, False)
+                continue
+            except socket.error:
+                self.count(conn)
+                self.release(endpoint, conn, False)
+                continue
+            self.count(conn)
+            self.release(endpoint, conn, True)
+            return result
+
+    def count(self, conn):
+        roundtrips, trace = conn.endOperation()
+        self.local.roundtrips = getattr(self.local, 'roundtrips', 0) + roundtrips
+        if getattr(self.local, 'trace', None) is not None:
+            self.local.trace.extend(trace)
+
+    def beginOperation(self, trace=False):
+        self.local.roundtrips = 0
+        if trace:
+            self.local.trace = []
+        else:
+            self.local.trace = None
+
+    def endOperation(self):
+        roundtrips = getattr(self.local, 'roundtrips', 0)
+        trace = getattr(self.local, 'trace', None)
+        self.local.roundtrips = 0
+        self.local.trace = None
+        return roundtrips, trace or []
+
+    def check(self, endpoints=None):
+        """ Probes the endpoints that are down and brings back those that answer. """
+
+        if endpoints is None:
+            endpoints = [e for e in self.endpoints if not e.healthy]
+        for endpoint in endpoints:
+            try:
+                conn = self.connect(endpoint)
+                conn.getNumberOfClasses()
+            except (socket.error, SqueakNetException):
+                endpoint.healthy = False
+                continue
+            self.lock.acquire()
+            try:
+                if not endpoint.healthy:
+                    logging.info("Replica %s is back", endpoint)
+                endpoint.healthy = True
+                endpoint.idle.append(conn)
+                if self.converter is None:
+                    self.converter = conn
+            finally:
+                self.lock.release()
+
+    def start(self):
+        """ Starts health checking in the background. """
+
+        self.thread = threading.Thread(target=self.run, name='squeakfs-replicas')
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        while not self.stopped.isSet():
+            self.stopped.wait(self.interval)
+            try:
+                self.check()
+            except Exception:
+                logging.error("Replica health check failed", exc_info=True)
@@ -1,9 +1,10 @@
 import logging
 import errno
-import traceback
+import cache
+import timestamps
 
 from defstat import *
-from squeakNet import SqueakNetException
+from squeakNet import SqueakNetException, errorCode
 
 """ Defines some common resources.
 
@@ -88,6 +89,32 @@ class Resource:
 
         raise NotYetImplemented
 
+    def readlink(self):
+        """ Get the target of a symbolic link.
+
+        This method will only be called if getattr identified this resource as
+        a link. The method should return the target path.
+
+        """
+
+        return -errno.EINVAL
+
+    def write(self, buf, offset):
+        """ Write a chunk of data to this resource.
+
+        Almost everything in SqueakFS is read only, so by default this returns
+        an access error. Writable resources should return the number of
+        characters consumed.
+
+        """
+
+        return -errno.EACCES
+
+    def truncate(self, size):
+        """ Truncate this resource. Read only by default, see write. """
+
+        return -errno.EACCES
+
 class FileResource(Resource):
     """ A resource representing a file. """
 
@@ -108,6 +135,126 @@ class FileResource(Resource):
             buf = ''
         return buf
 
+# Characters a window read fetches beyond what was asked for, so that reading
+# a large file from the start costs one round trip per window.
+readahead = 65536
+
+# The last window read of each ranged file.
+windows = cache.Cache('windows', 10)
+
+# Set when the server does not know the size and range commands, to stop asking.
+unsupported = []
+
+# The contentHash of each ranged file when it was last opened.
+versions = cache.Cache('versions')
+
+# Set when the server does not know the hash commands.
+unhashed = []
+
+class RangedFileResource(FileResource):
+    """ A file whose size and windows of content are fetched without the rest.
+
+    Subclasses implement fetch, which returns the whole content, and
+    fetchSize, fetchRange and fetchHash, which the image answers without
+    sending it. Servers without the size and range commands are sent fetch
+    instead.
+
+    open compares the hash of the content with the one of the last open, and
+    lets the kernel keep the pages it cached then if they are the same.
+
+    """
+
+    def key(self):
+        return (self.__class__.__name__,) + self.args()
+
+    def size(self):
+        if not unsupported:
+            try:
+                return self.fetchSize()
+            except SqueakNetException, e:
+                if 'Unknown command' not in e.errmsg:
+                    raise
+                logging.info("Server has no range commands, files are read whole")
+                unsupported.append(True)
+        return len(self.fetch())
+
+    def open(self, flags):
+        accmode = os.O_RDONLY | os.O_WRONLY | os.O_RDWR
+        if (flags & accmode) != os.O_RDONLY:
+            return -errno.EACCES
+        if unhashed:
+            return
+        key = self.key()
+        try:
+            version = self.fetchHash()
+        except SqueakNetException, e:
+            if 'Unknown command' not in e.errmsg:
+                logging.debug("SqueakNet request failed", exc_info=True)
+                return errorCode(e)
+            logging.info("Server has no hash commands, files are not kept in the page cache")
+            unhashed.append(True)
+            return
+        try:
+            keep = versions.get(key) == version
+        except KeyError:
+            keep = False
+        if not keep:
+            versions.put(key, version)
+            windows.discard(key)
+        return CachedFileInfo(keep)
+
+    def read(self, size, offset):
+        if unsupported:
+            return self.extract(self.fetch(), size, offset)
+        key = self.key()
+        try:
+            start, data, complete = windows.get(key)
+        except KeyError:
+            start, data, complete = 0, '', False
+        if offset < start or (offset + size > start + len(data) and not complete):
+            want = size + readahead
+            try:
+                data = self.fetchRange(offset, want)
+            except SqueakNetException, e:
+                if 'Unknown command' not in e.errmsg:
+                    raise
+                unsupported.append(True)
+                return self.extract(self.fetch(), size, offset)
+            start, complete = offset, len(data) < want
+            windows.put(key, (start, data, complete))
+        return data[offset - start:offset - start + size]
+
+class OpenFile:
+    """ Returned from open by files whose content is fetched when opened.
+
+    The content is read once and then served from memory for every read on
+    the same file handle. Its size is unknown to getattr, so the kernel must
+    not trust st_size or cached pages.
+
+    """
+
+    direct_io = True
+    keep_cache = False
+
+    def __init__(self, data):
+        self.data = data
+
+    def read(self, size, offset):
+        return self.data[offset:offset+size]
+
+class CachedFileInfo:
+    """ Returned from open by files the kernel may cache.
+
+    keep_cache tells the kernel whether the pages it cached for the file
+    before are still its content.
+
+    """
+
+    direct_io = False
+
+    def __init__(self, keep_cache):
+        self.keep_cache = keep_cache
+
 class StaticDirectoryResource(Resource):
     """ A directory resource with constant content.
     
@@ -146,29 +293,82 @@ class IllegalResource(Resource):
     def read(self, size, offset):
         return -errno.ENOENT
 
-class ClassCommentResource(FileResource):
+class ClassCommentResource(RangedFileResource):
     """ Represents the comment entry of a Squeak class. """
 
     def __init__(self, sn, cls):
         FileResource.__init__(self, sn)
         self.cls = cls
 
+    def args(self):
+        return (self.cls,)
+
+    def fetch(self):
+        return self.sn.getClassComment(self.cls)
+
+    def fetchSize(self):
+        return self.sn.getClassCommentSize(self.cls)
+
+    def fetchRange(self, offset, size):
+        return self.sn.getClassCommentRange(self.cls, offset, size)
+
+    def fetchHash(self):
+        return self.sn.getClassCommentHash(self.cls)
+
     def getattr(self):
         try:
-            size = len(self.sn.getClassComment(self.cls))
+            size = self.size()
         except SqueakNetException, e:
-            logging.debug(traceback.format_exc())
-            return -errno.ENOENT
+            logging.debug("SqueakNet request failed", exc_info=True)
+            return errorCode(e)
         return FileStat(size)
 
+class FileOutResource(FileResource):
+    """ Represents the complete fileout of a Squeak class in chunk format.
+
+    The fileout is fetched with a single command when the file is opened, not
+    in getattr, so the file reports a size of 0 and is read with direct I/O.
+
+    """
+
+    def __init__(self, sn, cls):
+        FileResource.__init__(self, sn)
+        self.cls = cls
+
+    def exists(self):
+        # mtime fails for a missing class; subclasses check more.
+        return True
+
+    def mtime(self):
+        """ Returns the modification time, raising SqueakNetException if there is no such class. """
+
+        return timestamps.classTime(self.sn, self.cls)
+
+    def fetch(self):
+        return self.sn.fileOutClass(self.cls)
+
+    def getattr(self):
+        if not self.exists():
+            return -errno.ENOENT
+        try:
+            return FileStat(0, self.mtime())
+        except SqueakNetException, e:
+            logging.debug("SqueakNet request failed", exc_info=True)
+            return errorCode(e)
+
     def open(self, flags):
         accmode = os.O_RDONLY | os.O_WRONLY | os.O_RDWR
         if (flags & accmode) != os.O_RDONLY:
             return -errno.EACCES
+        try:
+            return OpenFile(self.fetch())
+        except SqueakNetException, e:
+            logging.debug("SqueakNet request failed", exc_info=True)
+            return errorCode(e)
 
     def read(self, size, offset):
-        s = self.sn.getClassComment(self.cls)
-        return self.extract(s, size, offset)
+        # Only used if a read arrives without the handle from open.
+        return self.extract(self.fetch(), size, offset)
 
 class SuperClassResource(FileResource):
     """ Represents the superclass entry of a Squeak class. """
@@ -180,9 +380,9 @@ class SuperClassResource(FileResource):
     def getattr(self):
         try:
             size = len(self.sn.getSuperClass(self.cls)) + 1
-        except SqueakNetException:
-            logging.debug(traceback.format_exc())
-            return -errno.ENOENT
+        except SqueakNetException, e:
+            logging.debug("SqueakNet request failed", exc_info=True)
+            return errorCode(e)
         return FileStat(size)
 
     def open(self, flags):
@@ -194,7 +394,7 @@ class SuperClassResource(FileResource):
         s = self.sn.getSuperClass(self.cls) + '\n'
         return self.extract(s, size, offset)
 
-class InstanceMethodResource(FileResource):
+class InstanceMethodResource(RangedFileResource):
     """ Represents an instance method of a Squeak class. """
 
     def __init__(self, sn, cls, method):
@@ -202,24 +402,30 @@ class InstanceMethodResource(FileResource):
         self.cls = cls
         self.method = method
 
-    def getattr(self):
-        try:
-            size = len(self.sn.getInstanceMethod(self.cls, self.method))
-        except SqueakNetException:
-            logging.debug(traceback.format_exc())
-            return -errno.ENOENT
-        return FileStat(size)
+    def args(self):
+        return (self.cls, self.method)
 
-    def open(self, flags):
-        accmode = os.O_RDONLY | os.O_WRONLY | os.O_RDWR
-        if (flags & accmode) != os.O_RDONLY:
-            return -errno.EACCES
+    def fetch(self):
+        return self.sn.getInstanceMethod(self.cls, self.method)
 
-    def read(self, size, offset):
-        s = self.sn.getInstanceMethod(self.cls, self.method)
-        return self.extract(s, size, offset)
+    def fetchSize(self):
+        return self.sn.getInstanceMethodSize(self.cls, self.method)
+
+    def fetchRange(self, offset, size):
+        return self.sn.getInstanceMethodRange(self.cls, self.method, offset, size)
+
+    def fetchHash(self):
+        return self.sn.getInstanceMethodHash(self.cls, self.method)
+
+    def getattr(self):
+        try:
+            size, mtime = timestamps.methodStat(self.sn, self.cls, self.method, False, self.size)
+        except SqueakNetException, e:
+            logging.debug("SqueakNet request failed", exc_info=True)
+            return errorCode(e)
+        return FileStat(size, mtime)
 
-class ClassMethodResource(FileResource):
+class ClassMethodResource(RangedFileResource):
     """ Represents a class method of a Squeak class. """
 
     def __init__(self, sn, cls, method):
@@ -227,22 +433,28 @@ class ClassMethodResource(FileResource):
         self.cls = cls
         self.method = method
 
-    def getattr(self):
-        try:
-            size = len(self.sn.getClassMethod(self.cls, self.method))
-        except SqueakNetException:
-            logging.debug(traceback.format_exc())
-            return -errno.ENOENT
-        return FileStat(size)
+    def args(self):
+        return (self.cls, self.method)
 
-    def open(self, flags):
-        accmode = os.O_RDONLY | os.O_WRONLY | os.O_RDWR
-        if (flags & accmode) != os.O_RDONLY:
-            return -errno.EACCES
+    def fetch(self):
+        return self.sn.getClassMethod(self.cls, self.method)
 
-    def read(self, size, offset):
-        s = self.sn.getClassMethod(self.cls, self.method)
-        return self.extract(s, size, offset)
+    def fetchSize(self):
+        return self.sn.getClassMethodSize(self.cls, self.method)
+
+    def fetchRange(self, offset, size):
+        return self.sn.getClassMethodRange(self.cls, self.method, offset, size)
+
+    def fetchHash(self):
+        return self.sn.getClassMethodHash(self.cls, self.method)
+
+    def getattr(self):
+        try:
+            size, mtime = timestamps.methodStat(self.sn, self.cls, self.method, True, self.size)
+        except SqueakNetException, e:
+            logging.debug("SqueakNet request failed", exc_info=True)
+            return errorCode(e)
+        return FileStat(size, mtime)
 
 class InstanceMembersResource(FileResource):
     """ Represents a list of instance members of a Squeak class. """
@@ -254,9 +466,9 @@ class InstanceMembersResource(FileResource):
     def getattr(self):
         try:
             members = self.sn.getInstanceMembers(self.cls)
-        except SqueakNetException:
-            logging.debug(traceback.format_exc())
-            return -errno.ENOENT
+        except SqueakNetException, e:
+            logging.debug("SqueakNet request failed", exc_info=True)
+            return errorCode(e)
         size = sum([len(x) for x in members]) + len(members)
         return FileStat(size)
 
@@ -279,9 +491,9 @@ class ClassMembersResource(FileResource):
     def getattr(self):
         try:
             members = self.sn.getClassMembers(self.cls)
-        except SqueakNetException:
-            logging.debug(traceback.format_exc())
-            return -errno.ENOENT
+        except SqueakNetException, e:
+            logging.debug("SqueakNet request failed", exc_info=True)
+            return errorCode(e)
         size = sum([len(x) for x in members]) + len(members)
         return FileStat(size)
 
@@ -297,16 +509,21 @@ class ClassMembersResource(FileResource):
 class ClassDirectoryResource(StaticDirectoryResource):
     """ Represents the base directory of a Squeak class as used by SqueakFS. """
 
-    contents = ['superclass', 'instancemembers', 'classmembers', 'comment', 'instance', 'class', 'traits']
+    contents = ['superclass', 'instancemembers', 'classmembers', 'comment', 'source.st', 'instance', 'class', 'traits']
 
     def __init__(self, sn, cls):
         StaticDirectoryResource.__init__(self, sn)
         self.cls = cls
 
     def getattr(self):
-        if not self.sn.isClassAvailable(self.cls):
-            return -errno.ENOENT
-        return StaticDirectoryResource.getattr(self)
+        try:
+            mtime = timestamps.classTime(self.sn, self.cls)
+        except SqueakNetException, e:
+            logging.debug("SqueakNet request failed", exc_info=True)
+            return errorCode(e)
+        st = StaticDirectoryResource.getattr(self)
+        st.st_mtime = st.st_ctime = mtime
+        return st
 
 class ClassMethodsDirectoryResource(Resource):
     """ Represents a list of class methods for a Squeak class. """
@@ -319,7 +536,7 @@ class ClassMethodsDirectoryResource(Resource):
         if not self.sn.isClassAvailable(self.cls):
             return -errno.ENOENT
         nlink = len(self.sn.getClassMethodsInClass(self.cls)) + 2
-        return DirStat(nlink)
+        return DirStat(nlink, timestamps.latest(self.sn, self.cls, True))
 
     def readdir(self, offset):
         return self.sn.getClassMethodsInClass(self.cls)
@@ -334,7 +551,7 @@ class InstanceMethodsDirectoryResource(Resource):
         if not self.sn.isClassAvailable(self.cls):
             return -errno.ENOENT
         nlink = len(self.sn.getInstanceMethodsInClass(self.cls)) + 2
-        return DirStat(nlink)
+        return DirStat(nlink, timestamps.latest(self.sn, self.cls, False))
 
     def readdir(self, offset):
         return self.sn.getInstanceMethodsInClass(self.cls)
@@ -355,8 +572,9 @@ class TraitsDirectoryResource(Resource):
         return self.sn.getTraits(self.cls)
 
 class Parser:
-    special_chars = '\-+~<=>@&\|&=!,\'().:'
+    # Binary selectors and protocol names; / * and \ are encoded by namecodec.
+    special_chars = '\-+~<=>@&\|&=!,\'().:%?'
     cls = '\w+'
-    file = 'comment|classmembers|instancemembers|superclass'
+    file = 'comment|classmembers|instancemembers|superclass|source\.st'
     dir = 'instance|class|traits'
     method = '[\w%s]+' % special_chars
@@ -0,0 +1,221 @@
+import time
+import socket
+import logging
+import threading
+
+from squeakNet import SqueakNetException
+
+""" Serving interactive requests before bulk ones.
+
+Without scheduling, an ls waits behind every command a cp -R or grep -r has
+already queued on the connection. The Scheduler stands in for a SqueakNet and
+hands commands to worker connections from two kinds of queues:
+
+    interactive     one queue, always served first
+    bulk            one queue per process, served round robin
+
+A process counts as bulk while it runs more than rate operations per window
+seconds or touches more than scan different directories in that time, which
+is what recursive copies and greps do; it becomes interactive again after a
+quiet window. Commands from threads that are not serving a FUSE operation,
+such as the indexer, are bulk.
+
+"""
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+
+# The origin of commands sent outside FUSE operations.
+BACKGROUND = 'background'
+
+class Classifier:
+    """ Tells interactive processes from bulk ones by their recent operations. """
+
+    def __init__(self, window=2.0, rate=100, scan=20):
+        self.window = window
+        self.rate = rate
+        self.scan = scan
+        self.lock = threading.Lock()
+        self.recent = {}    # pid -> [(time, directory)]
+        self.bulk = {}      # pid -> time it last looked like bulk
+
+    def classify(self, pid, path, now=None):
+        if now is None:
+            now = time.time()
+        directory = path.rsplit('/', 1)[0]
+        self.lock.acquire()
+        try:
+            if len(self.recent) > 1000:
+                # Forget processes that have been quiet for a window.
+                for p, r in self.recent.items():
+                    if now - r[-1][0] >= self.window:
+                        del self.recent[p]
+                        self.bulk.pop(p, None)
+            recent = [(t, d) for t, d in self.recent.get(pid, []) if now - t < self.window]
+            recent.append((now, directory))
+            self.recent[pid] = recent
+            if len(recent) > self.rate or len(set([d for t, d in recent])) > self.scan:
+                self.bulk[pid] = now
+            if now - self.bulk.get(pid, -self.window) < self.window:
+                return BULK
+            self.bulk.pop(pid, None)
+            return INTERACTIVE
+        finally:
+            self.lock.release()
+
+class Request:
+    """ A command waiting for a worker. """
+
+    def __init__(self, name, args, trace):
+        self.name = name
+        self.args = args
+        self.trace = trace
+        self.queued = time.time()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.roundtrips = 0
+        self.commands = []
+
+class Scheduler:
+    """ A SqueakNet replacement that runs commands on workers in priority order.
+
+    Arguments:
+        connect     returns a new connection for each worker.
+        workers     the number of worker connections.
+
+    """
+
+    def __init__(self, connect, workers=2, classifier=None, stats=None):
+        self.connect = connect
+        if classifier is None:
+            classifier = Classifier()
+        self.classifier = classifier
+        self.stats = stats
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+        self.interactive = []
+        self.bulk = {}      # origin -> [Request]
+        self.turns = []     # bulk origins in round robin order
+        self.local = threading.local()
+        self.stopped = False
+        self.connections = [connect() for i in range(max(workers, 1))]
+        self.converter = self.connections[0]
+        self.threads = []
+
+    def start(self):
+        """ Starts a worker thread per connection. Commands wait until then. """
+
+        for i, sn in enumerate(self.connections):
+            t = threading.Thread(target=self.work, args=(sn,), name='squeakfs-scheduler-%d' % i)
+            t.setDaemon(True)
+            t.start()
+            self.threads.append(t)
+
+    def __getattr__(self, name):
+        if name.startswith('convert'):
+            # Conversions do not touch the network.
+            return getattr(self.converter, name)
+        if name == 'pipeline' or name.startswith('get') or name.startswith('is') \
+                or name.startswith('fileOut'):
+            return lambda *args: self.call(name, *args)
+        raise AttributeError(name)
+
+    def classify(self, pid, path):
+        """ Sets the origin of the commands the calling FUSE thread sends next. """
+
+        if self.classifier.classify(pid, path) == BULK:
+            self.local.origin = pid
+        else:
+            self.local.origin = INTERACTIVE
+
+    def beginOperation(self, trace=False):
+        self.local.roundtrips = 0
+        if trace:
+            self.local.trace = []
+        else:
+            self.local.trace = None
+
+    def endOperation(self):
+        roundtrips = getattr(self.local, 'roundtrips', 0)
+        trace = getattr(self.local, 'trace', None)
+        self.local.roundtrips = 0
+        self.local.trace = None
+        self.local.origin = BACKGROUND
+        return roundtrips, trace or []
+
+    def call(self, name, *args):
+        request = Request(name, args, getattr(self.local, 'trace', None) is not None)
+        origin = getattr(self.local, 'origin', BACKGROUND)
+        self.lock.acquire()
+        try:
+            if self.stopped:
+                raise SqueakNetException("Scheduler stopped", -2)
+            if origin == INTERACTIVE:
+                self.interactive.append(request)
+            else:
+                if origin not in self.bulk:
+                    self.bulk[origin] = []
+                    self.turns.append(origin)
+                self.bulk[origin].append(request)
+            self.ready.notify()
+        finally:
+            self.lock.release()
+
+        request.done.wait()
+        self.local.roundtrips = getattr(self.local, 'roundtrips', 0) + request.roundtrips
+        if getattr(self.local, 'trace', None) is not None:
+            self.local.trace.extend(request.commands)
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def next(self):
+        """ Takes the next request, interactive first, then bulk round robin. """
+
+        self.lock.acquire()
+        try:
+            while not self.interactive and not self.turns:
+                if self.stopped:
+                    return None, None
+                self.ready.wait(0.5)
+            if self.interactive:
+                return INTERACTIVE, self.interactive.pop(0)
+            origin = self.turns.pop(0)
+            queue = self.bulk[origin]
+            request = queue.pop(0)
+            if queue:
+                self.turns.append(origin)
+            else:
+                del self.bulk[origin]
+            return BULK, request
+        finally:
+            self.lock.release()
+
+    def work(self, sn):
+        while True:
+            kind, request = self.next()
+            if request is None:
+                return
+            if self.stats is not None:
+                self.stats.recordWait(kind, time.time() - request.queued)
+            sn.beginOperation(request.trace)
+            try:
+                try:
+                    request.result = getattr(sn, request.name)(*request.args)
+                except (SqueakNetException, socket.error), e:
+                    request.error = e
+                except Exception, e:
+                    logging.error("Scheduled %s failed", request.name, exc_info=True)
+                    request.error = e
+            finally:
+                request.roundtrips, request.commands = sn.endOperation()
+                request.done.set()
+
+    def stop(self):
+        self.lock.acquire()
+        try:
+            self.stopped = True
+            self.ready.notifyAll()
+        finally:
+            self.lock.release()
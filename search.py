@@ -0,0 +1,174 @@
+import re
+import errno
+import threading
+from array import array
+
+import names
+import resource
+from defstat import *
+
+""" Full text search over method sources, served as the search/ tree.
+
+The index maps every identifier and keyword found in a method's selector and
+source (lowercased) to the methods containing it. It is fed by an
+indexer.Indexer, so it is built in bulk in the background after mounting and
+kept current as methods are edited.
+
+    search/<term>/                  methods containing term
+    search/<term> <term>/           methods containing all terms
+    search/<term>/Class>>sel        symlink to flat/Class/instance/sel
+    search/<term>/Class class>>sel  symlink to flat/Class/class/sel
+
+"""
+
+token_exp = re.compile('[A-Za-z_][A-Za-z0-9_]*:?')
+
+def tokens(selector, source):
+    """ Returns the set of search terms of a method. """
+
+    words = set([selector.lower()])
+    for t in token_exp.findall(source):
+        t = t.lower()
+        words.add(t)
+        if t.endswith(':'):
+            words.add(t[:-1])
+    return words
+
+entry_exp = re.compile('^(?P<class>\w+)(?P<meta> class)?>>(?P<method>.+)$')
+
+def entryName(cls, classSide, selector):
+    if classSide:
+        return '%s class>>%s' % (cls, selector)
+    return '%s>>%s' % (cls, selector)
+
+def parseEntry(name):
+    """ Returns the (class, classSide, selector) of an entryName. """
+
+    m = entry_exp.match(name)
+    return m.group('class'), m.group('meta') is not None, m.group('method')
+
+class SearchIndex:
+    """ An inverted index from terms to (class, classSide, selector).
+
+    Terms and methods are kept as IDs of a names.NameTable, a method by the
+    ID of its entryName.
+
+    """
+
+    wantsSources = True
+
+    def __init__(self, table=names.table):
+        self.lock = threading.Lock()
+        self.table = table
+        self.postings = {}  # term -> array of methods
+        self.terms = {}     # method -> array of terms
+
+    def methodsChanged(self, cls, classSide, changed, removed):
+        self.lock.acquire()
+        try:
+            for sel in removed + changed.keys():
+                method = self.table.find(entryName(cls, classSide, sel))
+                for t in self.terms.pop(method, ()):
+                    p = self.postings[t]
+                    p.remove(method)
+                    if not p:
+                        del self.postings[t]
+            for sel, m in changed.items():
+                if m.source is None:
+                    continue
+                method = self.table.intern(entryName(cls, classSide, sel))
+                words = self.table.encode(tokens(sel, m.source))
+                self.terms[method] = words
+                for t in words:
+                    self.postings.setdefault(t, array('I')).append(method)
+        finally:
+            self.lock.release()
+
+    def search(self, query):
+        """ Returns the methods containing every whitespace separated term of query. """
+
+        terms = query.lower().split()
+        if not terms:
+            return []
+        self.lock.acquire()
+        try:
+            hits = None
+            for t in terms:
+                found = self.postings.get(self.table.find(t), ())
+                if hits is None:
+                    hits = set(found)
+                else:
+                    hits.intersection_update(found)
+        finally:
+            self.lock.release()
+        return sorted([parseEntry(self.table.name(m)) for m in hits])
+
+class SearchRootResource(resource.Resource):
+    """ The search/ directory. Terms are looked up, not listed. """
+
+    def getattr(self):
+        return DirStat(2)
+
+    def readdir(self, offset):
+        return []
+
+class SearchTermResource(resource.Resource):
+    """ A directory of links to the methods matching a query. """
+
+    def __init__(self, index, query):
+        resource.Resource.__init__(self)
+        self.index = index
+        self.query = query
+
+    def getattr(self):
+        return DirStat(len(self.index.search(self.query)) + 2)
+
+    def readdir(self, offset):
+        return [entryName(*m) for m in self.index.search(self.query)]
+
+class SearchHitResource(resource.Resource):
+    """ A link from a search result to the method in flat/. """
+
+    def __init__(self, index, query, cls, classSide, method):
+        resource.Resource.__init__(self)
+        self.index = index
+        self.query = query
+        self.method = (cls, classSide, method)
+
+    def target(self):
+        cls, classSide, method = self.method
+        return '../../flat/%s/%s/%s' % (cls, classSide and 'class' or 'instance', method)
+
+    def getattr(self):
+        if self.method not in self.index.search(self.query):
+            return -errno.ENOENT
+        return LinkStat(len(self.target()))
+
+    def readlink(self):
+        return self.target()
+
+class SearchPathParser(resource.Parser):
+    """ Converts a path below search/ into a resource. """
+
+    path_exp = re.compile('^/((?P<query>[^/]+)(/(?P<hit>[^/]+))?)?$')
+    hit_exp = entry_exp
+
+    def __init__(self, index):
+        self.index = index
+
+    def parse(self, path):
+        try:
+            res = self.path_exp.match(path).groupdict()
+        except AttributeError:
+            return resource.IllegalResource()
+
+        if res['hit']:
+            hit = self.hit_exp.match(res['hit'])
+            if hit is None:
+                return resource.IllegalResource()
+            return SearchHitResource(self.index, res['query'], hit.group('class'),
+                                     hit.group('meta') is not None, hit.group('method'))
+        elif res['query']:
+            return SearchTermResource(self.index, res['query'])
+        else:
+            return SearchRootResource()
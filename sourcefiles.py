@@ -0,0 +1,174 @@
+import os
+import mmap
+import logging
+import threading
+
+import cache
+from squeakNet import SqueakNetException, contentHash
+
+""" Reading method sources from the image's .sources and .changes files.
+
+Squeak keeps the source of every method in its source files, chunks of text
+ending with a '!' (a '!' in the text is doubled), and the method only holds
+a pointer to it: the index of the file in SourceFiles (1 for .sources, 2 for
+.changes) and the position of the chunk. When SqueakFS can read the same
+files, there is no need to have the image send the source over its single
+threaded server:
+
+    getInstanceMethodPointers:<class>   selector, file index and position of
+    getClassMethodPointers:<class>      every method on that side of a class
+
+SourceSqueakNet asks for the pointers of a whole side of a class in one
+command and answers sources, their sizes, ranges and hashes from memory
+mapped files. Pointers are trusted for ttl seconds; the files are only
+appended to, so until then a method edited in the image is served as it was.
+Methods without a pointer, files that are missing or too short, and images
+without the pointer commands are asked for the source as before.
+
+"""
+
+# How long the pointers of a class are trusted, in seconds.
+ttl = 10
+
+pointers = cache.Cache('pointers', ttl)
+
+class SourceFiles:
+    """ The source files of an image, memory mapped, by their index in SourceFiles. """
+
+    def __init__(self, paths):
+        self.paths = paths
+        self.maps = {}
+        self.lock = threading.Lock()
+
+    def map(self, index, end):
+        """ Returns the map of file index, remapped if the file grew past end since. """
+
+        m = self.maps.get(index)
+        if m is not None and end < len(m):
+            return m
+        if not 0 < index <= len(self.paths):
+            return None
+        self.lock.acquire()
+        try:
+            m = self.maps.get(index)
+            if m is None or end >= len(m):
+                try:
+                    f = open(self.paths[index - 1], 'rb')
+                except IOError:
+                    logging.warning("Cannot open the source file %s", self.paths[index - 1])
+                    return None
+                try:
+                    if os.fstat(f.fileno()).st_size == 0:
+                        return None
+                    # Old maps stay valid for readers still using them.
+                    m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                finally:
+                    f.close()
+                self.maps[index] = m
+            return m
+        finally:
+            self.lock.release()
+
+    def chunk(self, index, position):
+        """ Returns the chunk at position of file index, or None if the file does not have it. """
+
+        m = self.map(index, position)
+        if m is None or position >= len(m):
+            return None
+        end = position
+        remapped = False
+        while True:
+            found = m.find('!', end)
+            if found < 0:
+                # The file grew past the map, or the chunk is not terminated.
+                if remapped:
+                    return None
+                remapped = True
+                m = self.map(index, len(m))
+                if m is None:
+                    return None
+                continue
+            end = found
+            if m[end + 1:end + 2] != '!':
+                break
+            end = end + 2
+        return m[position:end].replace('!!', '!')
+
+    def close(self):
+        for m in self.maps.values():
+            m.close()
+        self.maps = {}
+
+class SourceSqueakNet:
+    """ Answers source commands from the source files of the image. """
+
+    # The sources and the commands derived from them, with the side they are on.
+    sides = {'getInstanceMethod': False, 'getInstanceMethodSize': False,
+             'getInstanceMethodRange': False, 'getInstanceMethodHash': False,
+             'getClassMethod': True, 'getClassMethodSize': True,
+             'getClassMethodRange': True, 'getClassMethodHash': True}
+
+    def __init__(self, sn, files, stats=None, pointers=pointers):
+        self.sn = sn
+        self.files = files
+        self.stats = stats
+        self.pointers = pointers
+        # Cleared when the image does not know the pointer commands.
+        self.enabled = True
+
+    def __getattr__(self, name):
+        fn = getattr(self.sn, name)
+        if name not in self.sides:
+            return fn
+        return lambda *args: self.call(name, fn, args)
+
+    def call(self, name, fn, args):
+        text = None
+        if self.enabled:
+            text = self.source(args[0], self.sides[name], args[1])
+        if text is None:
+            return fn(*args)
+        if self.stats is not None:
+            self.stats.increment('source file reads')
+        if name.endswith('Size'):
+            return len(text)
+        if name.endswith('Range'):
+            offset, size = args[2:]
+            return text[offset:offset + size]
+        if name.endswith('Hash'):
+            return contentHash(text)
+        return text
+
+    def source(self, inClass, classSide, method):
+        """ Returns the source of a method as getInstanceMethod does, or None if it is not in the files. """
+
+        try:
+            pointer = self.classPointers(inClass, classSide).get(method)
+        except SqueakNetException, e:
+            if e.errnum != -1:
+                raise
+            if 'Unknown command' in e.errmsg:
+                logging.info("Server has no pointer commands, sources are fetched from the image")
+                self.enabled = False
+            return None
+        if pointer is None:
+            return None
+        chunk = self.files.chunk(*pointer)
+        if chunk is None:
+            return None
+        return self.sn.convertNL(chunk)
+
+    def classPointers(self, inClass, classSide):
+        """ Returns {selector: (file index, position)} of a side of a class. """
+
+        key = (inClass, classSide)
+        try:
+            return self.pointers.get(key)
+        except KeyError:
+            pass
+        if classSide:
+            result = self.sn.getClassMethodPointers(inClass)
+        else:
+            result = self.sn.getInstanceMethodPointers(inClass)
+        self.pointers.put(key, result)
+        return result
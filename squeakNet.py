@@ -1,11 +1,29 @@
-import re
 import socket
 import string
 import errno
+import time
+import struct
+import hashlib
+import logging
+import threading
+import weakref
+
+import framing
+import namecodec
+from stats import Stats
+
+def contentHash(text):
+    """
+    The hash conditional commands compare: the SHA-1 hex digest of a source
+    or comment as SqueakFS shows it, i.e. after convertNL.
+    """
+    return hashlib.sha1(text).hexdigest()
 
 class SqueakNetException(Exception):
     """
-    Exception class for SqueakNet errors
+    Exception class for SqueakNet errors. errnum is -1 when the image
+    answered with an error, -2 when it could not be reached and -3 when it
+    did not answer in time.
     """
     def __init__(self, errormessage,errnum):
         self.errmsg = errormessage
@@ -13,56 +31,243 @@ class SqueakNetException(Exception):
     def __str__(self):
         return "SqueakNetException[%d]: %s\n" % (self.errnum,self.errmsg)
 
+def lines(data):
+    """
+    Returns the elements of a raw list response: a list with binary
+    framing, CR joined text with the line protocol.
+    """
+    if isinstance(data, list):
+        return data
+    data = data.rstrip("\r").split("\r")
+    if(data[0] == ''): data = []
+    return data
+
+def errorCode(e):
+    """
+    Returns the negative errno a FUSE call answers a SqueakNetException with.
+    """
+    if e.errnum == -3:
+        return -errno.ETIMEDOUT
+    if e.errnum == -2:
+        return -errno.EIO
+    return -errno.ENOENT
+
 class SqueakNet():
     """
     A class to handle communication with the SqueakFS Squeak TCP Server.
     TODO: We need to magically support all of squeak's CR/CRLF/\t etc etc.
+
+    Every command must be answered within timeout seconds, or the connection
+    is dropped. After a connection fails, reconnecting is not tried again for
+    backoff seconds, doubling with every failure up to MAX_BACKOFF; until
+    then commands fail at once instead of waiting for a dead image.
+
+    With framing 'binary' every connection asks for the binary framing of
+    framing.py, and stays with the line protocol if the server does not
+    know it. Responses are then typed: lists arrive as lists and checks as
+    bools, which the readResponse and convert methods accept as well as
+    the raw text of the line protocol.
     """
-    def __init__(self,port):
-        self.host='localhost'
+
+    BACKOFF = 0.5
+    MAX_BACKOFF = 30
+
+    def __init__(self,port,stats=None,recorder=None,host='localhost',timeout=None,framing='binary'):
+        self.host=host
         self.port=int(port)
-        self.timeouts = 0
-        self.MAX_TIMEOUT = 5 #5 timeouts a`1 second before giving up.
+        if stats is None:
+            stats = Stats()
+        self.stats = stats
+        self.recorder = recorder
+        self.timeout = timeout
+        self.framing = framing
+        self.binary = False
+        self.pending = []
+        self.buffer = ''
+        self.local = threading.local()
+        # Held from sending a command until its response is read.
+        self.lock = threading.RLock()
+        self.sock = None
+        self.failures = 0
+        self.retryAt = 0
+        self.lastUsed = time.time()
         self.__connectSocket()
-        
-        self.replacevars = {'\\': "__BACKSLASH__",
-                            '/': "__SLASH__",
-                            '*': "__STAR__"}
-        self.backwards_replacevars = {"__BACKSLASH__": '\\',
-                            "__SLASH__": '/' ,
-                            "__STAR__": '*' }
     
     def __connectSocket(self):
-        if self.timeouts > self.MAX_TIMEOUT:
-            #Okay, server is dead, let's give up.
-            self.sock = None
+        if time.time() < self.retryAt:
+            # The image failed recently; do not wait for it again yet.
             raise SqueakNetException("Socket not connected",-2)
-            
-        self.sock = socket.socket(socket.AF_INET,socket.SOCK_STREAM)
-#        self.sock.settimeout(1)
-        self.sock.connect((self.host,self.port))
-#        self.sFile = self.sock.makefile("rw",2048)
+        self.pending = []
+        self.buffer = ''
+        self.binary = False
+        try:
+            self.sock = socket.create_connection((self.host,self.port),self.timeout)
+            if self.framing == 'binary':
+                self.__negotiate()
+        except (socket.error, ValueError), e:
+            # ValueError: the answer to setFraming: has a malformed length.
+            if self.sock is not None:
+                self.sock.close()
+            self.sock = None
+            self.buffer = ''
+            self.__failed()
+            raise SqueakNetException("Could not connect: %s" % e,-2)
+        self.failures = 0
+
+    def __negotiate(self):
+        # Not a command of its own in the stats or a recording.
+        self.sock.sendall("setFraming:\tbinary\n")
+        while "\n" not in self.buffer:
+            self.__fill(1024)
+        size, self.buffer = self.buffer.split("\n",1)
+        while len(self.buffer) < int(size):
+            self.__fill(int(size) - len(self.buffer))
+        self.binary = self.buffer[:int(size)] == "binary"
+        self.buffer = self.buffer[int(size):]
+
+    def __failed(self):
+        self.failures = self.failures + 1
+        backoff = min(self.BACKOFF * 2 ** (self.failures - 1), self.MAX_BACKOFF)
+        self.retryAt = time.time() + backoff
+        self.stats.increment('connection failures')
+
+    def __disconnect(self):
+        """
+        Drops a connection that failed or timed out. Commands still waiting
+        for a response give up the lock with it.
+        """
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except socket.error:
+                pass
+        self.sock = None
+        self.buffer = ''
+        for command in self.pending:
+            self.lock.release()
+        self.pending = []
+        self.__failed()
         
+    def unconvertSpecial(self,name):
+        """
+        Converts a name shown by SqueakFS back to the name in the image.
+        """
+        return namecodec.decode(name)
+
     def sendConvertSpecial(self,str):
-        self.send(re.sub(r'(__STAR__)|(__BACKSLASH__)|(__SLASH__)', lambda m: self.backwards_replacevars[m.group(0)],str))
+        self.sendFields(map(namecodec.decode, str.split("\t")))
 
     def send(self,str):
-        if(not self.sock):
-            raise SqueakNetException("Socket not connected",-2)
+        self.sendFields(str.split("\t"))
+
+    def command(self,name,*args):
+        """
+        Sends a command with its arguments converted like sendConvertSpecial.
+        With binary framing arguments may contain tabs.
+        """
+        self.sendFields([name] + [namecodec.decode(str(arg)) for arg in args])
+
+    def sendFields(self,fields):
+        self.lock.acquire()
         try:
-            self.__send(str)
-        except socket.error, e:
-            #Most probably a Broken Pipe, let's confirm
-            if e[0] == errno.EPIPE:
-                self.timeouts = self.timeouts + 1
+            if not self.sock:
+                self.stats.increment('reconnects')
                 self.__connectSocket()
-                self.send(str) #try again.
-                return #raise SqueakNetException("Broken pipe",e[0])
-            else:
-                raise
+            try:
+                self.__send(fields)
+            except socket.error, e:
+                #Most probably a Broken Pipe, let's reconnect and try once more.
+                if e[0] not in (errno.EPIPE, errno.ECONNRESET) or self.pending:
+                    self.__disconnect()
+                    raise SqueakNetException("Connection lost: %s" % e,-2)
+                self.__disconnect()
+                self.stats.increment('reconnects')
+                self.__connectSocket()
+                try:
+                    self.__send(fields)
+                except socket.error, e:
+                    self.__disconnect()
+                    raise SqueakNetException("Connection lost: %s" % e,-2)
+        finally:
+            self.lock.release()
         
-    def __send(self,str):
-        self.sock.send(str + "\n")
+    def __send(self,fields):
+        command = "\t".join(fields)
+        if self.binary:
+            data = framing.encodeRequest(fields)
+        else:
+            data = command + "\n"
+        self.lock.acquire()
+        self.pending.append((command, time.time()))
+        self.lastUsed = time.time()
+        try:
+            self.sock.sendall(data)
+        except:
+            self.pending.pop()
+            self.lock.release()
+            raise
+
+    def __record(self,results,error=False,size=None):
+        if not self.pending:
+            return
+        command, start = self.pending.pop(0)
+        self.lock.release()
+        elapsed = time.time() - start
+        if size is None:
+            size = len(results)
+        self.stats.recordCommand(command.split("\t",1)[0], len(command) + 1, size, elapsed, error)
+        if self.recorder is not None:
+            # Traces hold what the line protocol answers.
+            self.recorder.record(command, framing.text(results), elapsed)
+        self.local.roundtrips = getattr(self.local, 'roundtrips', 0) + 1
+        trace = getattr(self.local, 'trace', None)
+        if trace is not None:
+            trace.append((command, elapsed))
+
+    def beginOperation(self,trace=False):
+        """
+        Starts counting the commands sent by the calling thread, typically
+        around a single FUSE operation. With trace, the commands themselves
+        are recorded as well.
+        """
+        self.local.roundtrips = 0
+        if trace:
+            self.local.trace = []
+        else:
+            self.local.trace = None
+
+    def endOperation(self):
+        """
+        Stops recording and returns the number of round trips and a list of
+        (command, seconds) pairs (empty unless tracing).
+        """
+        roundtrips = getattr(self.local, 'roundtrips', 0)
+        trace = getattr(self.local, 'trace', None)
+        self.local.roundtrips = 0
+        self.local.trace = None
+        return roundtrips, trace or []
+
+    def heartbeat(self,interval):
+        """
+        Probes a connection that has been idle for interval seconds, so that
+        a dead image is noticed, and the connection dropped, before a FUSE
+        call needs it. Returns False if the probe failed.
+        """
+        if time.time() - self.lastUsed < interval or not self.lock.acquire(False):
+            return True
+        try:
+            if not self.sock and time.time() < self.retryAt:
+                return False
+            self.send("getNumberOfClasses")
+            self.__recv()
+        except SqueakNetException, e:
+            if e.errnum == -1:
+                return True
+            self.stats.increment('heartbeat failures')
+            return False
+        finally:
+            self.lock.release()
+        return True
     
     def recv(self):
         return self.__recv()
@@ -71,69 +276,224 @@ class SqueakNet():
         if(not self.sock):
             raise SqueakNetException("Socket not connected",-2)
             
+        if self.binary:
+            return self.__recvFrame()
         try:
             #Receive data length 
-#            recvlen = self.sFile.readline() #breaks on LF
-#            recvlen = int(recvlen)
-#            results = self.sFile.read(recvlen)
-            data = self.sock.recv(1024)
-            res = data.split("\n",1)
-	    results = res[1]
-            while(int(res[0]) != len(results)):
-                results = results + self.sock.recv(int(res[0])-len(results))
-
-            if(results.startswith("Error:")):
-                raise SqueakNetException(results,-1)
+            while "\n" not in self.buffer:
+                self.__fill(1024)
+            res = self.buffer.split("\n",1)
+            length = int(res[0])
+            self.buffer = res[1]
+            while len(self.buffer) < length:
+                self.__fill(length - len(self.buffer))
+            results = self.buffer[:length]
+            self.buffer = self.buffer[length:]
         except socket.timeout,e:
-            #Socket probably dead. Let's try and reconnect it.
-            self.timeouts = self.timeouts + 1
-            self.__connectSocket()
-            raise SqueakNetException("Error: Timeout",-1)
+            self.__timedOut()
+        except socket.error,e:
+            self.__disconnect()
+            raise SqueakNetException("Connection lost: %s" % e,-2)
+        except ValueError,e:
+            self.__badResponse(e)
+
+        if(results.startswith("Error:")):
+            self.__record(results,True)
+            raise SqueakNetException(results,-1)
+        self.__record(results)
         return results
+
+    def __recvFrame(self):
+        try:
+            while len(self.buffer) < framing.header.size:
+                self.__fill(1024)
+            kind, length = framing.header.unpack_from(self.buffer)
+            end = framing.header.size + length
+            while len(self.buffer) < end:
+                self.__fill(end - len(self.buffer))
+            payload = self.buffer[framing.header.size:end]
+            self.buffer = self.buffer[end:]
+        except socket.timeout,e:
+            self.__timedOut()
+        except socket.error,e:
+            self.__disconnect()
+            raise SqueakNetException("Connection lost: %s" % e,-2)
+
+        try:
+            results = framing.decodeResponse(kind, payload)
+        except (ValueError, struct.error), e:
+            self.__badResponse(e)
+        if kind == framing.ERROR:
+            code, message = results
+            self.__record(message,True)
+            raise SqueakNetException(message,-1)
+        self.__record(results,False,length)
+        return results
+
+    def __timedOut(self):
+        # The image is hung or too slow; the response may still arrive, so
+        # the connection cannot be used for anything else.
+        self.stats.increment('timeouts')
+        # Recorded as an error, so that a replayed trace does not answer.
+        self.__record('Error: Timeout',True,0)
+        self.__disconnect()
+        raise SqueakNetException("Error: Timeout",-3)
+
+    def __badResponse(self,e):
+        # The stream cannot be trusted past a response it cannot decode.
+        self.__record('Error: Bad response',True,0)
+        self.__disconnect()
+        raise SqueakNetException("Bad response: %s" % e,-2)
     
+    def __fill(self,size):
+        # Responses to pipelined commands may arrive in the same packet, so
+        # whatever follows the current response stays in the buffer.
+        data = self.sock.recv(max(size, 1024))
+        if not data:
+            self.__disconnect()
+            raise SqueakNetException("Connection closed",-2)
+        self.buffer = self.buffer + data
+
+    def pipeline(self,commands):
+        """
+        Sends all commands before reading any response, which saves a round
+        trip per command. Arguments are converted like sendConvertSpecial.
+        Returns the raw responses in order; failed commands are returned as
+        SqueakNetException instances instead of being raised.
+        """
+        for command in commands:
+            self.sendConvertSpecial(command)
+        results = []
+        for command in commands:
+            try:
+                results.append(self.__recv())
+            except SqueakNetException, e:
+                if e.errnum != -1:
+                    raise
+                results.append(e)
+        return results
+
     def readResponse(self):
         return self.__recv()
         
     def readResponseConvertNL(self):
-        data = self.recv().replace("\r","\n") + "\n"
-        return data
+        return self.convertNL(self.recv())
     
     def readResponseAsArray(self):
-        data = self.__recv().rstrip("\r").split("\r")
-        if(data[0] == ''): data = []
-        return data
+        return lines(self.__recv())
 
     def readResponseAsArrayConvertSpecial(self):
-        data = self.__recv().rstrip("\r").split("\r")
-        if(data[0] == ''): data = []        
-        return map(lambda x: re.sub('[\\*\/]', lambda m: self.replacevars[m.group(0)],x),data)
+        return self.convertArraySpecial(self.__recv())
+
+    def convertNL(self,data):
+        """
+        Converts a raw source or comment response to the text SqueakFS shows.
+        """
+        return data.replace("\r","\n") + "\n"
+
+    def convertArraySpecial(self,data):
+        """
+        Converts a raw list response to names usable as file names.
+        """
+        return namecodec.encodeAll(lines(data))
+
+    def convertSpecial(self,name):
+        return namecodec.encode(name)
         
+    def readResponseAsStamps(self):
+        return self.convertStamps(self.__recv())
+
+    def convertStamps(self,data):
+        """
+        Converts a raw stamps response to a dictionary from selector to stamp.
+        """
+        stamps = {}
+        for line in lines(data):
+            if line:
+                selector, stamp = (line.split("\t",1) + [''])[:2]
+                stamps[namecodec.encode(selector)] = stamp
+        return stamps
+
+    def readResponseAsPointers(self):
+        pointers = {}
+        for line in self.readResponseAsArray():
+            if line:
+                # Selectors may contain tabs, the numbers do not.
+                selector, index, position = line.rsplit("\t",2)
+                pointers[namecodec.encode(selector)] = (int(index), int(position))
+        return pointers
+
+    def readResponseAsStat(self):
+        size, stamp = (self.readResponseAsArray() + [''])[:2]
+        return int(size) + 1, stamp
+
+    def readResponseAsMessages(self):
+        messages = {}
+        for line in self.readResponseAsArray():
+            fields = line.split("\t")
+            messages[namecodec.encode(fields[0])] = namecodec.encodeAll(fields[1:])
+        return messages
+
+    def commandRange(self,command,offset,size,*args):
+        """
+        Sends a range command for size characters from offset of the text
+        convertNL makes of a body, and reads the answer like readResponse.
+        The server answers a slice of the body, which lacks the newline
+        convertNL appends and is empty both at and past its end, so the
+        command asks for one character before offset as well: the answer
+        then stops short of what was asked for only at the end of the body,
+        and is empty only past it.
+        """
+        before = min(offset,1)
+        self.command(command,*(args + (offset - before,size + before)))
+        data = self.__recv()
+        if len(data) < before:
+            return ""
+        if len(data) < size + before:
+            data = data + "\r"
+        return data[before:before + size].replace("\r","\n")
+
+    def readResponseIfChanged(self):
+        """
+        Reads the answer to a conditional command: '=' if the client's copy
+        is current, otherwise '+' followed by the new body. Returns None for
+        the former.
+        """
+        data = self.__recv()
+        if data == "=":
+            return None
+        return self.convertNL(data[1:])
+
     def readResponseAsBool(self):
         try:
             data = self.__recv()
         except SqueakNetException,e:
+            if e.errnum != -1:
+                # Not an answer but a lost connection.
+                raise
             return False
-        return True
+        # Binary framing answers a bool, the line protocol an error for false.
+        return data is not False
         
     def getSuperClass(self,inClass):
         """
         Receives the name of the superclass.
         """
-        self.sendConvertSpecial("getSuperClass:\t%s"%(inClass))
+        self.command("getSuperClass:",inClass)
         return self.readResponse()
     
     def getSubClasses(self,inClass):
         """
         Receives the names of all subclasses in an array.
         """
-        self.sendConvertSpecial("getSubClasses:\t%s"%(inClass))
+        self.command("getSubClasses:",inClass)
         return self.readResponseAsArrayConvertSpecial()
     
     def getDirectSubClasses(self,inClass):
         """
         Receives the names of all direct subclasses in an array.
         """
-        self.sendConvertSpecial("getDirectSubClasses:\t%s"%(inClass))
+        self.command("getDirectSubClasses:",inClass)
         return self.readResponseAsArrayConvertSpecial()
                 
     def getAllClasses(self):
@@ -148,7 +508,7 @@ class SqueakNet():
         Receives the sourcecode of an instancemethod. 
         XXX: How to output this in a good way? They use \r for newlines.
         """
-        self.sendConvertSpecial("getInstanceMethod:InClass:\t%s\t%s"%(method,inClass))    
+        self.command("getInstanceMethod:InClass:",method,inClass)    
         return self.readResponseConvertNL()
 
 
@@ -157,7 +517,7 @@ class SqueakNet():
         Receives the sourcecode of a classmethod. 
         """
         
-        self.sendConvertSpecial("getClassMethod:InClass:\t%s\t%s"%(method,inClass))    
+        self.command("getClassMethod:InClass:",method,inClass)    
         return self.readResponseConvertNL()
         
     def getCategories(self):
@@ -171,14 +531,14 @@ class SqueakNet():
         """
         Receives a list of all class member variables.
         """
-        self.sendConvertSpecial("getClassMembers:\t%s"%(inClass))
+        self.command("getClassMembers:",inClass)
         return self.readResponseAsArrayConvertSpecial()        
         
     def getInstanceMembers(self,inClass):
         """
         Receives a list of all instance member variables.
         """
-        self.sendConvertSpecial("getInstanceMembers:\t%s"%(inClass))
+        self.command("getInstanceMembers:",inClass)
         return self.readResponseAsArrayConvertSpecial()
     
     def getInstanceProtocols(self,inClass):
@@ -186,7 +546,7 @@ class SqueakNet():
         Receives a list of all protocols for instance methods.
         Note, this does not contain -- all --, as that one is just faked by the standard squeak browser.
         """
-        self.sendConvertSpecial("getInstanceProtocols:\t%s"%(inClass))
+        self.command("getInstanceProtocols:",inClass)
         return self.readResponseAsArrayConvertSpecial()
 
     def getClassProtocols(self,inClass):
@@ -194,7 +554,7 @@ class SqueakNet():
         Receives a list of all protocols for class methods.
         Note, this does not contain -- all --, as that one is just faked by the standard squeak browser.
         """
-        self.sendConvertSpecial("getClassProtocols:\t%s"%(inClass))
+        self.command("getClassProtocols:",inClass)
         return self.readResponseAsArrayConvertSpecial()
 
 
@@ -203,7 +563,7 @@ class SqueakNet():
         Receives all methods in an instanceprotocol.
         You can't use -- all -- here.
         """
-        self.sendConvertSpecial("getMethodsInInstanceProtocol:InClass:\t%s\t%s"%(inProtocol,inClass))
+        self.command("getMethodsInInstanceProtocol:InClass:",inProtocol,inClass)
         return self.readResponseAsArrayConvertSpecial()
 
     def getMethodsInClassProtocol(self,inClass,inProtocol):
@@ -211,7 +571,7 @@ class SqueakNet():
         Receives all methods in a classprotocol.
         You can't use -- all -- here.
         """
-        self.sendConvertSpecial("getMethodsInClassProtocol:InClass:\t%s\t%s"%(inProtocol,inClass))
+        self.command("getMethodsInClassProtocol:InClass:",inProtocol,inClass)
         return self.readResponseAsArrayConvertSpecial()
 
     
@@ -219,32 +579,46 @@ class SqueakNet():
         """
         Receives the comment of a class.
         """
-        self.sendConvertSpecial("getClassComment:\t%s"%(inClass))
+        self.command("getClassComment:",inClass)
+        return self.readResponseConvertNL()
+
+    def fileOutClass(self,inClass):
+        """
+        Receives the definition, comment and methods of a class in chunk format.
+        """
+        self.command("fileOutClass:",inClass)
+        return self.readResponseConvertNL()
+
+    def fileOutCategory(self,category):
+        """
+        Receives every class in a category in chunk format.
+        """
+        self.command("fileOutCategory:",category)
         return self.readResponseConvertNL()
 
     def getClassesInCategory(self,category):
         """
         Receives the classes available under a category.
         """
-        self.sendConvertSpecial("getClassesInCategory:\t%s"%(category))
+        self.command("getClassesInCategory:",category)
         return self.readResponseAsArrayConvertSpecial()  
         
     def getInstanceMethodsInClass(self,inClass):
         """
         Returns an array with all instancemethods in a class.
         """
-        self.sendConvertSpecial("getInstanceMethodsInClass:\t%s"%(inClass))
+        self.command("getInstanceMethodsInClass:",inClass)
         return self.readResponseAsArrayConvertSpecial()
         
     def getClassMethodsInClass(self,inClass):
         """
         Returns an array with all classmethods in a class
         """
-        self.sendConvertSpecial("getClassMethodsInClass:\t%s"%(inClass))
+        self.command("getClassMethodsInClass:",inClass)
         return self.readResponseAsArrayConvertSpecial()
 
     def getTraits(self,inClass):
-        self.sendConvertSpecial("getTraits:\t%s"%(inClass))
+        self.command("getTraits:",inClass)
         return self.readResponseAsArrayConvertSpecial()
     
     def getAllTraits(self):
@@ -252,10 +626,10 @@ class SqueakNet():
         return self.readResponseAsArrayConvertSpecial()
 
     def getTraitUsers(self,inTrait):
-        self.sendConvertSpecial("getTraitUsers:\t%s"%(inTrait))
+        self.command("getTraitUsers:",inTrait)
         return self.readResponseAsArrayConvertSpecial()
     def isTrait(self,inClass):
-        self.sendConvertSpecial("isTrait:\t%s"%(inClass))
+        self.command("isTrait:",inClass)
         return self.readResponseAsBool()
 
     def isClassAvailable(self,inClass):
@@ -263,36 +637,45 @@ class SqueakNet():
         Checks if a class is available in the squeak image. 
         returns True if it's available.
         """
-        self.sendConvertSpecial("isClassAvailable:\t%s"%(inClass))
+        self.command("isClassAvailable:",inClass)
         return self.readResponseAsBool()
 
     def isInstanceMethodAvailable(self,inClass,method):
         """
         Checks if a instance method is available for the selected class.
         """
-        self.sendConvertSpecial("isInstanceMethodAvailable:inClass:\t%s\t%s"%(method,inClass))        
+        self.command("isInstanceMethodAvailable:inClass:",method,inClass)        
         return self.readResponseAsBool()
                 
     def isClassMethodAvailable(self,inClass,method):
         """
-        Checks if an class method is available for the selected class
-        FIXME: Make this faster.
-        """        
-        
+        Checks if an class method is available for the selected class.
+        Images without the command are asked for the source instead.
+        """
+        self.command("isClassMethodAvailable:inClass:",method,inClass)
         try:
-            res = self.getClassMethod(inClass,method)
+            return self.readResponse() is not False
         except SqueakNetException,e:
+            if e.errnum != -1:
+                raise
+            if 'Unknown command' not in e.errmsg:
+                return False
+        try:
+            self.getClassMethod(inClass,method)
+        except SqueakNetException,e:
+            if e.errnum != -1:
+                raise
             return False
         return True
     
     def isInstanceProtocolAvailable(self,protocol,inClass):
         """
         """
-        self.sendConvertSpecial("isInstanceProtocolAvailable:inClass:\t%s\t%s"%(protocol,inClass))
+        self.command("isInstanceProtocolAvailable:inClass:",protocol,inClass)
         return self.readResponseAsBool()
     
     def isClassProtocolAvailable(self,protocol,inClass):
-        self.sendConvertSpecial("isClassProtocolAvailable:inClass:\t%s\t%s"%(protocol,inClass))
+        self.command("isClassProtocolAvailable:inClass:",protocol,inClass)
         return self.readResponseAsBool()
         
     def isCategoryAvailable(self,category):    
@@ -300,24 +683,223 @@ class SqueakNet():
         return self.readResponseAsBool()
         
     def isClassMethodInProtocol(self,method,protocol,inClass):
-        self.sendConvertSpecial("isClassMethod:InProtocol:inClass:\t%s\t%s\t%s"%(method,protocol,inClass))
+        self.command("isClassMethod:InProtocol:inClass:",method,protocol,inClass)
         return self.readResponseAsBool()
         
     def isInstanceMethodInProtocol(self,method,protocol,inClass):
-        self.sendConvertSpecial("isInstanceMethod:InProtocol:inClass:\t%s\t%s\t%s"%(method,protocol,inClass))
+        self.command("isInstanceMethod:InProtocol:inClass:",method,protocol,inClass)
         return self.readResponseAsBool()
 
     def isClassInCategory(self,category,inClass):
-        self.sendConvertSpecial("isClass:InCategory:\t%s\t%s"%(inClass,category))
+        self.command("isClass:InCategory:",inClass,category)
         return self.readResponseAsBool()
 
     def isCategoryAvailable(self,category):
-        self.sendConvertSpecial("isCategoryAvailable:\t%s"%(category))
+        self.command("isCategoryAvailable:",category)
         return self.readResponseAsBool()
 
+    def getInstanceMethodStamps(self,inClass):
+        """
+        Receives the changes-file stamps of all instance methods of a class
+        as a dictionary from selector to stamp, e.g. 'jbj 3/14/2008 12:34'.
+        """
+        self.command("getInstanceMethodStamps:",inClass)
+        return self.readResponseAsStamps()
+
+    def getClassMethodStamps(self,inClass):
+        """
+        Receives the changes-file stamps of all class methods of a class.
+        """
+        self.command("getClassMethodStamps:",inClass)
+        return self.readResponseAsStamps()
+
+    def getInstanceMethodPointers(self,inClass):
+        """
+        Receives where the sources of all instance methods of a class are,
+        as a dictionary from selector to (file index, position) in the
+        image's source files. Methods whose source is in no file are left out.
+        """
+        self.command("getInstanceMethodPointers:",inClass)
+        return self.readResponseAsPointers()
+
+    def getClassMethodPointers(self,inClass):
+        """
+        Receives where the sources of all class methods of a class are.
+        """
+        self.command("getClassMethodPointers:",inClass)
+        return self.readResponseAsPointers()
+
+    def getInstanceMessagesSent(self,inClass):
+        """
+        Receives the selectors sent by every instance method of a class as a
+        dictionary from selector to a list of sent selectors.
+        """
+        self.command("getInstanceMessagesSent:",inClass)
+        return self.readResponseAsMessages()
+
+    def getClassMessagesSent(self,inClass):
+        """
+        Receives the selectors sent by every class method of a class.
+        """
+        self.command("getClassMessagesSent:",inClass)
+        return self.readResponseAsMessages()
+
+    def getInstanceMethodSize(self,inClass,method):
+        """
+        Receives the size of the sourcecode of an instancemethod, as
+        getInstanceMethod returns it.
+        """
+        self.command("getInstanceMethodSize:InClass:",method,inClass)
+        return int(self.readResponse()) + 1
+
+    def getClassMethodSize(self,inClass,method):
+        self.command("getClassMethodSize:InClass:",method,inClass)
+        return int(self.readResponse()) + 1
+
+    def getClassCommentSize(self,inClass):
+        self.command("getClassCommentSize:",inClass)
+        return int(self.readResponse()) + 1
+
+    def getInstanceMethodRange(self,inClass,method,offset,size):
+        """
+        Receives up to size characters of the sourcecode of an instancemethod,
+        starting at offset, as getInstanceMethod would return them.
+        """
+        return self.commandRange("getInstanceMethod:InClass:from:size:",offset,size,method,inClass)
+
+    def getClassMethodRange(self,inClass,method,offset,size):
+        return self.commandRange("getClassMethod:InClass:from:size:",offset,size,method,inClass)
+
+    def getClassCommentRange(self,inClass,offset,size):
+        return self.commandRange("getClassComment:from:size:",offset,size,inClass)
+
+    def getInstanceMethodStat(self,inClass,method):
+        """
+        Receives the size of the sourcecode of an instancemethod, as
+        getInstanceMethodSize returns it, and its stamp.
+        """
+        self.command("getInstanceMethodStat:InClass:",method,inClass)
+        return self.readResponseAsStat()
+
+    def getClassMethodStat(self,inClass,method):
+        self.command("getClassMethodStat:InClass:",method,inClass)
+        return self.readResponseAsStat()
+
+    def getLatestMethodStamp(self,inClass):
+        """
+        Receives the newest stamp of the methods of a class, on both sides.
+        Fails if there is no such class.
+        """
+        self.command("getLatestMethodStamp:",inClass)
+        return self.readResponse()
+
+    def getInstanceMethodHash(self,inClass,method):
+        """
+        Returns the contentHash of the source of a method, without sending
+        the source.
+        """
+        self.command("getInstanceMethodHash:InClass:",method,inClass)
+        return self.readResponse()
+
+    def getClassMethodHash(self,inClass,method):
+        self.command("getClassMethodHash:InClass:",method,inClass)
+        return self.readResponse()
+
+    def getClassCommentHash(self,inClass):
+        self.command("getClassCommentHash:",inClass)
+        return self.readResponse()
+
+    def getInstanceMethodIfChanged(self,inClass,method,hash):
+        """
+        Receives the sourcecode of an instancemethod unless its contentHash
+        is hash, in which case None is returned.
+        """
+        self.command("getInstanceMethodIfChanged:InClass:hash:",method,inClass,hash)
+        return self.readResponseIfChanged()
+
+    def getClassMethodIfChanged(self,inClass,method,hash):
+        self.command("getClassMethodIfChanged:InClass:hash:",method,inClass,hash)
+        return self.readResponseIfChanged()
+
+    def getClassCommentIfChanged(self,inClass,hash):
+        self.command("getClassCommentIfChanged:hash:",inClass,hash)
+        return self.readResponseIfChanged()
+
+    def getInstanceMethodsIfChanged(self,inClass,hashes):
+        """
+        Revalidates many instance methods of a class at once. hashes maps
+        selectors to the contentHash of the client's copy. Returns the
+        selectors whose source changed or that are gone.
+        """
+        args = []
+        for sel,hash in hashes.items():
+            args.extend([sel,hash])
+        self.command("getInstanceMethodsIfChanged:hashes:",inClass,*args)
+        return self.readResponseAsArrayConvertSpecial()
+
+    def getClassMethodsIfChanged(self,inClass,hashes):
+        args = []
+        for sel,hash in hashes.items():
+            args.extend([sel,hash])
+        self.command("getClassMethodsIfChanged:hashes:",inClass,*args)
+        return self.readResponseAsArrayConvertSpecial()
+
     def getNumberOfClasses(self):
         self.send("getNumberOfClasses")
         return int(self.readResponse())
+
+    def getChangeStamp(self):
+        """
+        Receives a string that changes whenever a class or method of the
+        image is created, changed or removed.
+        """
+        self.send("getChangeStamp")
+        return self.readResponse()
+
+class Heartbeat:
+    """
+    Probes the idle connections added to it every interval seconds, from a
+    thread of its own. Connections are held weakly, so a dropped connection
+    leaves the heartbeat by itself.
+    """
+    def __init__(self,interval):
+        self.interval = interval
+        self.connections = weakref.WeakKeyDictionary()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def add(self,sn):
+        self.lock.acquire()
+        self.connections[sn] = True
+        self.lock.release()
+        return sn
+
+    def beat(self):
+        self.lock.acquire()
+        try:
+            connections = self.connections.keys()
+        finally:
+            self.lock.release()
+        for sn in connections:
+            if not sn.heartbeat(self.interval):
+                logging.warning("Heartbeat to %s:%d failed", sn.host, sn.port)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='squeakfs-heartbeat')
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        while not self.stopped.isSet():
+            self.stopped.wait(self.interval)
+            try:
+                self.beat()
+            except Exception:
+                logging.error("Heartbeat failed", exc_info=True)
         
 if __name__ == "__main__":
     print "Please run unittests (py.test) or squeakfs.py to start the filesystem"
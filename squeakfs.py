@@ -2,13 +2,26 @@ import fuse
 import squeakNet
 import logging
 import re
-#import cProfile
+import time
 import resource
 import hierarchy
 import flat
 import category
-#import hotshot
-#import hotshot.stats
+import control
+import stats
+import search
+import xref
+import indexer
+import profiler
+import asynclog
+import recording
+import imageindex
+import replicas
+import warmer
+import scheduler
+import bloom
+import stale
+import sourcefiles
 
 from defstat import *
 
@@ -16,18 +29,20 @@ from fuse import Fuse
 
 fuse.fuse_python_api = (0, 2)
 
-logging.basicConfig(level=logging.DEBUG,
-                    format='%(asctime)s %(levelname)s %(message)s',
-                    filename='error.log',
-                    filemode='a')
-
 class RootDirectoryResource(resource.StaticDirectoryResource):
     contents = ['flat', 'hierarchy', 'category']
 
+    def __init__(self, extra=()):
+        resource.StaticDirectoryResource.__init__(self)
+        self.contents = self.contents + list(extra)
+
 class PathParser:
     # Used to determine the fs and the subpath within that fs.
     path_exp = re.compile('/((?P<fs>\w+)(?P<subpath>/.+)?)?')
 
+    # Used to find requests for trees that are not made of classes.
+    virtual_exp = re.compile('^/(?P<fs>[^/]+)(?P<subpath>/.*)?$')
+
     # Used to determine if a path is a trait request.
     trait_exp = re.compile('/traits(?P<trait>/.+)')
 
@@ -36,13 +51,21 @@ class PathParser:
     # trait_exp.
     trait_false_exp = re.compile('/(instance|class|subclasses)/traits/')
 
-    def __init__(self, sn):
+    def __init__(self, sn, stats):
         self.flat = flat.FlatPathParser(sn)
         self.hierarchy = hierarchy.HierarchyPathParser(sn)
         self.category = category.CategoryPathParser(sn)
 
+        # The control tree is hidden from readdir but reachable by name.
+        self.virtual = {'.squeakfs': control.ControlPathParser(sn, stats)}
+
+    def addTree(self, name, parser):
+        """ Mounts a parser for a virtual tree at /name. """
+
+        self.virtual[name] = parser
+
     def trait(self, path):
-        print path
+        logging.debug("trait %s", path)
         # Check if a trait request may be inappropriate
         if self.trait_false_exp.search(path) is not None:
             return None
@@ -56,11 +79,15 @@ class PathParser:
             while res is not None:
                 oldres = res
                 res = self.trait_exp.search(res.groupdict()['trait'])
-            print oldres.groupdict()['trait']
             return self.flat.parse(oldres.groupdict()['trait'])
 
     def parse(self, path):
-        # First, check if this is a trait.
+        # Virtual trees may contain anything, including 'traits'.
+        res = self.virtual_exp.match(path)
+        if res is not None and res.group('fs') in self.virtual:
+            return self.virtual[res.group('fs')].parse(res.group('subpath') or '/')
+
+        # Then, check if this is a trait.
         res = self.trait(path)
         if res is not None:
             return res
@@ -79,18 +106,288 @@ class PathParser:
             else:
                 return resource.IllegalResource()
         else:
-            return RootDirectoryResource()
-        
+            return RootDirectoryResource(sorted([v for v in self.virtual if not v.startswith('.')]))
+
+def operation(name):
+    """ Decorates a FUSE operation so that its latency and round trips are recorded.
+
+    When profiling is enabled the operation runs under the thread's profiler,
+    and when a slow call threshold is set, the SqueakNet commands behind any
+    operation slower than it are written to the log.
+
+    """
+
+    def decorate(fn):
+        def wrapper(self, *args):
+            start = time.time()
+            if self.warmer is not None:
+                self.warmer.enter()
+            try:
+                if self.scheduler is not None:
+                    self.scheduler.classify(self.GetContext()['pid'], args[0])
+                self.sn.beginOperation(self.slowlog is not None)
+                try:
+                    if self.profiler is not None:
+                        return self.profiler.runcall(fn, self, *args)
+                    return fn(self, *args)
+                except squeakNet.SqueakNetException, e:
+                    if e.errnum == -1:
+                        raise
+                    # The image is down or hung: fail the call rather than the daemon.
+                    logging.warning("%s %s failed: %s", name, args[0], e.errmsg)
+                    return squeakNet.errorCode(e)
+            finally:
+                # Whatever failed above, the warmer must not go on yielding to this call.
+                try:
+                    if self.warmer is not None:
+                        self.warmer.leave()
+                finally:
+                    elapsed = time.time() - start
+                    roundtrips, trace = self.sn.endOperation()
+                    self.stats.recordOp(name, elapsed, roundtrips)
+                    if self.slowlog is not None and elapsed >= self.slowlog:
+                        logging.warning("slow %s %s %.1fms: %s", name, args[0], elapsed * 1000,
+                            '; '.join(["%s %.1fms" % (c.replace('\t', ' '), t * 1000) for c, t in trace]))
+        wrapper.__name__ = fn.__name__
+        wrapper.__doc__ = fn.__doc__
+        return wrapper
+    return decorate
+
 class SqueakFS(Fuse):
     def __init__(self, *args, **kw):
         Fuse.__init__(self, *args, **kw)
+        self.stats = stats.Stats()
+        self.profiler = None
+        self.slowlog = None
+        self.logListener = None
+        self.indexer = None
+        self.recorder = None
+        self.warmer = None
+        self.caching = None
+        self.replicas = None
+        self.scheduler = None
+        self.membership = None
+        self.stale = None
+        self.timeout = None
+        self.heartbeat = None
+        self.framing = 'binary'
+        self.sourcefiles = None
         #Let's try and get a connection to the squeak image
         logging.info("Initialized SqueakFS")
 
-    def initializeConnection(self,port):
-        self.sn = squeakNet.SqueakNet(port)
-        self.parser = PathParser(self.sn)
-        
+    def initializeConnection(self,port,record=None,imagefile=None,timeout=None,heartbeat=None,framing='binary'):
+        """ Connects to the image, or opens an image-index file.
+
+        Arguments:
+            timeout     seconds a command may take before it fails with
+                        ETIMEDOUT, or None to wait forever.
+            heartbeat   seconds a connection may idle before it is probed, or
+                        None for no probes.
+            framing     'binary' to ask the image for binary framing, 'text'
+                        to keep to the line protocol.
+
+        """
+
+        if timeout and float(timeout) > 0:
+            self.timeout = float(timeout)
+        self.framing = framing
+        if heartbeat and float(heartbeat) > 0:
+            self.heartbeat = squeakNet.Heartbeat(float(heartbeat))
+        if imagefile:
+            # Offline: everything is served from the file, no image needed.
+            self.sn = imageindex.ImageIndex(imagefile, self.stats)
+        else:
+            if record:
+                self.recorder = recording.Recorder(record)
+            endpoints = replicas.parseEndpoints(str(port))
+            if len(endpoints) > 1:
+                self.replicas = replicas.ReplicaPool(endpoints, self.stats, self.recorder,
+                                                     timeout=self.timeout, framing=framing)
+                self.sn = self.replicas
+            else:
+                host, port = endpoints[0]
+                self.sn = self.watch(squeakNet.SqueakNet(port, self.stats, self.recorder, host, self.timeout, framing))
+        self.parser = PathParser(self.sn, self.stats)
+
+    def connect(self):
+        """ Opens another connection to the image, for background work. """
+
+        if self.scheduler is not None:
+            # Background work is queued as bulk.
+            return self.scheduler
+        return self.backend()
+
+    def backend(self):
+        """ Opens another connection that bypasses the scheduler. """
+
+        sn = self.sn
+        while isinstance(sn, (bloom.FilteredSqueakNet, stale.StaleSqueakNet, warmer.CachingSqueakNet)):
+            sn = sn.sn
+        if isinstance(sn, scheduler.Scheduler):
+            sn = sn.converter
+        if isinstance(sn, sourcefiles.SourceSqueakNet):
+            sn = sn.sn
+        if isinstance(sn, imageindex.ImageIndex):
+            return imageindex.ImageIndex(sn.path, self.stats)
+        if isinstance(sn, replicas.ReplicaPool):
+            # The pool hands out a connection per command already.
+            return sn
+        return self.readSources(self.watch(squeakNet.SqueakNet(sn.port, self.stats, host=sn.host,
+                                                               timeout=self.timeout, framing=self.framing)))
+
+    def readSources(self, sn):
+        """ Has a connection read sources from the source files, if they are set up. """
+
+        if self.sourcefiles is None:
+            return sn
+        return sourcefiles.SourceSqueakNet(sn, self.sourcefiles, self.stats)
+
+    def watch(self, sn):
+        """ Adds a connection to the heartbeat, if there is one. """
+
+        if self.heartbeat is not None:
+            self.heartbeat.add(sn)
+        return sn
+
+    def initializeSources(self, paths):
+        """ Reads method sources from the image's source files rather than over the connection.
+
+        Arguments:
+            paths       comma separated paths of the files in the image's
+                        SourceFiles, the .sources file first and the .changes
+                        file second, or None.
+
+        """
+
+        if not paths or isinstance(self.sn, (imageindex.ImageIndex, replicas.ReplicaPool)):
+            return
+        self.sourcefiles = sourcefiles.SourceFiles(paths.split(','))
+        self.sn = self.readSources(self.sn)
+        self.parser = PathParser(self.sn, self.stats)
+
+    def initializeScheduler(self, enabled, workers):
+        """ Puts interactive requests ahead of bulk ones.
+
+        Arguments:
+            enabled     'on' to schedule.
+            workers     the number of connections the scheduler sends on.
+
+        """
+
+        if enabled != 'on':
+            return
+        # The connection made at mount becomes the first worker's.
+        first = [self.sn]
+        def connect():
+            if first:
+                return first.pop()
+            return self.backend()
+        self.scheduler = scheduler.Scheduler(connect, int(workers), stats=self.stats)
+        self.sn = self.scheduler
+        self.parser = PathParser(self.sn, self.stats)
+
+    def initializeResponses(self, enabled):
+        """ Keeps sources, comments and listings, and revalidates them by hash once expired.
+
+        Arguments:
+            enabled     'on' to cache responses.
+
+        """
+
+        if enabled != 'on' or isinstance(self.sn, imageindex.ImageIndex) or self.caching is not None:
+            return
+        self.caching = warmer.CachingSqueakNet(self.sn)
+        self.sn = self.caching
+        self.parser = PathParser(self.sn, self.stats)
+
+    def initializeWarmer(self, enabled, logfile):
+        """ Sets up prefetching while the image is idle.
+
+        Arguments:
+            enabled     'on' to prefetch.
+            logfile     the access log, to warm the classes used most in
+                        earlier sessions at mount, or None.
+
+        """
+
+        if enabled != 'on':
+            return
+        self.warmer = warmer.Warmer(self.connect, logfile, stats=self.stats)
+        # Prefetched responses are only used through the responses cache.
+        self.initializeResponses('on')
+
+    def initializeStale(self, policies):
+        """ Serves expired metadata while refreshing it in the background.
+
+        Arguments:
+            policies    maps kinds of stale.kinds to 'ttl:maxage' or None.
+
+        """
+
+        policies = dict([(kind, stale.parsePolicy(spec)) for kind, spec in policies.items() if spec])
+        if not policies:
+            return
+        self.stale = stale.StaleSqueakNet(self.sn, self.connect, policies, self.stats)
+        self.sn = self.stale
+        self.parser = PathParser(self.sn, self.stats)
+
+    def initializeFilters(self, enabled, refresh):
+        """ Answers checks for names the image does not have locally.
+
+        Arguments:
+            enabled     'on' to load the filters at mount.
+            refresh     seconds between checks whether the image changed.
+
+        """
+
+        if enabled != 'on':
+            return
+        self.membership = bloom.Membership(self.connect, float(refresh))
+        self.sn = bloom.FilteredSqueakNet(self.sn, self.membership, self.stats)
+        self.parser = PathParser(self.sn, self.stats)
+
+    def initializeIndex(self, searching, xrefs, refresh):
+        """ Sets up the background indexer and the trees it serves.
+
+        Arguments:
+            searching   'on' to build the full text index and serve search/.
+            xrefs       'on' to build the cross reference index and serve
+                        implementors/ and senders/.
+            refresh     seconds between passes looking for edited methods.
+
+        """
+
+        if searching != 'on' and xrefs != 'on':
+            return
+        self.indexer = indexer.Indexer(self.connect, float(refresh))
+        if self.membership is not None:
+            self.indexer.addConsumer(self.membership)
+        if searching == 'on':
+            index = search.SearchIndex()
+            self.indexer.addConsumer(index)
+            self.parser.addTree('search', search.SearchPathParser(index))
+        if xrefs == 'on':
+            index = xref.XrefIndex()
+            self.indexer.addConsumer(index)
+            self.parser.addTree('implementors', xref.ImplementorsPathParser(index))
+            self.parser.addTree('senders', xref.SendersPathParser(index))
+
+    def initializeProfiling(self, directory, interval, slowlog):
+        """ Enables the profiler and/or the slow call log.
+
+        Arguments:
+            directory   where to write pstats files, or None.
+            interval    seconds between pstats dumps of each thread.
+            slowlog     threshold in milliseconds for the slow call log, or None.
+
+        """
+
+        if directory:
+            self.profiler = profiler.Profiler(directory, float(interval))
+        if slowlog is not None:
+            self.slowlog = float(slowlog) / 1000
+
+    @operation('getattr')
     def getattr(self, path):
         """ Gets the attributes of a filesystem entry.
 
@@ -103,10 +400,11 @@ class SqueakFS(Fuse):
 
         """ 
 
-        logging.debug("getattr %s" % path) 
+        logging.debug("getattr %s", path)
 
         return self.parser.parse(path).getattr()
 
+    @operation('readdir')
     def readdir(self, path, offset):
         """ Gets the contents of a filesystem directory. 
         
@@ -123,30 +421,106 @@ class SqueakFS(Fuse):
             offset  ignored.
 
         Returns:
-                    a generator, whose elements are either a negative errno entry
+                    a list, whose elements are either a negative errno entry
                     or strings representing the names of entries in the specified
                     directory.
 
         """
         
-        logging.debug("readdir %s, %s" % (path, offset))
+        logging.debug("readdir %s, %s", path, offset)
 
-        out = self.parser.parse(path).readdir(offset)
-        for a in out:
-            # TODO Discard all '/' and *, they break the filesystem!
-            if '/' not in a and '*' not in a and not '\\' in a:            
-                yield fuse.Direntry(a)
+        res = self.parser.parse(path)
+        out = res.readdir(offset)
+        if isinstance(out, int):
+            return out
+        if self.warmer is not None:
+            self.warmer.accessed(res)
+            self.warmer.listed(res)
+        return [fuse.Direntry(a) for a in out]
 
+    @operation('open')
     def open(self, path, flags):
-        logging.debug("open %s, %s" % (path, flags))
+        logging.debug("open %s, %s", path, flags)
         
-        return self.parser.parse(path).open(flags)
+        res = self.parser.parse(path)
+        if self.warmer is not None:
+            self.warmer.accessed(res)
+        return res.open(flags)
 
-    def read(self, path, size, offset):
-        logging.debug("read %s, %s %s" % (path, size, offset))
+    @operation('read')
+    def read(self, path, size, offset, fh=None):
+        logging.debug("read %s, %s %s", path, size, offset)
 
+        # Files fetched on open are read from their handle.
+        if isinstance(fh, resource.OpenFile):
+            return fh.read(size, offset)
         return self.parser.parse(path).read(size, offset)
-        
+
+    @operation('readlink')
+    def readlink(self, path):
+        logging.debug("readlink %s", path)
+
+        return self.parser.parse(path).readlink()
+
+    @operation('write')
+    def write(self, path, buf, offset, fh=None):
+        logging.debug("write %s, %s %s", path, len(buf), offset)
+
+        return self.parser.parse(path).write(buf, offset)
+
+    @operation('truncate')
+    def truncate(self, path, size):
+        logging.debug("truncate %s, %s", path, size)
+
+        return self.parser.parse(path).truncate(size)
+
+    def release(self, path, flags, fh=None):
+        # Dropping the handle frees whatever open fetched.
+        return 0
+
+    def fsinit(self):
+        # Threads do not survive FUSE daemonizing, so start them here.
+        if self.logListener is not None:
+            self.logListener.start()
+        if self.indexer is not None:
+            self.indexer.start()
+        if self.replicas is not None:
+            self.replicas.start()
+        if self.scheduler is not None:
+            self.scheduler.start()
+        if self.warmer is not None:
+            self.warmer.start()
+        if self.membership is not None:
+            self.membership.start()
+        if self.stale is not None:
+            self.stale.start()
+        if self.heartbeat is not None:
+            self.heartbeat.start()
+
+    def fsdestroy(self):
+        if self.indexer is not None:
+            self.indexer.stop()
+        if self.replicas is not None:
+            self.replicas.stop()
+        if self.scheduler is not None:
+            self.scheduler.stop()
+        if self.warmer is not None:
+            self.warmer.stop()
+        if self.membership is not None:
+            self.membership.stop()
+        if self.stale is not None:
+            self.stale.stop()
+        if self.sourcefiles is not None:
+            self.sourcefiles.close()
+        if self.heartbeat is not None:
+            self.heartbeat.stop()
+        if self.profiler is not None:
+            self.profiler.dumpAll()
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.logListener is not None:
+            self.logListener.stop()
+
 	
 def main():
     usage="""
@@ -163,14 +537,101 @@ Squeak .image filesystem.
 
     server.squeakport = 40000
     server.parser.add_option(mountopt="squeakport",default="40000",
-    help="The port the squeak server is running on.[default: %default]")
-    
+    help="The port the squeak server is running on, or a comma separated list of host:port of images with the same code to spread commands over.[default: %default]")
+
+    server.timeout = 30
+    server.parser.add_option(mountopt="timeout",default="30",
+    help="Seconds a command to the image may take before the call fails with ETIMEDOUT. While the image does not answer, calls fail at once and it is reconnected to with growing pauses.[default: %default]")
+    server.heartbeat = 30
+    server.parser.add_option(mountopt="heartbeat",default="30",
+    help="Probe connections idle for this many seconds, to notice a dead image before a call does. 0 disables.[default: %default]")
+
+    server.framing = 'binary'
+    server.parser.add_option(mountopt="framing",default="binary",
+    help="'binary' asks the image for length prefixed binary framing, which lists names containing tabs and CRs, 'text' keeps to the line protocol.[default: %default]")
+
+    server.imagefile = None
+    server.parser.add_option(mountopt="imagefile",
+    help="Serve an image-index file written by squeakfs-index instead of connecting to squeak.")
+
+    server.record = None
+    server.parser.add_option(mountopt="record",
+    help="Record every SqueakNet command and response to this trace file.")
+
+    server.profile = None
+    server.parser.add_option(mountopt="profile",
+    help="Profile every FUSE thread and write pstats files into this directory.")
+    server.profile_interval = 60
+    server.parser.add_option(mountopt="profile_interval",default="60",
+    help="Seconds between pstats dumps when profiling.[default: %default]")
+    server.slowlog = None
+    server.parser.add_option(mountopt="slowlog",
+    help="Log the SqueakNet commands of operations slower than this many milliseconds.")
+
+    server.logfile = 'error.log'
+    server.parser.add_option(mountopt="logfile",default="error.log",
+    help="The file to log to.[default: %default]")
+    server.loglevel = 'INFO'
+    server.parser.add_option(mountopt="loglevel",default="INFO",
+    help="DEBUG logs every operation, WARNING only slow calls and errors.[default: %default]")
+
+    server.search = 'off'
+    server.parser.add_option(mountopt="search",default="off",
+    help="'on' indexes all method sources in the background and serves search/.[default: %default]")
+    server.xref = 'off'
+    server.parser.add_option(mountopt="xref",default="off",
+    help="'on' indexes the messages every method sends in the background and serves implementors/ and senders/.[default: %default]")
+    server.search_refresh = 300
+    server.parser.add_option(mountopt="search_refresh",default="300",
+    help="Seconds between index updates.[default: %default]")
+
+    server.sources = None
+    server.parser.add_option(mountopt="sources",
+    help="Comma separated paths of the image's .sources and .changes files, in that order. Method sources are read from them directly and the image only answers where they are.")
+
+    server.schedule = 'off'
+    server.parser.add_option(mountopt="schedule",default="off",
+    help="'on' serves interactive requests before those of recursive copies and greps.[default: %default]")
+    server.schedule_workers = 2
+    server.parser.add_option(mountopt="schedule_workers",default="2",
+    help="Connections to the image used by the scheduler.[default: %default]")
+
+    server.responses = 'on'
+    server.parser.add_option(mountopt="responses",default="on",
+    help="'on' keeps sources, comments and listings for %d seconds and then asks the image only whether they changed.[default: %%default]" % warmer.ttl)
+
+    server.warm = 'off'
+    server.parser.add_option(mountopt="warm",default="off",
+    help="'on' prefetches what is likely to be read next while the image is idle.[default: %default]")
+    server.warm_log = None
+    server.parser.add_option(mountopt="warm_log",
+    help="Count the classes used in this file and warm the most used ones at the next mount.")
+
+    server.filters = 'off'
+    server.parser.add_option(mountopt="filters",default="off",
+    help="'on' loads filters of all names at mount and answers lookups of names the image does not have without asking it.[default: %default]")
+    server.filters_refresh = 2
+    server.parser.add_option(mountopt="filters_refresh",default="2",
+    help="Seconds between checks whether the image changed. The filters are reloaded when it did, and answer lookups only while the last check is recent.[default: %default]")
+
+    for kind in sorted(stale.kinds):
+        setattr(server, 'stale_' + kind, None)
+        server.parser.add_option(mountopt="stale_" + kind,
+        help="'ttl:maxage' in seconds: answer %s lookups from answers up to maxage old, refreshing those older than ttl in the background." % kind)
+
     server.parse(values=server,errex=1)
-    server.initializeConnection(server.squeakport)
-    
-#    prof = hotshot.Profile("out.prof")
-#    prof.runcall(server.main)
-#    prof.close()
+    server.logListener = asynclog.configure(server.logfile, server.loglevel)
+    server.initializeConnection(server.squeakport, server.record, server.imagefile,
+                                server.timeout, server.heartbeat, server.framing)
+    server.initializeSources(server.sources)
+    server.initializeScheduler(server.schedule, server.schedule_workers)
+    server.initializeResponses(server.responses)
+    server.initializeWarmer(server.warm, server.warm_log)
+    server.initializeStale(dict([(kind, getattr(server, 'stale_' + kind)) for kind in stale.kinds]))
+    server.initializeFilters(server.filters, server.filters_refresh)
+    server.initializeProfiling(server.profile, server.profile_interval, server.slowlog)
+    server.initializeIndex(server.search, server.xref, server.search_refresh)
+
     server.main()
     
 if __name__ == '__main__':
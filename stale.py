@@ -0,0 +1,152 @@
+import Queue
+import logging
+import threading
+
+import cache
+import names
+from squeakNet import SqueakNetException
+
+""" Serving expired metadata while it is refreshed in the background.
+
+For directory metadata a short wait matters more than a few seconds of
+staleness. StaleSqueakNet caches the answers to metadata commands and,
+once an answer is older than the ttl of its kind, still returns it at once
+but queues a refresh on a connection of its own. Only an answer older than
+the maxage of its kind makes the caller wait for the image.
+
+Policies are set per kind of command:
+
+    classes     class, trait and category lists, subclasses
+    protocols   protocol lists and the methods of classes and protocols
+    superclass  superclasses
+    members     instance and class variables
+    checks      existence checks
+    sizes       sizes and stamps of sources and comments
+
+Kinds without a policy are not cached here.
+
+"""
+
+kinds = {
+    'classes': ['getAllClasses', 'getAllTraits', 'getCategories', 'getNumberOfClasses',
+                'getSubClasses', 'getDirectSubClasses', 'getClassesInCategory', 'getTraits',
+                'getTraitUsers'],
+    'protocols': ['getInstanceProtocols', 'getClassProtocols', 'getMethodsInInstanceProtocol',
+                  'getMethodsInClassProtocol', 'getInstanceMethodsInClass', 'getClassMethodsInClass'],
+    'superclass': ['getSuperClass'],
+    'members': ['getInstanceMembers', 'getClassMembers'],
+    'checks': ['isClassAvailable', 'isTrait', 'isInstanceMethodAvailable', 'isClassMethodAvailable',
+               'isInstanceProtocolAvailable', 'isClassProtocolAvailable', 'isCategoryAvailable',
+               'isClassMethodInProtocol', 'isInstanceMethodInProtocol', 'isClassInCategory'],
+    'sizes': ['getInstanceMethodSize', 'getClassMethodSize', 'getClassCommentSize',
+              'getInstanceMethodStat', 'getClassMethodStat', 'getLatestMethodStamp'],
+}
+
+class Policy:
+    """ How long answers of a kind are fresh, and how old they may be served. """
+
+    def __init__(self, ttl, maxage):
+        self.ttl = ttl
+        self.maxage = max(maxage, ttl)
+
+def parsePolicy(spec):
+    """ Parses 'ttl:maxage' in seconds, or None for an empty spec. """
+
+    if not spec:
+        return None
+    ttl, maxage = spec.split(':')
+    return Policy(float(ttl), float(maxage))
+
+class StaleSqueakNet:
+    """ Answers metadata commands from answers up to their maxage old.
+
+    Arguments:
+        connect     returns the connection refreshes are sent on.
+        policies    maps kinds to Policy objects.
+
+    """
+
+    def __init__(self, sn, connect, policies, stats=None, answers=None):
+        self.sn = sn
+        self.connect = connect
+        self.stats = stats
+        if answers is None:
+            answers = cache.Cache('stale')
+        self.answers = answers
+        self.policies = {}
+        for kind, policy in policies.items():
+            for name in kinds[kind]:
+                self.policies[name] = policy
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.queue = Queue.Queue()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def __getattr__(self, name):
+        fn = getattr(self.sn, name)
+        policy = self.policies.get(name)
+        if policy is None:
+            return fn
+        return lambda *args: self.call(policy, name, fn, args)
+
+    def call(self, policy, name, fn, args):
+        key = (name, args)
+        try:
+            value, age = self.answers.lookup(key)
+        except KeyError:
+            age = None
+        if age is not None and age <= policy.maxage:
+            if age > policy.ttl:
+                self.refresh(key)
+            return names.unpack(value)
+        result = fn(*args)
+        self.answers.put(key, names.pack(result))
+        return result
+
+    def refresh(self, key):
+        """ Queues a refresh of key unless one is queued already. """
+
+        self.lock.acquire()
+        try:
+            if key in self.pending:
+                return
+            self.pending.add(key)
+        finally:
+            self.lock.release()
+        if self.stats is not None:
+            self.stats.increment('stale answers')
+        self.queue.put(key)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='squeakfs-stale')
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        sn = None
+        while not self.stopped.isSet():
+            try:
+                key = self.queue.get(True, 0.5)
+            except Queue.Empty:
+                continue
+            name, args = key
+            try:
+                if sn is None:
+                    sn = self.connect()
+                self.answers.put(key, names.pack(getattr(sn, name)(*args)))
+            except SqueakNetException, e:
+                # Gone from the image: the next call asks it and fails there.
+                self.answers.discard(key)
+                if e.errnum != -1:
+                    sn = None
+            except Exception:
+                logging.error("Refreshing %s %s failed", name, args, exc_info=True)
+                self.answers.discard(key)
+                sn = None
+            self.lock.acquire()
+            self.pending.discard(key)
+            self.lock.release()
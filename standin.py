@@ -0,0 +1,662 @@
+import re
+import socket
+import hashlib
+import SocketServer
+import threading
+import optparse
+
+import framing
+import timestamps
+
+""" A stand-in for the SqueakFS TCP server that runs inside the Squeak image.
+
+The stand-in speaks the same line based protocol as the real server: a request
+is a command name followed by tab separated arguments and a newline, and every
+response is its length in decimal, a newline and the data. Lists are joined
+with CR and failures start with 'Error:'. A connection asking for the binary
+framing of framing.py gets typed responses instead.
+
+Instead of a real image it serves a synthetic one, which makes it possible to
+run round trip budgets, benchmarks and tests without Squeak.
+
+"""
+
+class StandInError(Exception):
+    """ Raised by the image for requests the real server answers with an error. """
+    pass
+
+class UnknownCommand(StandInError):
+    pass
+
+# Tokens of a method body, for a rough idea of the messages it sends.
+send_exp = re.compile(r'"[^"]*"|\'(?:[^\']|\'\')*\'|\[(?:\s*:\w+)+\s*\||(?P<assign>:=)'
+                      r'|(?P<keyword>[A-Za-z_]\w*:)|(?P<name>[A-Za-z_]\w*)'
+                      r'|(?P<literal>#[\w:]+|\$.|\d+(?:\.\d+)?)|(?P<binary>[-+*/\\<>=~@%|&?,]+)'
+                      r'|(?P<open>[(\[{])|(?P<close>[)\]}])|(?P<end>[.;^])')
+
+temps_exp = re.compile(r'^\s*\|[\w\s]*\|')
+
+def messagesSent(source):
+    """ Returns the selectors a method sends, parsing its source roughly.
+
+    The real server asks the compiled method; this is close enough for the
+    simple sources of a synthetic image.
+
+    """
+
+    sent = set()
+    keywords = [[]]
+    operand = False
+    body = temps_exp.sub('', '\r'.join(source.split('\r')[1:]))
+    for m in send_exp.finditer(body):
+        kind = m.lastgroup
+        if kind == 'keyword':
+            keywords[-1].append(m.group(kind))
+            operand = False
+        elif kind == 'name':
+            if operand:
+                sent.add(m.group(kind))
+            operand = True
+        elif kind == 'literal':
+            operand = True
+        elif kind == 'binary':
+            if operand:
+                sent.add(m.group(kind))
+            operand = False
+        elif kind == 'open' or m.group(0).startswith('['):
+            keywords.append([])
+            operand = False
+        elif kind in ('close', 'end', 'assign'):
+            if keywords[-1]:
+                sent.add(''.join(keywords[-1]))
+            if kind == 'close':
+                if len(keywords) > 1:
+                    keywords.pop()
+                operand = True
+            else:
+                keywords[-1] = []
+                # After a cascade the receiver is still there.
+                operand = m.group(0) == ';'
+    for parts in keywords:
+        if parts:
+            sent.add(''.join(parts))
+    return sorted(sent)
+
+class SqueakClass:
+    """ A class (or trait) in a synthetic image. """
+
+    def __init__(self, name, superclass, category):
+        self.name = name
+        self.superclass = superclass
+        self.category = category
+        self.comment = ''
+        self.instanceVariables = []
+        self.classVariables = []
+        self.instanceMethods = {}   # selector -> (protocol, source, stamp)
+        self.classMethods = {}
+        self.traits = []
+        self.isTrait = False
+
+    def methods(self, classSide):
+        if classSide:
+            return self.classMethods
+        return self.instanceMethods
+
+class Image:
+    """ A synthetic Squeak image and the commands the SqueakFS server knows. """
+
+    # Maps command names on the wire to the methods implementing them.
+    commands = {
+        'getSuperClass:': 'getSuperClass',
+        'getSubClasses:': 'getSubClasses',
+        'getDirectSubClasses:': 'getDirectSubClasses',
+        'getAllClasses': 'getAllClasses',
+        'getInstanceMethod:InClass:': 'getInstanceMethod',
+        'getClassMethod:InClass:': 'getClassMethod',
+        'getCategories': 'getCategories',
+        'getClassMembers:': 'getClassMembers',
+        'getInstanceMembers:': 'getInstanceMembers',
+        'getInstanceProtocols:': 'getInstanceProtocols',
+        'getClassProtocols:': 'getClassProtocols',
+        'getMethodsInInstanceProtocol:InClass:': 'getMethodsInInstanceProtocol',
+        'getMethodsInClassProtocol:InClass:': 'getMethodsInClassProtocol',
+        'getClassComment:': 'getClassComment',
+        'getClassesInCategory:': 'getClassesInCategory',
+        'getInstanceMethodsInClass:': 'getInstanceMethodsInClass',
+        'getClassMethodsInClass:': 'getClassMethodsInClass',
+        'getTraits:': 'getTraits',
+        'getAllTraits': 'getAllTraits',
+        'getTraitUsers:': 'getTraitUsers',
+        'isTrait:': 'isTrait',
+        'isClassAvailable:': 'isClassAvailable',
+        'isInstanceMethodAvailable:inClass:': 'isInstanceMethodAvailable',
+        'isClassMethodAvailable:inClass:': 'isClassMethodAvailable',
+        'isInstanceProtocolAvailable:inClass:': 'isInstanceProtocolAvailable',
+        'isClassProtocolAvailable:inClass:': 'isClassProtocolAvailable',
+        'isCategoryAvailable:': 'isCategoryAvailable',
+        'isClassMethod:InProtocol:inClass:': 'isClassMethodInProtocol',
+        'isInstanceMethod:InProtocol:inClass:': 'isInstanceMethodInProtocol',
+        'isClass:InCategory:': 'isClassInCategory',
+        'getNumberOfClasses': 'getNumberOfClasses',
+        'getInstanceMethodStamps:': 'getInstanceMethodStamps',
+        'getClassMethodStamps:': 'getClassMethodStamps',
+        'getInstanceMessagesSent:': 'getInstanceMessagesSent',
+        'getClassMessagesSent:': 'getClassMessagesSent',
+        'fileOutClass:': 'fileOutClass',
+        'fileOutCategory:': 'fileOutCategory',
+        'getInstanceMethodIfChanged:InClass:hash:': 'getInstanceMethodIfChanged',
+        'getClassMethodIfChanged:InClass:hash:': 'getClassMethodIfChanged',
+        'getClassCommentIfChanged:hash:': 'getClassCommentIfChanged',
+        'getInstanceMethodsIfChanged:hashes:': 'getInstanceMethodsIfChanged',
+        'getClassMethodsIfChanged:hashes:': 'getClassMethodsIfChanged',
+        'getInstanceMethodSize:InClass:': 'getInstanceMethodSize',
+        'getClassMethodSize:InClass:': 'getClassMethodSize',
+        'getClassCommentSize:': 'getClassCommentSize',
+        'getInstanceMethod:InClass:from:size:': 'getInstanceMethodRange',
+        'getClassMethod:InClass:from:size:': 'getClassMethodRange',
+        'getClassComment:from:size:': 'getClassCommentRange',
+        'getInstanceMethodHash:InClass:': 'getInstanceMethodHash',
+        'getClassMethodHash:InClass:': 'getClassMethodHash',
+        'getClassCommentHash:': 'getClassCommentHash',
+        'getChangeStamp': 'getChangeStamp',
+        'getInstanceMethodStat:InClass:': 'getInstanceMethodStat',
+        'getClassMethodStat:InClass:': 'getClassMethodStat',
+        'getLatestMethodStamp:': 'getLatestMethodStamp',
+        'getInstanceMethodPointers:': 'getInstanceMethodPointers',
+        'getClassMethodPointers:': 'getClassMethodPointers',
+    }
+
+    def __init__(self):
+        self.classes = {}
+        self.pointers = {}  # (class, classSide, selector) -> (file index, position)
+        self.changes = 0    # bumped by every change to the code
+        self.addClass('ProtoObject', None, 'Kernel-Objects')
+        self.addClass('Object', 'ProtoObject', 'Kernel-Objects')
+
+    def addClass(self, name, superclass, category):
+        cls = SqueakClass(name, superclass, category)
+        self.classes[name] = cls
+        self.changes += 1
+        return cls
+
+    def addTrait(self, name, category):
+        trait = self.addClass(name, None, category)
+        trait.isTrait = True
+        return trait
+
+    def addMethod(self, cls, selector, source, protocol='as yet unclassified', classSide=False, stamp=''):
+        self.cls(cls).methods(classSide)[selector] = (protocol, source, stamp)
+        self.changes += 1
+        # Until it is written to a source file.
+        self.pointers.pop((cls, classSide, selector), None)
+
+    def writeSources(self, path, index=1, methods=None):
+        """ Appends methods to a source file in chunk format and points them at it.
+
+        path is the file at index in SourceFiles, 1 for .sources and 2 for
+        .changes. methods is a list of (class, classSide, selector), all
+        methods by default.
+
+        """
+
+        if methods is None:
+            methods = [(name, classSide, sel) for name in sorted(self.classes)
+                       for classSide in (False, True)
+                       for sel in sorted(self.cls(name).methods(classSide))]
+        f = open(path, 'ab')
+        try:
+            f.seek(0, 2)
+            for name, classSide, sel in methods:
+                protocol, source, stamp = self.method(name, sel, classSide)
+                target = classSide and '%s class' % name or name
+                f.write('\r!%s methodsFor: \'%s\' stamp: \'%s\'!\r'
+                        % (target, protocol.replace('!', '!!'), stamp))
+                self.pointers[(name, classSide, sel)] = (index, f.tell())
+                f.write('%s !\r' % self.chunk(source))
+        finally:
+            f.close()
+
+    def answer(self, args):
+        """ Answers a request split into its fields with the result, or raises StandInError. """
+
+        try:
+            name = self.commands[args[0]]
+        except KeyError:
+            raise UnknownCommand('Unknown command')
+        try:
+            return getattr(self, name)(*args[1:])
+        except TypeError, e:
+            raise StandInError(str(e))
+
+    def respond(self, line):
+        """ Answers a single request line with the data of the response. """
+
+        try:
+            result = self.answer(line.split('\t'))
+        except StandInError, e:
+            return 'Error: %s' % e
+        if result is True:
+            return 'true'
+        elif result is False:
+            return 'Error: false'
+        elif isinstance(result, list):
+            return '\r'.join(result)
+        return str(result)
+
+    # Helpers
+
+    def cls(self, name):
+        try:
+            return self.classes[name]
+        except KeyError:
+            raise StandInError('No such class %s' % name)
+
+    def method(self, name, selector, classSide):
+        try:
+            return self.cls(name).methods(classSide)[selector]
+        except KeyError:
+            raise StandInError('No such method %s' % selector)
+
+    def protocols(self, name, classSide):
+        return sorted(set([m[0] for m in self.cls(name).methods(classSide).values()]))
+
+    def methodsInProtocol(self, name, protocol, classSide):
+        methods = self.cls(name).methods(classSide)
+        found = sorted([sel for sel, m in methods.items() if m[0] == protocol])
+        if not found:
+            raise StandInError('No such protocol %s' % protocol)
+        return found
+
+    def range(self, body, offset, size):
+        try:
+            offset, size = int(offset), int(size)
+        except ValueError:
+            raise StandInError('Bad range %s %s' % (offset, size))
+        return body[offset:offset + size]
+
+    def hash(self, body):
+        # The client hashes the text it shows, with LF line ends and a final newline.
+        return hashlib.sha1(body.replace('\r', '\n') + '\n').hexdigest()
+
+    def ifChanged(self, body, hash):
+        """ Answers a conditional command: '=' if hash is that of body, else '+' and body. """
+
+        if self.hash(body) == hash:
+            return '='
+        return '+' + body
+
+    def changed(self, name, classSide, pairs):
+        """ Returns the selectors of (selector, hash) pairs whose source changed or is gone. """
+
+        methods = self.cls(name).methods(classSide)
+        result = []
+        for i in range(0, len(pairs) - 1, 2):
+            sel, hash = pairs[i], pairs[i + 1]
+            if sel not in methods or self.ifChanged(methods[sel][1], hash) != '=':
+                result.append(sel)
+        return result
+
+    def stamps(self, name, classSide):
+        methods = self.cls(name).methods(classSide)
+        return ['%s\t%s' % (sel, methods[sel][2]) for sel in sorted(methods)]
+
+    def sourcePointers(self, name, classSide):
+        methods = self.cls(name).methods(classSide)
+        return ['%s\t%d\t%d' % ((sel,) + self.pointers[(name, classSide, sel)])
+                for sel in sorted(methods) if (name, classSide, sel) in self.pointers]
+
+    def sends(self, name, classSide):
+        methods = self.cls(name).methods(classSide)
+        return ['\t'.join([sel] + messagesSent(methods[sel][1])) for sel in sorted(methods)]
+
+    def chunk(self, text):
+        return text.replace('!', '!!') + '!'
+
+    def fileOut(self, name):
+        """ Returns a class in chunk format, as ClassDescription>>fileOutOn: writes it. """
+
+        c = self.cls(name)
+        if c.isTrait:
+            out = [self.chunk("Trait named: #%s\r\tuses: {}\r\tcategory: '%s'" % (name, c.category))]
+        else:
+            out = [self.chunk("%s subclass: #%s\r\tinstanceVariableNames: '%s'\r\tclassVariableNames: '%s'"
+                              "\r\tpoolDictionaries: ''\r\tcategory: '%s'"
+                              % (c.superclass or 'nil', name, ' '.join(c.instanceVariables),
+                                 ' '.join(c.classVariables), c.category))]
+        out.append('\r\r!%s commentStamp: \'<historical>\' prior: 0!\r%s\r' % (name, self.chunk(c.comment)))
+        for classSide in (False, True):
+            target = classSide and '%s class' % name or name
+            methods = c.methods(classSide)
+            for protocol in self.protocols(name, classSide):
+                for sel in sorted([sel for sel, m in methods.items() if m[0] == protocol]):
+                    out.append('\r!%s methodsFor: \'%s\' stamp: \'%s\'!\r%s !\r'
+                               % (target, protocol, methods[sel][2], self.chunk(methods[sel][1])))
+        return ''.join(out)
+
+    def subclasses(self, name):
+        return sorted([c.name for c in self.classes.values() if c.superclass == name])
+
+    # Commands
+
+    def getSuperClass(self, name):
+        return self.cls(name).superclass or 'nil'
+
+    def getSubClasses(self, name):
+        self.cls(name)
+        result = []
+        todo = self.subclasses(name)
+        while todo:
+            sub = todo.pop(0)
+            result.append(sub)
+            todo.extend(self.subclasses(sub))
+        return result
+
+    def getDirectSubClasses(self, name):
+        self.cls(name)
+        return self.subclasses(name)
+
+    def getAllClasses(self):
+        return sorted([c.name for c in self.classes.values() if not c.isTrait])
+
+    def getInstanceMethod(self, selector, name):
+        return self.method(name, selector, False)[1]
+
+    def getClassMethod(self, selector, name):
+        return self.method(name, selector, True)[1]
+
+    def getCategories(self):
+        return sorted(set([c.category for c in self.classes.values()]))
+
+    def getClassMembers(self, name):
+        return self.cls(name).classVariables
+
+    def getInstanceMembers(self, name):
+        return self.cls(name).instanceVariables
+
+    def getInstanceProtocols(self, name):
+        return self.protocols(name, False)
+
+    def getClassProtocols(self, name):
+        return self.protocols(name, True)
+
+    def getMethodsInInstanceProtocol(self, protocol, name):
+        return self.methodsInProtocol(name, protocol, False)
+
+    def getMethodsInClassProtocol(self, protocol, name):
+        return self.methodsInProtocol(name, protocol, True)
+
+    def getClassComment(self, name):
+        return self.cls(name).comment
+
+    def getInstanceMethodSize(self, selector, name):
+        return len(self.method(name, selector, False)[1])
+
+    def getClassMethodSize(self, selector, name):
+        return len(self.method(name, selector, True)[1])
+
+    def getClassCommentSize(self, name):
+        return len(self.cls(name).comment)
+
+    def getInstanceMethodRange(self, selector, name, offset, size):
+        return self.range(self.method(name, selector, False)[1], offset, size)
+
+    def getClassMethodRange(self, selector, name, offset, size):
+        return self.range(self.method(name, selector, True)[1], offset, size)
+
+    def getClassCommentRange(self, name, offset, size):
+        return self.range(self.cls(name).comment, offset, size)
+
+    def getInstanceMethodStat(self, selector, name):
+        protocol, body, stamp = self.method(name, selector, False)
+        return [str(len(body)), stamp]
+
+    def getClassMethodStat(self, selector, name):
+        protocol, body, stamp = self.method(name, selector, True)
+        return [str(len(body)), stamp]
+
+    def getLatestMethodStamp(self, name):
+        c = self.cls(name)
+        stamps = [m[2] for classSide in (False, True) for m in c.methods(classSide).values()]
+        return max([''] + stamps, key=timestamps.parseStamp)
+
+    def getInstanceMethodHash(self, selector, name):
+        return self.hash(self.method(name, selector, False)[1])
+
+    def getClassMethodHash(self, selector, name):
+        return self.hash(self.method(name, selector, True)[1])
+
+    def getClassCommentHash(self, name):
+        return self.hash(self.cls(name).comment)
+
+    def getInstanceMethodIfChanged(self, selector, name, hash):
+        return self.ifChanged(self.method(name, selector, False)[1], hash)
+
+    def getClassMethodIfChanged(self, selector, name, hash):
+        return self.ifChanged(self.method(name, selector, True)[1], hash)
+
+    def getClassCommentIfChanged(self, name, hash):
+        return self.ifChanged(self.cls(name).comment, hash)
+
+    def getInstanceMethodsIfChanged(self, name, *pairs):
+        return self.changed(name, False, pairs)
+
+    def getClassMethodsIfChanged(self, name, *pairs):
+        return self.changed(name, True, pairs)
+
+    def getClassesInCategory(self, category):
+        found = sorted([c.name for c in self.classes.values() if c.category == category])
+        if not found:
+            raise StandInError('No such category %s' % category)
+        return found
+
+    def getInstanceMethodsInClass(self, name):
+        return sorted(self.cls(name).instanceMethods)
+
+    def getClassMethodsInClass(self, name):
+        return sorted(self.cls(name).classMethods)
+
+    def getTraits(self, name):
+        return self.cls(name).traits
+
+    def getAllTraits(self):
+        return sorted([c.name for c in self.classes.values() if c.isTrait])
+
+    def getTraitUsers(self, name):
+        return sorted([c.name for c in self.classes.values() if name in c.traits])
+
+    def isTrait(self, name):
+        return self.cls(name).isTrait
+
+    def isClassAvailable(self, name):
+        return name in self.classes
+
+    def isInstanceMethodAvailable(self, selector, name):
+        return selector in self.cls(name).instanceMethods
+
+    def isClassMethodAvailable(self, selector, name):
+        return selector in self.cls(name).classMethods
+
+    def isInstanceProtocolAvailable(self, protocol, name):
+        return protocol in self.protocols(name, False)
+
+    def isClassProtocolAvailable(self, protocol, name):
+        return protocol in self.protocols(name, True)
+
+    def isCategoryAvailable(self, category):
+        return category in self.getCategories()
+
+    def isClassMethodInProtocol(self, selector, protocol, name):
+        return self.method(name, selector, True)[0] == protocol
+
+    def isInstanceMethodInProtocol(self, selector, protocol, name):
+        return self.method(name, selector, False)[0] == protocol
+
+    def isClassInCategory(self, name, category):
+        return self.cls(name).category == category
+
+    def getNumberOfClasses(self):
+        return len(self.getAllClasses())
+
+    def getChangeStamp(self):
+        return str(self.changes)
+
+    def getInstanceMethodStamps(self, name):
+        return self.stamps(name, False)
+
+    def getClassMethodStamps(self, name):
+        return self.stamps(name, True)
+
+    def getInstanceMethodPointers(self, name):
+        return self.sourcePointers(name, False)
+
+    def getClassMethodPointers(self, name):
+        return self.sourcePointers(name, True)
+
+    def fileOutClass(self, name):
+        return self.fileOut(name)
+
+    def fileOutCategory(self, category):
+        return '\r\r'.join([self.fileOut(name) for name in self.getClassesInCategory(category)])
+
+    def getInstanceMessagesSent(self, name):
+        return self.sends(name, False)
+
+    def getClassMessagesSent(self, name):
+        return self.sends(name, True)
+
+# Binary selectors that exercise the special character handling in SqueakNet.
+binary_selectors = ['+', '-', '*', '/', '//', '\\\\', '=', '<=', '->', ',']
+
+def synthesize(classes=100, methods=20, categories=10, depth=5, traits=2, comment=200):
+    """ Builds a deterministic synthetic image.
+
+    Arguments:
+        classes     number of classes besides ProtoObject and Object.
+        methods     instance methods per class, a quarter as many class methods.
+        categories  number of categories the classes are spread over.
+        depth       length of the longest superclass chain below Object.
+        traits      number of traits, each used by every tenth class.
+        comment     length of each class comment in characters.
+
+    """
+
+    image = Image()
+    image.cls('Object').comment = 'The root of all evil.'
+    for sel in binary_selectors:
+        image.addMethod('Object', sel, '%s anObject\r\t^ self primitiveFailed' % sel, 'arithmetic')
+
+    traitNames = ['TTrait%d' % i for i in range(traits)]
+    for name in traitNames:
+        trait = image.addTrait(name, 'Traits-Kernel')
+        image.addMethod(name, 'traitMethod', 'traitMethod\r\t^ true', 'trait')
+
+    names = ['Class%d' % i for i in range(classes)]
+    for i, name in enumerate(names):
+        # The first depth classes form a single chain, the rest hang off it.
+        if i == 0:
+            superclass = 'Object'
+        elif i < depth:
+            superclass = names[i - 1]
+        else:
+            superclass = names[i % max(depth, 1)]
+        cls = image.addClass(name, superclass, 'Category-%d' % (i % max(categories, 1)))
+        cls.comment = ('Comment of %s. ' % name * (comment // 10 + 1))[:comment]
+        cls.instanceVariables = ['var%d' % j for j in range(3)]
+        cls.classVariables = ['Default']
+        if traitNames and i % 10 == 0:
+            cls.traits = [traitNames[(i // 10) % len(traitNames)]]
+        for j in range(methods):
+            if j % 2:
+                sel = 'method%d:with:' % j
+                src = 'method%d: a with: b\r\t"Answer the sum."\r\t^ a + b + %d' % (j, j)
+            else:
+                sel = 'method%d' % j
+                src = 'method%d\r\t"Answer a constant."\r\t^ self method%d: %d with: 1' % (j, j + 1, j)
+            stamp = 'abc %d/%d/2008 12:%02d' % (i % 12 + 1, j % 28 + 1, (i + j) % 60)
+            image.addMethod(name, sel, src, 'protocol-%d' % (j % 4), False, stamp)
+        for j in range(methods // 4):
+            image.addMethod(name, 'new%d' % j, 'new%d\r\t^ self new' % j, 'instance creation', True,
+                            'abc 1/1/2008 10:%02d' % (j % 60))
+    return image
+
+class StandInHandler(SocketServer.StreamRequestHandler):
+    def setup(self):
+        SocketServer.StreamRequestHandler.setup(self)
+        self.server.connections.append(self.request)
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            line = line.rstrip('\n')
+            if line == 'setFraming:\tbinary' and hasattr(self.server.image, 'answer'):
+                self.wfile.write('6\nbinary')
+                break
+            response = self.server.image.respond(line)
+            self.server.requests += 1
+            self.wfile.write('%d\n%s' % (len(response), response))
+        while True:
+            data = self.rfile.read(framing.length.size)
+            if len(data) < framing.length.size:
+                return
+            fields = framing.decodeFields(self.rfile.read(framing.length.unpack(data)[0]))
+            try:
+                response = framing.encodeResponse(self.server.image.answer(fields))
+            except UnknownCommand, e:
+                response = framing.encodeError('Error: %s' % e, framing.UNKNOWN)
+            except StandInError, e:
+                response = framing.encodeError('Error: %s' % e)
+            self.server.requests += 1
+            self.wfile.write(response)
+
+class StandInServer(SocketServer.ThreadingTCPServer):
+    """ Serves an Image over TCP. Use port 0 to pick a free port. """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, image, port=0, host='localhost'):
+        SocketServer.ThreadingTCPServer.__init__(self, (host, port), StandInHandler)
+        self.image = image
+        self.requests = 0
+        self.connections = []
+        self.port = self.server_address[1]
+
+    def start(self):
+        """ Serves requests from a background thread. """
+
+        t = threading.Thread(target=self.serve_forever)
+        t.setDaemon(True)
+        t.start()
+
+    def stop(self):
+        """ Stops serving and drops open connections, like a dying image. """
+
+        self.shutdown()
+        self.server_close()
+        for conn in self.connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('--port', type='int', default=40000)
+    parser.add_option('--classes', type='int', default=100)
+    parser.add_option('--methods', type='int', default=20)
+    parser.add_option('--categories', type='int', default=10)
+    parser.add_option('--depth', type='int', default=5)
+    parser.add_option('--traits', type='int', default=2)
+    parser.add_option('--comment', type='int', default=200)
+    opts, args = parser.parse_args()
+
+    image = synthesize(opts.classes, opts.methods, opts.categories, opts.depth,
+                       opts.traits, opts.comment)
+    server = StandInServer(image, opts.port)
+    print "Serving %d classes on port %d" % (len(image.classes), server.port)
+    server.serve_forever()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+import bisect
+import threading
+
+""" Always-on instrumentation for SqueakFS.
+
+The collector keeps plain counters and fixed-bucket latency histograms. Every
+update is a couple of dictionary operations under a lock, so it is cheap enough
+to run on every FUSE operation and every SqueakNet command.
+
+"""
+
+class Histogram:
+    """ A latency histogram with fixed bucket boundaries (in seconds). """
+
+    bounds = [0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0]
+    labels = ['<100us', '<500us', '<1ms', '<5ms', '<10ms', '<50ms', '<100ms',
+              '<500ms', '<1s', '<5s', '>=5s']
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.roundtrips = 0
+        self.maxRoundtrips = 0
+
+    def add(self, elapsed):
+        self.buckets[bisect.bisect_right(self.bounds, elapsed)] += 1
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+    def mean(self):
+        if not self.count:
+            return 0.0
+        return self.total / self.count
+
+    def format(self):
+        return ' '.join(['%s:%d' % (l, n) for l, n in zip(self.labels, self.buckets) if n])
+
+class CommandStats:
+    """ Counters for a single SqueakNet command. """
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.sent = 0
+        self.received = 0
+        self.errors = 0
+
+class Stats:
+    """ Collects counters for FUSE operations, SqueakNet commands and caches. """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.lock.acquire()
+        try:
+            self.ops = {}
+            self.waits = {}
+            self.commands = {}
+            self.counters = {}
+        finally:
+            self.lock.release()
+
+    def recordOp(self, op, elapsed, roundtrips=0):
+        """ Records a completed FUSE operation and the round trips it cost. """
+
+        self.lock.acquire()
+        try:
+            h = self.ops.get(op)
+            if h is None:
+                h = self.ops[op] = Histogram()
+            h.add(elapsed)
+            h.roundtrips += roundtrips
+            if roundtrips > h.maxRoundtrips:
+                h.maxRoundtrips = roundtrips
+        finally:
+            self.lock.release()
+
+    def recordWait(self, queue, elapsed):
+        """ Records how long a command waited in a queue before it was sent. """
+
+        self.lock.acquire()
+        try:
+            h = self.waits.get(queue)
+            if h is None:
+                h = self.waits[queue] = Histogram()
+            h.add(elapsed)
+        finally:
+            self.lock.release()
+
+    def recordCommand(self, command, sent, received, elapsed, error=False):
+        """ Records a completed SqueakNet round trip. """
+
+        self.lock.acquire()
+        try:
+            c = self.commands.get(command)
+            if c is None:
+                c = self.commands[command] = CommandStats()
+            c.latency.add(elapsed)
+            c.sent += sent
+            c.received += received
+            if error:
+                c.errors += 1
+        finally:
+            self.lock.release()
+
+    def increment(self, name, n=1):
+        """ Increments a named event counter, such as reconnects. """
+
+        self.lock.acquire()
+        try:
+            self.counters[name] = self.counters.get(name, 0) + n
+        finally:
+            self.lock.release()
+
+    def report(self, caches=()):
+        """ Returns a human readable snapshot of all counters. """
+
+        self.lock.acquire()
+        try:
+            lines = ['[operations]']
+            for op in sorted(self.ops):
+                h = self.ops[op]
+                lines.append('%s count=%d mean=%.3fms max=%.3fms roundtrips=%d maxroundtrips=%d' \
+                        % (op, h.count, h.mean() * 1000, h.max * 1000, h.roundtrips, h.maxRoundtrips))
+                lines.append('  %s' % h.format())
+
+            lines.append('')
+            lines.append('[waits]')
+            for queue in sorted(self.waits):
+                h = self.waits[queue]
+                lines.append('%s count=%d mean=%.3fms max=%.3fms' \
+                        % (queue, h.count, h.mean() * 1000, h.max * 1000))
+                lines.append('  %s' % h.format())
+
+            lines.append('')
+            lines.append('[commands]')
+            for command in sorted(self.commands):
+                c = self.commands[command]
+                lines.append('%s count=%d errors=%d sent=%d received=%d mean=%.3fms max=%.3fms' \
+                        % (command, c.latency.count, c.errors, c.sent, c.received,
+                           c.latency.mean() * 1000, c.latency.max * 1000))
+                lines.append('  %s' % c.latency.format())
+
+            lines.append('')
+            lines.append('[events]')
+            for name in sorted(self.counters):
+                lines.append('%s %d' % (name, self.counters[name]))
+        finally:
+            self.lock.release()
+
+        lines.append('')
+        lines.append('[caches]')
+        for c in caches:
+            lookups = c.hits + c.misses
+            if lookups:
+                rate = 100.0 * c.hits / lookups
+            else:
+                rate = 0.0
+            lines.append('%s entries=%d hits=%d misses=%d hitrate=%.1f%%' \
+                    % (c.name, len(c), c.hits, c.misses, rate))
+        return '\n'.join(lines) + '\n'
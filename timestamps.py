@@ -0,0 +1,144 @@
+import re
+import time
+import logging
+
+import cache
+from squeakNet import SqueakNetException
+
+""" Modification times for methods, protocols and classes.
+
+Squeak records who last changed a method and when in the method's stamp, such
+as 'jbj 3/14/2008 12:34'. The stamps of all methods on one side of a class are
+fetched with a single command and cached, so listing every method of a class
+costs one extra round trip in total. A method stat'ed before the stamps of its
+class are cached gets its size and stamp from one command. Directories report
+the newest stamp of what is below them, which is what rsync, make and backups
+need to skip unchanged classes; a class directory asks the image for the
+newest stamp of the class, which also tells whether the class exists.
+
+"""
+
+# How long the stamps of a class are trusted, in seconds.
+ttl = 10
+
+stamps = cache.Cache('stamps', ttl)
+
+# Set when the server does not know the stamp commands, to stop asking.
+unsupported = []
+
+# Set when the server does not know the stat commands.
+unstatted = []
+
+# Set when the server does not know getLatestMethodStamp:.
+nolatest = []
+
+stamp_exp = re.compile('(\d+)/(\d+)/(\d+)(\s+(\d+):(\d+)(:(\d+))?\s*([aApP][mM])?)?')
+
+def parseStamp(stamp):
+    """ Converts a method stamp into seconds since the epoch, 0 if unknown. """
+
+    m = stamp_exp.search(stamp)
+    if m is None:
+        return 0
+    month, day, year, hour, minute, second = [int(x or 0) for x in m.group(1, 2, 3, 5, 6, 8)]
+    if year < 100:
+        year += year < 70 and 2000 or 1900
+    ampm = (m.group(9) or '').lower()
+    if ampm == 'pm' and hour < 12:
+        hour += 12
+    elif ampm == 'am' and hour == 12:
+        hour = 0
+    try:
+        return int(time.mktime((year, month, day, hour, minute, second, 0, 0, -1)))
+    except (ValueError, OverflowError):
+        return 0
+
+def methodTimes(sn, cls, classSide):
+    """ Returns a dictionary from selector to modification time. """
+
+    key = (cls, classSide)
+    try:
+        return stamps.get(key)
+    except KeyError:
+        pass
+    if unsupported:
+        return {}
+    try:
+        if classSide:
+            raw = sn.getClassMethodStamps(cls)
+        else:
+            raw = sn.getInstanceMethodStamps(cls)
+    except SqueakNetException, e:
+        if 'Unknown command' in e.errmsg:
+            logging.info("Server has no method stamps, all times will be 0")
+            unsupported.append(True)
+        return {}
+    times = dict([(sel, parseStamp(s)) for sel, s in raw.items()])
+    stamps.put(key, times)
+    return times
+
+def methodTime(sn, cls, method, classSide):
+    return methodTimes(sn, cls, classSide).get(method, 0)
+
+def methodStat(sn, cls, method, classSide, size):
+    """ Returns the size and modification time of a method.
+
+    size is called for the size when the stamps of the class are cached or
+    the server does not know the stat commands.
+
+    """
+
+    try:
+        times = stamps.get((cls, classSide))
+    except KeyError:
+        times = None
+    if times is None and not unsupported and not unstatted:
+        try:
+            if classSide:
+                n, stamp = sn.getClassMethodStat(cls, method)
+            else:
+                n, stamp = sn.getInstanceMethodStat(cls, method)
+            return n, parseStamp(stamp)
+        except SqueakNetException, e:
+            if 'Unknown command' not in e.errmsg:
+                raise
+            logging.info("Server has no stat commands, method times cost a round trip")
+            unstatted.append(True)
+    return size(), methodTime(sn, cls, method, classSide)
+
+def classTime(sn, cls):
+    """ Returns the newest modification time in a class.
+
+    Raises SqueakNetException if there is no such class, so that it also
+    serves as the existence check of a class directory.
+
+    """
+
+    if not unsupported and not nolatest:
+        try:
+            return parseStamp(sn.getLatestMethodStamp(cls))
+        except SqueakNetException, e:
+            if 'Unknown command' not in e.errmsg:
+                raise
+            logging.info("Server has no latest stamps, class times cost more round trips")
+            nolatest.append(True)
+    if not sn.isClassAvailable(cls):
+        raise SqueakNetException("Error: No such class %s" % cls, -1)
+    return latest(sn, cls)
+
+def latest(sn, cls, classSide=None, methods=None):
+    """ Returns the newest modification time on a side of a class.
+
+    With classSide None, both sides are considered. With methods, only those
+    selectors are considered, as for a protocol directory.
+
+    """
+
+    if classSide is None:
+        return max(latest(sn, cls, False), latest(sn, cls, True))
+    times = methodTimes(sn, cls, classSide)
+    if methods is not None:
+        times = [times.get(m, 0) for m in methods]
+    else:
+        times = times.values()
+    return max([0] + times)
@@ -0,0 +1,48 @@
+import os
+import logging
+import tempfile
+
+import asynclog
+
+class TestAsyncLog():
+    def setup_method(self, method):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def teardown_method(self, method):
+        logging.getLogger().handlers = []
+        os.remove(self.path)
+
+    def read(self):
+        f = open(self.path)
+        data = f.read()
+        f.close()
+        return data
+
+    def test_Level(self):
+        listener = asynclog.configure(self.path, 'INFO')
+        listener.start()
+        logging.debug("getattr %s", "/flat/Object")
+        logging.info("Initialized %s", "SqueakFS")
+        listener.stop()
+        data = self.read()
+        assert("Initialized SqueakFS" in data)
+        assert("getattr" not in data)
+
+    def test_ExcInfo(self):
+        listener = asynclog.configure(self.path, logging.DEBUG)
+        listener.start()
+        try:
+            raise ValueError("no such class")
+        except ValueError:
+            logging.debug("SqueakNet request failed", exc_info=True)
+        listener.stop()
+        data = self.read()
+        assert("SqueakNet request failed" in data and "ValueError: no such class" in data)
+
+    def test_UnknownLevel(self):
+        try:
+            asynclog.configure(self.path, 'CHATTY')
+        except ValueError:
+            return
+        assert(False)
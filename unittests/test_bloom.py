@@ -0,0 +1,99 @@
+import errno
+
+import bloom
+import cache
+import indexer
+import squeakNet
+import squeakfs
+import standin
+import stats
+
+class OldImage(standin.Image):
+    commands = dict(standin.Image.commands)
+    del commands['isClassMethodAvailable:inClass:']
+
+class TestBloom():
+    def setup_method(self, method):
+        cache.flush()
+        self.image = standin.synthesize(classes=5, methods=4)
+        self.server = standin.StandInServer(self.image)
+        self.server.start()
+        self.stats = stats.Stats()
+        self.membership = bloom.Membership(lambda: squeakNet.SqueakNet(self.server.port), depth=4)
+        self.sn = bloom.FilteredSqueakNet(squeakNet.SqueakNet(self.server.port), self.membership, self.stats)
+        self.parser = squeakfs.PathParser(self.sn, self.stats)
+
+    def teardown_method(self, method):
+        self.server.stop()
+
+    def cost(self, fn, *args):
+        self.sn.beginOperation()
+        result = fn(*args)
+        return result, self.sn.endOperation()[0]
+
+    def test_BloomFilter(self):
+        f = bloom.BloomFilter(1000, 0.01)
+        for i in range(1000):
+            f.add('Class%d' % i)
+        assert(not [i for i in range(1000) if 'Class%d' % i not in f])
+        false = len([i for i in range(10000) if 'Other%d' % i in f])
+        assert(false < 300)
+
+    def test_Misses(self):
+        self.membership.load(self.sn)
+        assert(self.cost(self.sn.isClassAvailable, 'NoSuchClass') == (False, 0))
+        assert(self.cost(self.sn.isClassAvailable, 'Class1') == (True, 1))
+        assert(self.cost(self.sn.isInstanceMethodAvailable, 'Class1', 'nosuch') == (False, 0))
+        assert(self.cost(self.sn.isClassMethodAvailable, 'Class1', 'new0') == (True, 1))
+        assert(self.cost(self.sn.isClassInCategory, 'Category-0', 'Class1') == (False, 0))
+        assert(self.cost(self.parser.parse('/flat/Class1/instance/method0~').getattr) == (-errno.ENOENT, 0))
+        assert(self.cost(self.parser.parse('/flat/Class1/instance/method0').getattr)[1] == 1)
+        assert(self.stats.counters['filtered'] == 4)
+
+    def test_Unloaded(self):
+        assert(self.cost(self.sn.isClassAvailable, 'NoSuchClass') == (False, 1))
+
+    def test_IndexerAddsMethods(self):
+        self.membership.load(self.sn)
+        self.image.addMethod('Class3', 'frobnicate', 'frobnicate\r\t^ 1')
+        assert(not self.sn.isInstanceMethodAvailable('Class3', 'frobnicate'))
+        ix = indexer.Indexer(lambda: squeakNet.SqueakNet(self.server.port))
+        ix.addConsumer(self.membership)
+        ix.scan(ix.connect())
+        assert(self.sn.isInstanceMethodAvailable('Class3', 'frobnicate'))
+
+    def test_Check(self):
+        self.membership.load(self.sn)
+        requests = self.server.requests
+        self.membership.check(self.sn)
+        # An unchanged image costs one small command.
+        assert(self.server.requests == requests + 1)
+        self.image.addClass('Frob', 'Object', 'Category-1')
+        self.membership.check(self.sn)
+        assert(self.server.requests > requests + 2)
+        assert(self.cost(self.sn.isClassAvailable, 'Frob') == (True, 1))
+
+    def test_Expired(self):
+        self.membership.load(self.sn)
+        self.membership.checked -= self.membership.fresh
+        # Not confirmed current lately: the image is asked.
+        assert(self.cost(self.sn.isClassAvailable, 'NoSuchClass') == (False, 1))
+
+    def test_isClassMethodAvailable(self):
+        sn = squeakNet.SqueakNet(self.server.port)
+        sn.beginOperation()
+        assert(sn.isClassMethodAvailable('Class1', 'new0'))
+        assert(not sn.isClassMethodAvailable('Class1', 'method0'))
+        assert(sn.endOperation()[0] == 2)
+
+    def test_isClassMethodAvailableOldImage(self):
+        server = standin.StandInServer(OldImage())
+        server.start()
+        try:
+            server.image.addClass('Class1', 'Object', 'Category-1')
+            server.image.addMethod('Class1', 'new0', 'new0\r\t^ self new', classSide=True)
+            sn = squeakNet.SqueakNet(server.port)
+            assert(sn.isClassMethodAvailable('Class1', 'new0'))
+            assert(not sn.isClassMethodAvailable('Class1', 'method0'))
+        finally:
+            server.stop()
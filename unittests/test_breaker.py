@@ -0,0 +1,144 @@
+import os
+import time
+import errno
+import socket
+import tempfile
+import threading
+
+import recording
+import squeakNet
+import squeakfs
+import standin
+
+class HungImage(standin.Image):
+    """ An image that stops answering while hung is set. """
+
+    def __init__(self):
+        standin.Image.__init__(self)
+        self.hung = threading.Event()
+
+    def answer(self, args):
+        while self.hung.isSet():
+            time.sleep(0.05)
+        return standin.Image.answer(self, args)
+
+class GarbageServer(threading.Thread):
+    """ Answers every line with a malformed length. """
+
+    def __init__(self):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self.sock = socket.socket()
+        self.sock.bind(('localhost', 0))
+        self.sock.listen(5)
+        self.port = self.sock.getsockname()[1]
+
+    def run(self):
+        while True:
+            try:
+                conn = self.sock.accept()[0]
+            except socket.error:
+                return
+            f = conn.makefile()
+            while f.readline():
+                conn.sendall('garbage\n')
+                f.flush()
+
+class TestBreaker():
+    def setup_method(self, method):
+        image = HungImage()
+        image.addClass('Class1', 'Object', 'Category-1')
+        image.addMethod('Class1', 'method0', 'method0\r\t^ 0')
+        self.image = image
+        self.server = standin.StandInServer(image)
+        self.server.start()
+        self.sn = squeakNet.SqueakNet(self.server.port, timeout=0.2)
+        self.sn.BACKOFF = 0.3
+
+    def teardown_method(self, method):
+        self.image.hung.clear()
+        self.server.stop()
+
+    def fails(self, fn, *args):
+        start = time.time()
+        try:
+            fn(*args)
+            assert(False)
+        except squeakNet.SqueakNetException, e:
+            return e.errnum, time.time() - start
+
+    def test_Timeout(self):
+        assert(self.sn.getNumberOfClasses() == 3)
+        self.image.hung.set()
+        errnum, elapsed = self.fails(self.sn.getNumberOfClasses)
+        assert(errnum == -3 and elapsed < 1)
+        assert(self.sn.stats.counters['timeouts'] == 1)
+
+    def test_FailFast(self):
+        self.image.hung.set()
+        self.fails(self.sn.getNumberOfClasses)
+        self.image.hung.clear()
+        # Within the backoff the image is not even asked.
+        errnum, elapsed = self.fails(self.sn.getNumberOfClasses)
+        assert(errnum == -2 and elapsed < 0.1)
+        time.sleep(0.35)
+        assert(self.sn.getNumberOfClasses() == 3)
+        assert(self.sn.failures == 0)
+
+    def test_Backoff(self):
+        self.server.stop()
+        self.fails(self.sn.getNumberOfClasses)
+        for i in range(3):
+            time.sleep(self.sn.retryAt - time.time())
+            self.fails(self.sn.getNumberOfClasses)
+        assert(self.sn.failures == 4)
+        assert(self.sn.retryAt - time.time() > 2)
+
+    def test_Heartbeat(self):
+        heartbeat = squeakNet.Heartbeat(0.1)
+        heartbeat.add(self.sn)
+        heartbeat.beat()
+        assert(self.sn.stats.counters.get('heartbeat failures', 0) == 0)
+        time.sleep(0.15)
+        self.server.stop()
+        heartbeat.beat()
+        assert(self.sn.sock is None)
+        assert(self.sn.stats.counters['heartbeat failures'] == 1)
+
+    def test_Errno(self):
+        parser = squeakfs.PathParser(self.sn, self.sn.stats)
+        res = parser.parse('/flat/Class1/instance/method0')
+        self.image.hung.set()
+        assert(res.getattr() == -errno.ETIMEDOUT)
+        assert(res.getattr() == -errno.EIO)
+
+    def test_BadLength(self):
+        server = GarbageServer()
+        server.start()
+        try:
+            sn = squeakNet.SqueakNet(server.port, timeout=0.5, framing='text')
+            errnum, elapsed = self.fails(sn.getNumberOfClasses)
+            assert(errnum == -2 and sn.sock is None)
+            # The lock was given up: other threads fail fast instead of hanging.
+            done = []
+            t = threading.Thread(target=lambda: done.append(self.fails(sn.getNumberOfClasses)))
+            t.start()
+            t.join(1)
+            assert(done and done[0][0] == -2)
+            # The answer to setFraming: is malformed as well.
+            errnum, elapsed = self.fails(squeakNet.SqueakNet, server.port, None, None, 'localhost', 0.5)
+            assert(errnum == -2)
+        finally:
+            server.sock.close()
+
+    def test_TimeoutRecorded(self):
+        path = tempfile.mktemp('.trace.gz')
+        recorder = recording.Recorder(path)
+        sn = squeakNet.SqueakNet(self.server.port, timeout=0.2, recorder=recorder)
+        self.image.hung.set()
+        self.fails(sn.getNumberOfClasses)
+        recorder.close()
+        try:
+            assert([r for c, r, t in recording.readTrace(path)] == ['Error: Timeout'])
+        finally:
+            os.remove(path)
@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+
+import export
+import standin
+from squeakNet import SqueakNetException
+
+class FlakyExporter(export.Exporter):
+    """ Loses the connection fetching Class3, the first times it does. """
+
+    def __init__(self, drops, *args, **kw):
+        export.Exporter.__init__(self, *args, **kw)
+        self.drops = drops
+
+    def fetch(self, sn, commands):
+        if commands[:1] == ['getSuperClass:\tClass3'] and self.drops:
+            self.drops -= 1
+            raise SqueakNetException("Connection lost", -2)
+        return export.Exporter.fetch(self, sn, commands)
+
+class TestExport():
+    def setup_class(cls):
+        cls.server = standin.StandInServer(standin.synthesize(classes=12, methods=6, depth=3))
+        cls.server.start()
+
+    def teardown_class(cls):
+        cls.server.stop()
+
+    def setup_method(self, method):
+        self.dest = tempfile.mkdtemp()
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.dest)
+
+    def read(self, *path):
+        f = open(os.path.join(self.dest, *path))
+        data = f.read()
+        f.close()
+        return data
+
+    def test_Flat(self):
+        e = export.Exporter(self.server.port, self.dest, workers=3, depth=4, out=None)
+        assert(e.run() == 0)
+        assert(sorted(os.listdir(os.path.join(self.dest, 'flat', 'Class4', 'instance'))) ==
+               sorted(self.server.image.getInstanceMethodsInClass('Class4')))
+        assert(self.read('flat', 'Class4', 'superclass') == 'Class1\n')
+        assert(self.read('flat', 'Class4', 'instance', 'method1:with:') ==
+               'method1: a with: b\n\t"Answer the sum."\n\t^ a + b + 1\n')
+        # Special selectors are named like SqueakFS names them.
+        assert(os.path.exists(os.path.join(self.dest, 'flat', 'Object', 'instance', '__SLASH__')))
+        assert(os.path.islink(os.path.join(self.dest, 'flat', 'Class0', 'traits', 'TTrait0')))
+
+    def test_HardLinks(self):
+        e = export.Exporter(self.server.port, self.dest, workers=2, out=None)
+        e.run()
+        flat = os.path.join(self.dest, 'flat', 'Class4', 'instance', 'method2')
+        category = os.path.join(self.dest, 'category', 'Category-4', 'Class4', 'instance', 'protocol-2', 'method2')
+        hierarchy = os.path.join(self.dest, 'hierarchy', 'ProtoObject', 'subclasses', 'Object', 'subclasses',
+                                 'Class0', 'subclasses', 'Class1', 'subclasses', 'Class4', 'instance', 'method2')
+        assert(os.stat(flat).st_ino == os.stat(category).st_ino == os.stat(hierarchy).st_ino)
+        assert(os.path.exists(os.path.join(self.dest, 'category', 'Category-4', 'Class4', 'instance', '--all--', 'method2')))
+
+    def test_SymLinks(self):
+        e = export.Exporter(self.server.port, self.dest, workers=1, depth=1, link='sym', out=None)
+        e.run()
+        comment = os.path.join(self.dest, 'category', 'Category-4', 'Class4', 'comment')
+        assert(os.path.islink(comment))
+        assert(open(comment).read() == self.read('flat', 'Class4', 'comment'))
+
+    def test_Retry(self):
+        e = FlakyExporter(2, self.server.port, self.dest, workers=1, depth=4, out=None)
+        assert(e.run() == 0)
+        assert(e.done == e.total)
+        assert(os.path.exists(os.path.join(self.dest, 'flat', 'Class3', 'superclass')))
+
+    def test_GiveUp(self):
+        e = FlakyExporter(export.Exporter.RETRIES, self.server.port, self.dest, workers=1, depth=4, out=None)
+        assert(e.run() == 1)
+        assert(e.failed == [('connection', 'Class3')])
+        assert(e.done == e.total - 1)
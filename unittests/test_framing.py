@@ -0,0 +1,59 @@
+import framing
+import squeakNet
+import standin
+
+class TestFraming():
+    def setup_method(self, method):
+        self.image = standin.synthesize(classes=5, methods=4)
+        self.image.addMethod('Class1', 'odd\tname', 'odd\tname\r\t^ 1', 'odd\rprotocol')
+        self.server = standin.StandInServer(self.image)
+        self.server.start()
+
+    def teardown_method(self, method):
+        self.server.stop()
+
+    def test_Fields(self):
+        fields = ['getClassComment:', '', 'a\tb', 'c\rd', 'x' * 70000]
+        assert(framing.decodeFields(framing.encodeFields(fields)) == fields)
+        assert(framing.decodeFields(framing.encodeFields([])) == [])
+
+    def test_Responses(self):
+        for value in ['text', ['a', 'b\rc'], True, False, 42]:
+            frame = framing.encodeResponse(value)
+            kind, size = framing.header.unpack_from(frame)
+            assert(framing.decodeResponse(kind, frame[framing.header.size:]) == value)
+        frame = framing.encodeError('Error: Unknown command', framing.UNKNOWN)
+        assert(framing.decodeResponse(framing.ERROR, frame[framing.header.size:]) ==
+               (framing.UNKNOWN, 'Error: Unknown command'))
+
+    def test_SameAnswers(self):
+        binary = squeakNet.SqueakNet(self.server.port)
+        text = squeakNet.SqueakNet(self.server.port, framing='text')
+        assert(binary.binary and not text.binary)
+        for sn in (binary, text):
+            sn.beginOperation()
+        for name, args in [('getAllClasses', ()), ('getInstanceMethod', ('Class2', 'method0')),
+                           ('isClassAvailable', ('Class2',)), ('isClassAvailable', ('Nothing',)),
+                           ('getInstanceMethodStamps', ('Class2',)), ('getNumberOfClasses', ()),
+                           ('getInstanceMethodSize', ('Class2', 'method0'))]:
+            assert(getattr(binary, name)(*args) == getattr(text, name)(*args))
+        # Negotiating is not a round trip of its own.
+        assert(binary.endOperation()[0] == text.endOperation()[0] == 7)
+
+    def test_Tabs(self):
+        sn = squeakNet.SqueakNet(self.server.port)
+        assert('odd\tname' in sn.getInstanceMethodsInClass('Class1'))
+        assert('odd\rprotocol' in sn.getInstanceProtocols('Class1'))
+        assert(sn.getInstanceMethod('Class1', 'odd\tname') == 'odd\tname\n\t^ 1\n')
+        assert(sn.getMethodsInInstanceProtocol('Class1', 'odd\rprotocol') == ['odd\tname'])
+
+    def test_Errors(self):
+        sn = squeakNet.SqueakNet(self.server.port)
+        try:
+            sn.getClassComment('Nothing')
+            assert(False)
+        except squeakNet.SqueakNetException, e:
+            assert(e.errnum == -1 and e.errmsg.startswith('Error:'))
+        results = sn.pipeline(['frobnicate', 'getAllClasses'])
+        assert('Unknown command' in results[0].errmsg)
+        assert('Class1' in results[1])
@@ -0,0 +1,70 @@
+import os
+import tempfile
+import py
+
+import imageindex
+import squeakNet
+import squeakfs
+import standin
+import stats
+
+class TestImageIndex():
+    def setup_class(cls):
+        cls.server = standin.StandInServer(standin.synthesize(classes=12, methods=6, depth=4))
+        cls.server.start()
+        cls.sn = squeakNet.SqueakNet(cls.server.port)
+        cls.path = tempfile.mktemp('.sqfs')
+        classes, categories = imageindex.Builder(cls.sn, depth=8).build()
+        imageindex.write(cls.path, classes, categories)
+        cls.index = imageindex.ImageIndex(cls.path)
+
+    def teardown_class(cls):
+        cls.index.close()
+        os.unlink(cls.path)
+        cls.server.stop()
+
+    def same(self, name, *args):
+        assert(getattr(self.index, name)(*args) == getattr(self.sn, name)(*args))
+
+    def test_Classes(self):
+        for name in ('getAllClasses', 'getAllTraits', 'getCategories', 'getNumberOfClasses'):
+            self.same(name)
+        for cls in ('Object', 'Class3', 'TTrait0'):
+            for name in ('getSuperClass', 'getSubClasses', 'getDirectSubClasses', 'getClassComment',
+                         'getClassMembers', 'getInstanceMembers', 'getTraits', 'isTrait',
+                         'getInstanceProtocols', 'getClassProtocols', 'fileOutClass',
+                         'getInstanceMethodsInClass', 'getClassMethodsInClass',
+                         'getInstanceMethodStamps', 'getClassMethodStamps',
+                         'getInstanceMessagesSent', 'isClassAvailable'):
+                self.same(name, cls)
+        self.same('getTraitUsers', 'TTrait0')
+        self.same('getClassesInCategory', 'Category-3')
+        self.same('fileOutCategory', 'Category-3')
+        assert(not self.index.isClassAvailable('NoSuchClass'))
+
+    def test_Methods(self):
+        self.same('getInstanceMethod', 'Object', '__SLASH__')
+        self.same('getInstanceMethod', 'Class3', 'method1:with:')
+        self.same('getClassMethod', 'Class3', 'new0')
+        self.same('getMethodsInInstanceProtocol', 'Class3', 'protocol-1')
+        self.same('isInstanceMethodInProtocol', 'method1:with:', 'protocol-1', 'Class3')
+        self.same('isInstanceMethodInProtocol', 'method1:with:', 'protocol-2', 'Class3')
+        self.same('isClassInCategory', 'Category-3', 'Class3')
+        py.test.raises(squeakNet.SqueakNetException, self.index.getInstanceMethod, 'Class3', 'nothing')
+        assert(self.index.isInstanceMethodAvailable('Class3', 'method0'))
+        assert(not self.index.isClassMethodAvailable('Class3', 'method0'))
+
+    def test_Pipeline(self):
+        commands = ['getInstanceMethodStamps:\tClass5', 'getInstanceMethod:InClass:\tmethod0\tClass5',
+                    'getClassesInCategory:\tCategory-1', 'isTrait:\tClass5', 'frobnicate']
+        expected = self.sn.pipeline(commands)
+        found = self.index.pipeline(commands)
+        assert(found[:4] == expected[:4])
+        assert(found[3] is False)
+        assert('Unknown command' in found[4].errmsg)
+
+    def test_Mount(self):
+        parser = squeakfs.PathParser(self.index, stats.Stats())
+        assert('method0' in parser.parse('/flat/Class3/instance').readdir(0))
+        assert(parser.parse('/category/Category-3/Class3/instance/protocol-1/method1:with:').getattr().st_size > 0)
+        assert(parser.parse('/hierarchy/ProtoObject/subclasses/Object/subclasses/Class0/comment').getattr().st_size > 0)
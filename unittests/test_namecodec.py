@@ -0,0 +1,84 @@
+import errno
+
+import namecodec
+import squeakNet
+import squeakfs
+import standin
+import stats
+
+class TestNameCodec():
+    def test_Roundtrip(self):
+        codec = namecodec.NameCodec()
+        for name in ['/', '//', '*', '\\\\', 'a/b*c\\d', 'printOn:']:
+            assert(codec.decode(codec.encode(name)) == name)
+        assert(codec.encode('//') == '__SLASH____SLASH__')
+        assert(codec.encode('\\\\') == '__BACKSLASH____BACKSLASH__')
+        # Only names that change are kept.
+        assert(len(codec) == 5)
+
+    def test_Tokens(self):
+        codec = namecodec.NameCodec()
+        names = ['__SLASH__', '/', 'a__STAR__b', 'a*b', '__BACKSLASH__*', '_/_', 'a_b', '___', 'x__UNDERSCORE__']
+        shown = codec.encodeAll(names)
+        assert(len(set(shown)) == len(names))
+        assert(shown[6] == 'a_b')
+        for name, display in zip(names, shown):
+            assert(codec.decode(display) == name)
+            # Also when never listed.
+            assert(namecodec.NameCodec().decode(display) == name)
+
+    def test_EncodeAll(self):
+        codec = namecodec.NameCodec()
+        names = ['printOn:', 'yourself']
+        assert(codec.encodeAll(names) == names)
+        assert(codec.encodeAll([]) == [])
+        assert(codec.encodeAll(['+', '*', 'x']) == ['+', '__STAR__', 'x'])
+        # Never listed, decoded by replacing the tokens.
+        assert(codec.decode('__STAR____SLASH__') == '*/')
+        assert(codec.decode('at:put:') == 'at:put:')
+
+class TestSpecialNames():
+    def setup_method(self, method):
+        self.image = standin.synthesize(classes=3, methods=2)
+        for sel in ['%', '?', '>>', '~~']:
+            self.image.addMethod('Object', sel, '%s anObject\r\t^ self' % sel, 'arithmetic')
+        for protocol in ["drag'n'drop", 'windows & flaps menu', 'context stack (message list)',
+                         'gsm 6.10 codec', 'a/b']:
+            self.image.addMethod('Class1', 'm%d' % len(protocol), 'm\r\t^ 1', protocol)
+        self.image.addClass('Frob', 'Object', 'Graphics-Display Objects (old).')
+        self.server = standin.StandInServer(self.image)
+        self.server.start()
+        self.sn = squeakNet.SqueakNet(self.server.port)
+        self.parser = squeakfs.PathParser(self.sn, stats.Stats())
+
+    def teardown_method(self, method):
+        self.server.stop()
+
+    def test_Selectors(self):
+        listed = self.parser.parse('/flat/Object/instance').readdir(0)
+        shown = namecodec.encodeAll(['%', '?', '>>', '~~'] + standin.binary_selectors)
+        for name in shown:
+            assert(name in listed)
+            res = self.parser.parse('/flat/Object/instance/' + name)
+            assert(res.getattr().st_size > 0)
+        assert(self.parser.parse('/flat/Object/instance/__SLASH____SLASH__').read(100, 0)
+               .startswith('// anObject'))
+
+    def test_Protocols(self):
+        listed = self.parser.parse('/category/Category-1/Class1/instance').readdir(0)
+        assert('a__SLASH__b' in listed)
+        for protocol in listed:
+            res = self.parser.parse('/category/Category-1/Class1/instance/' + protocol)
+            assert(res.readdir(0))
+        assert(self.parser.parse('/category/Graphics-Display Objects (old).').readdir(0) == ['Frob', 'source.st'])
+        assert(self.parser.parse('/flat/Class1/instance/nothing').getattr() == -errno.ENOENT)
+
+    def test_Mount(self):
+        fs = squeakfs.SqueakFS()
+        fs.initializeConnection(self.server.port)
+        for path in ['/flat/Object/instance', '/category/Category-1/Class1/instance']:
+            listed = [e.name for e in fs.readdir(path, 0)]
+            assert(listed == self.parser.parse(path).readdir(0))
+            for name in listed:
+                assert(not isinstance(fs.getattr(path + '/' + name), int))
+        assert('__SLASH____SLASH__' in [e.name for e in fs.readdir('/flat/Object/instance', 0)])
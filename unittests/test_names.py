@@ -0,0 +1,53 @@
+import names
+import warmer
+
+class TestNames():
+    def setup_method(self, method):
+        self.table = names.NameTable()
+
+    def test_Intern(self):
+        a = self.table.intern('printOn:')
+        b = self.table.intern('yourself')
+        assert(a != b)
+        assert(self.table.intern('printOn:') == a)
+        assert(self.table.name(b) == 'yourself')
+        assert(self.table.find('unknown') is None)
+        assert(len(self.table) == 2)
+        assert(self.table.size() == len('printOn:yourself') + 3 * 4)
+
+    def test_Unicode(self):
+        id = self.table.intern(u'gr\xfc\xdf')
+        assert(self.table.find('gr\xc3\xbc\xc3\x9f') == id)
+        assert(self.table.name(id) == 'gr\xc3\xbc\xc3\x9f')
+
+    def test_Collisions(self):
+        a = self.table.intern('a')
+        b = self.table.intern('b')
+        # Names sharing a hash share a slot.
+        self.table.slots = {hash('a'): (b, a), hash('b'): (a, b)}
+        assert(self.table.find('a') == a and self.table.find('b') == b)
+        assert(self.table.intern('b') == b and len(self.table) == 2)
+
+    def test_EncodeDecode(self):
+        ids = self.table.encode(['a', 'b', 'a', ''])
+        assert(ids.typecode == 'I' and ids[0] == ids[2])
+        assert(self.table.decode(ids) == ['a', 'b', 'a', ''])
+
+    def test_Pack(self):
+        packed = names.pack(['Object', 'Class1'])
+        assert(packed.typecode == 'I')
+        assert(names.unpack(packed) == ['Object', 'Class1'])
+        assert(names.pack('source') == 'source')
+        assert(names.unpack('source') == 'source')
+        assert(names.unpack(names.pack([])) == [])
+
+    def test_CachedListings(self):
+        class Image:
+            def getInstanceMethodsInClass(self, cls):
+                return ['method0', 'method1:with:']
+        responses = warmer.cache.Cache('test-names')
+        sn = warmer.CachingSqueakNet(Image(), responses)
+        assert(sn.getInstanceMethodsInClass('Class1') == ['method0', 'method1:with:'])
+        value, stamp = responses.entries[('getInstanceMethodsInClass', ('Class1',))]
+        assert(value.typecode == 'I')
+        assert(sn.getInstanceMethodsInClass('Class1') == ['method0', 'method1:with:'])
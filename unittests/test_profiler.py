@@ -0,0 +1,28 @@
+import os
+import glob
+import pstats
+import shutil
+import tempfile
+
+import profiler
+
+class TestProfiler():
+    def setup_method(self, method):
+        self.dir = tempfile.mkdtemp()
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.dir)
+
+    def test_runcall(self):
+        prof = profiler.Profiler(self.dir, 3600)
+        assert(prof.runcall(lambda x: x * 2, 21) == 42)
+        assert(glob.glob(os.path.join(self.dir, '*.pstats')) == [])
+        prof.dumpAll()
+        files = glob.glob(os.path.join(self.dir, '*.pstats'))
+        assert(len(files) == 1)
+        assert(pstats.Stats(*files).total_calls > 0)
+
+    def test_PeriodicDump(self):
+        prof = profiler.Profiler(self.dir, 0)
+        prof.runcall(sorted, [3, 2, 1])
+        assert(len(glob.glob(os.path.join(self.dir, '*.pstats'))) == 1)
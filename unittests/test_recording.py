@@ -0,0 +1,57 @@
+import os
+import tempfile
+
+import py
+
+import squeakNet
+import standin
+import recording
+
+class TestRecording():
+    def setup_method(self, method):
+        fd, self.path = tempfile.mkstemp(suffix='.trace.gz')
+        os.close(fd)
+        os.remove(self.path)
+        self.live = standin.StandInServer(standin.synthesize(classes=10))
+        self.live.start()
+
+    def teardown_method(self, method):
+        self.live.stop()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def session(self, sn):
+        return (sn.getAllClasses(),
+                sn.getSuperClass("Class3"),
+                sn.getInstanceMethod("Class3", "method2"),
+                sn.getClassComment("Class3"),
+                sn.isClassAvailable("NoSuchClass"))
+
+    def test_RecordAndReplay(self):
+        recorder = recording.Recorder(self.path)
+        expected = self.session(squeakNet.SqueakNet(self.live.port, recorder=recorder))
+        recorder.close()
+        assert(len(list(recording.readTrace(self.path))) == 5)
+
+        replay = standin.StandInServer(recording.ReplayImage(self.path, latency=0.001))
+        replay.start()
+        try:
+            sn = squeakNet.SqueakNet(replay.port)
+            assert(self.session(sn) == expected)
+            py.test.raises(squeakNet.SqueakNetException, sn.getSuperClass, "Class4")
+        finally:
+            replay.stop()
+
+    def test_ReplayInOrder(self):
+        recorder = recording.Recorder(self.path)
+        sn = squeakNet.SqueakNet(self.live.port, recorder=recorder)
+        sn.getClassComment("Class1")
+        self.live.image.cls("Class1").comment = "Changed"
+        sn.getClassComment("Class1")
+        recorder.close()
+
+        image = recording.ReplayImage(self.path)
+        first = image.respond("getClassComment:\tClass1")
+        assert(first.startswith("Comment of Class1"))
+        assert(image.respond("getClassComment:\tClass1") == "Changed")
+        assert(image.respond("getClassComment:\tClass1") == "Changed")
@@ -0,0 +1,68 @@
+import threading
+
+import py
+import replicas
+import squeakNet
+import standin
+import stats
+
+class TestReplicas():
+    def setup_method(self, method):
+        self.image = standin.synthesize(classes=5, methods=4)
+        self.servers = [standin.StandInServer(self.image) for i in range(3)]
+        for server in self.servers:
+            server.start()
+        self.stats = stats.Stats()
+        self.pool = replicas.ReplicaPool([('localhost', s.port) for s in self.servers], self.stats)
+
+    def teardown_method(self, method):
+        for server in self.servers:
+            server.stop()
+
+    def test_ParseEndpoints(self):
+        assert(replicas.parseEndpoints('40000') == [('localhost', 40000)])
+        assert(replicas.parseEndpoints('a:1, b:2,3') == [('a', 1), ('b', 2), ('localhost', 3)])
+
+    def test_Commands(self):
+        assert(self.pool.getAllClasses()[:2] == ['Class0', 'Class1'])
+        assert(self.pool.isClassAvailable('Class1'))
+        assert(not self.pool.isClassAvailable('NoSuchClass'))
+        py.test.raises(squeakNet.SqueakNetException, self.pool.getInstanceMethod, 'Class1', 'nothing')
+        assert(self.pool.convertSpecial('/') == '__SLASH__')
+        self.pool.beginOperation()
+        self.pool.pipeline(['getAllClasses', 'getCategories'])
+        assert(self.pool.endOperation()[0] == 2)
+
+    def test_Spread(self):
+        requests = [s.requests for s in self.servers]
+        def work():
+            for i in range(20):
+                self.pool.getInstanceMethodsInClass('Class1')
+        threads = [threading.Thread(target=work) for i in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        served = [s.requests - r for s, r in zip(self.servers, requests)]
+        assert(sum(served) == 120)
+        assert(min(served) > 0)
+
+    def test_Failover(self):
+        for i in range(6):
+            self.pool.getAllClasses()
+        port = self.servers[1].port
+        self.servers[1].stop()
+        for i in range(6):
+            assert(self.pool.isClassAvailable('Class2'))
+        assert([e.healthy for e in self.pool.endpoints] == [True, False, True])
+        assert(self.stats.counters.get('failovers') == 1)
+
+        self.servers[1] = standin.StandInServer(self.image, port)
+        self.servers[1].start()
+        self.pool.check()
+        assert([e.healthy for e in self.pool.endpoints] == [True, True, True])
+
+    def test_AllDown(self):
+        for server in self.servers:
+            server.stop()
+        py.test.raises(squeakNet.SqueakNetException, self.pool.getAllClasses)
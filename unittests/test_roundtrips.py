@@ -0,0 +1,167 @@
+import os
+import cache
+import resource
+import squeakNet
+import squeakfs
+import standin
+import stats
+
+""" Round trip budgets per FUSE operation.
+
+Round trips to the image are what makes SqueakFS slow, so every change that
+adds commands to a common operation should have to raise a number in here.
+The operations run against the stand-in server, the way SqueakFS runs them:
+parse the path, then call the operation on the resulting resource.
+
+"""
+
+# Maximum number of SqueakNet commands per operation, with cold caches.
+FLAT_METHOD_GETATTR = 1
+FLAT_CLASS_GETATTR = 1
+FLAT_READDIR_INSTANCE = 1
+HIERARCHY_GETATTR_DEEP = 12
+CATEGORY_METHOD_GETATTR = 3
+COMMENT_READ_64K = 2      # getattr and one ranged read with read-ahead
+FILEOUT_CLASS_READ = 2    # getattr, open and reads until EOF
+OPEN_METHOD = 1           # the hash of the source
+
+class TestRoundTrips():
+    def setup_class(cls):
+        image = standin.synthesize(classes=20, methods=10, depth=12, comment=64 * 1024)
+        cls.image = image
+        cls.server = standin.StandInServer(image)
+        cls.server.start()
+
+    def teardown_class(cls):
+        cls.server.stop()
+
+    def setup_method(self, method):
+        self.sn = squeakNet.SqueakNet(self.server.port)
+        self.parser = squeakfs.PathParser(self.sn, stats.Stats())
+        cache.flush()
+
+    def cost(self, fn, *args):
+        self.sn.beginOperation()
+        result = fn(*args)
+        roundtrips, trace = self.sn.endOperation()
+        return result, roundtrips
+
+    def getattr(self, path):
+        return self.cost(lambda: self.parser.parse(path).getattr())
+
+    def test_FlatMethodGetattr(self):
+        st, n = self.getattr('/flat/Class3/instance/method1:with:')
+        assert(st.st_size > 0)
+        assert(n <= FLAT_METHOD_GETATTR)
+
+    def test_FlatClassGetattr(self):
+        st, n = self.getattr('/flat/Class3')
+        assert(n <= FLAT_CLASS_GETATTR)
+
+    def test_FlatReaddir(self):
+        entries, n = self.cost(lambda: self.parser.parse('/flat/Class3/instance').readdir(0))
+        assert('method2' in entries)
+        assert(n <= FLAT_READDIR_INSTANCE)
+
+    def test_HierarchyGetattrTenDeep(self):
+        path = '/hierarchy/ProtoObject/subclasses/Object/subclasses' \
+            + ''.join(['/Class%d/subclasses' % i for i in range(9)]) + '/Class9/comment'
+        st, n = self.getattr(path)
+        assert(st.st_size > 0)
+        assert(n <= HIERARCHY_GETATTR_DEEP)
+
+    def test_CategoryMethodGetattr(self):
+        st, n = self.getattr('/category/Category-3/Class3/instance/protocol-1/method1:with:')
+        assert(st.st_size > 0)
+        assert(n <= CATEGORY_METHOD_GETATTR)
+
+    def test_CommentRead64K(self):
+        path = '/flat/Class3/comment'
+        st, total = self.getattr(path)
+        offset = 0
+        while True:
+            buf, n = self.cost(lambda: self.parser.parse(path).read(4096, offset))
+            total += n
+            if not buf:
+                break
+            offset += len(buf)
+        assert(offset == 64 * 1024 + 1)
+        assert(total <= COMMENT_READ_64K)
+
+    def test_CommentHead(self):
+        readahead = resource.readahead
+        resource.readahead = 4096
+        try:
+            path = '/flat/Class4/comment'
+            st = self.parser.parse(path).getattr()
+            buf = self.parser.parse(path).read(4096, 0)
+        finally:
+            resource.readahead = readahead
+        assert(st.st_size == 64 * 1024 + 1)
+        assert(buf == self.sn.getClassComment('Class4')[:4096])
+        # Only the head and the next window were sent.
+        assert(self.sn.stats.commands['getClassComment:from:size:'].received < 3 * 4096)
+
+    def test_RangedMethodRead(self):
+        path = '/flat/Class3/instance/method1:with:'
+        size = self.parser.parse(path).getattr().st_size
+        readahead = resource.readahead
+        resource.readahead = 3
+        try:
+            data = ''
+            while True:
+                buf = self.parser.parse(path).read(5, len(data))
+                if not buf:
+                    break
+                data += buf
+        finally:
+            resource.readahead = readahead
+        assert(data == self.sn.getInstanceMethod('Class3', 'method1:with:'))
+        assert(len(data) == size)
+
+    def test_RangeEdges(self):
+        text = self.sn.getInstanceMethod('Class3', 'method1:with:')
+        for offset in (0, 1, len(text) - 2, len(text) - 1, len(text), len(text) + 1, len(text) + 10):
+            for size in (0, 1, 2, 5, len(text) + 5):
+                assert(self.sn.getInstanceMethodRange('Class3', 'method1:with:', offset, size) ==
+                       text[offset:offset + size])
+
+    def test_FileOutClassRead(self):
+        path = '/flat/Class3/source.st'
+        st, total = self.getattr(path)
+        assert(st.st_size == 0)
+        handle, n = self.cost(lambda: self.parser.parse(path).open(os.O_RDONLY))
+        total += n
+        data = ''
+        while True:
+            buf = handle.read(4096, len(data))
+            if not buf:
+                break
+            data += buf
+        assert(data.startswith('Class2 subclass: #Class3\n'))
+        assert('^ self method3: 2 with: 1! !' in data)
+        assert(total <= FILEOUT_CLASS_READ)
+
+    def test_FileOutCategory(self):
+        assert('source.st' in self.parser.parse('/category/Category-3').readdir(0))
+        handle = self.parser.parse('/category/Category-3/source.st').open(os.O_RDONLY)
+        assert('subclass: #Class3\n' in handle.data and 'subclass: #Class13\n' in handle.data)
+        assert(self.parser.parse('/category/Category-3/Class4/source.st').getattr() < 0)
+        assert(self.parser.parse('/category/Nonexistent/source.st').getattr() < 0)
+
+    def test_OpenKeepsCache(self):
+        self.image.addMethod('Class5', 'frob', 'frob\r\t^ 1')
+        path = '/flat/Class5/instance/frob'
+        handle, n = self.cost(lambda: self.parser.parse(path).open(os.O_RDONLY))
+        assert(not handle.keep_cache and not handle.direct_io)
+        assert(n <= OPEN_METHOD)
+        assert(self.parser.parse(path).read(100, 0) == 'frob\n\t^ 1\n')
+        # Unchanged: the kernel may serve reads from the pages it cached.
+        handle, n = self.cost(lambda: self.parser.parse(path).open(os.O_RDONLY))
+        assert(handle.keep_cache and n <= OPEN_METHOD)
+        self.image.addMethod('Class5', 'frob', 'frob\r\t^ 2')
+        assert(not self.parser.parse(path).open(os.O_RDONLY).keep_cache)
+        assert(self.parser.parse(path).read(100, 0) == 'frob\n\t^ 2\n')
+        assert(self.parser.parse('/flat/Class5/comment').open(os.O_RDONLY).keep_cache is False)
+        assert(self.parser.parse('/flat/Class5/comment').open(os.O_RDONLY).keep_cache is True)
+        assert(self.parser.parse('/flat/Class5/instance/nothing').open(os.O_RDONLY) < 0)
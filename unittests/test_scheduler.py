@@ -0,0 +1,110 @@
+import time
+import threading
+
+import scheduler
+import squeakfs
+import squeakNet
+import standin
+import stats
+
+class SlowImage(standin.Image):
+    """ An image that takes a while for every command, and remembers the order. """
+
+    def __init__(self, image, delay):
+        self.__dict__.update(image.__dict__)
+        self.delay = delay
+        self.served = []
+
+    def answer(self, args):
+        time.sleep(self.delay)
+        self.served.append('\t'.join(args))
+        return standin.Image.answer(self, args)
+
+class TestClassifier():
+    def test_Interactive(self):
+        c = scheduler.Classifier(window=1.0, rate=10, scan=3)
+        for i in range(5):
+            assert(c.classify(1, '/flat/Class1/instance/m%d' % i, 100 + i * 0.01) == scheduler.INTERACTIVE)
+
+    def test_Rate(self):
+        c = scheduler.Classifier(window=1.0, rate=10, scan=3)
+        kinds = [c.classify(1, '/flat/Class1/comment', 100 + i * 0.01) for i in range(12)]
+        assert(kinds[:10] == [scheduler.INTERACTIVE] * 10 and kinds[10:] == [scheduler.BULK] * 2)
+        assert(c.classify(2, '/flat/Class1/comment', 100.2) == scheduler.INTERACTIVE)
+        # Quiet for a window: interactive again.
+        assert(c.classify(1, '/flat/Class1/comment', 101.5) == scheduler.INTERACTIVE)
+
+    def test_Scan(self):
+        c = scheduler.Classifier(window=1.0, rate=100, scan=3)
+        kinds = [c.classify(1, '/flat/Class%d/comment' % i, 100 + i * 0.01) for i in range(5)]
+        assert(kinds == [scheduler.INTERACTIVE] * 3 + [scheduler.BULK] * 2)
+
+class TestScheduler():
+    def setup_method(self, method):
+        self.image = SlowImage(standin.synthesize(classes=5, methods=4), 0.005)
+        self.server = standin.StandInServer(self.image)
+        self.server.start()
+        self.stats = stats.Stats()
+        self.scheduler = scheduler.Scheduler(lambda: squeakNet.SqueakNet(self.server.port), 1, stats=self.stats)
+        self.scheduler.start()
+
+    def teardown_method(self, method):
+        self.scheduler.stop()
+        self.server.stop()
+
+    def test_Commands(self):
+        self.scheduler.beginOperation()
+        assert('Class1' in self.scheduler.getAllClasses())
+        assert(not self.scheduler.isClassAvailable('NoSuchClass'))
+        assert(self.scheduler.endOperation()[0] == 2)
+        assert(self.scheduler.convertSpecial('/') == '__SLASH__')
+
+    def flood(self, origin, threads=16, n=10):
+        """ Keeps threads commands from origin queued at all times. """
+
+        def bulk():
+            self.scheduler.local.origin = origin
+            for i in range(n):
+                self.scheduler.getInstanceMethodsInClass('Class%d' % (i % 5))
+        threads = [threading.Thread(target=bulk) for i in range(threads)]
+        for t in threads:
+            t.start()
+        time.sleep(0.05)
+        return threads
+
+    def waited(self, command, *args):
+        """ Returns how many commands were served between sending command and its answer. """
+
+        before = len(self.image.served)
+        getattr(self.scheduler, command)(*args)
+        return len(self.image.served) - before - 1
+
+    def test_InteractiveFirst(self):
+        threads = self.flood('cp')
+        self.scheduler.local.origin = scheduler.INTERACTIVE
+        # Sixteen bulk commands were queued; the comment only waits for the one in flight.
+        assert(self.waited('getClassComment', 'Class1') <= 1)
+        for t in threads:
+            t.join()
+        # Waits are not FUSE operations.
+        assert(self.stats.waits['interactive'].count == 1 and self.stats.waits['bulk'].count == 160)
+        assert(not self.stats.ops)
+
+    def test_BulkRoundRobin(self):
+        threads = self.flood('cp')
+        self.scheduler.local.origin = 'grep'
+        for i in range(3):
+            # Every other bulk command is ours, however many cp has queued.
+            assert(self.waited('getClassComment', 'Class1') <= 2)
+        for t in threads:
+            t.join()
+
+    def test_Mount(self):
+        fs = squeakfs.SqueakFS()
+        fs.initializeConnection(self.server.port, heartbeat=30)
+        sn = fs.sn
+        fs.initializeScheduler('on', 2)
+        # The connection made at mount is a worker's, not left open beside them.
+        assert(fs.scheduler.connections[0] is sn)
+        assert(len(fs.scheduler.connections) == 2)
+        assert(sorted(fs.heartbeat.connections.keys()) == sorted(fs.scheduler.connections))
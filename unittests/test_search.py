@@ -0,0 +1,52 @@
+import indexer
+import search
+import squeakNet
+import standin
+
+class TestSearch():
+    def setup_method(self, method):
+        self.image = standin.synthesize(classes=5, methods=4)
+        self.server = standin.StandInServer(self.image)
+        self.server.start()
+        self.index = search.SearchIndex()
+        self.indexer = indexer.Indexer(lambda: squeakNet.SqueakNet(self.server.port), depth=4)
+        self.indexer.addConsumer(self.index)
+        self.sn = squeakNet.SqueakNet(self.server.port)
+
+    def teardown_method(self, method):
+        self.server.stop()
+
+    def test_tokens(self):
+        words = search.tokens('at:put:', 'at: index put: anObject\n\t^ self basicAt: index put: anObject')
+        assert('at:put:' in words and 'basicat:' in words and 'basicat' in words and 'anobject' in words)
+
+    def test_Search(self):
+        self.indexer.scan(self.sn)
+        hits = self.index.search('primitiveFailed')
+        assert(('Object', False, '+') in hits)
+        assert(('Class2', False, 'method1:with:') in self.index.search('ANSWER sum'))
+        assert(('Class2', False, 'method0') not in self.index.search('answer sum'))
+        assert(('Class2', True, 'new0') in self.index.search('new0'))
+
+    def test_IncrementalUpdate(self):
+        self.indexer.scan(self.sn)
+        requests = self.server.requests
+        self.indexer.scan(self.sn)
+        # Nothing changed, so only the class lists and stamps are fetched.
+        assert(self.server.requests - requests == 2 + len(self.indexer.known))
+
+        self.image.addMethod('Class3', 'method0', 'method0\r\t^ #frobnicate', 'protocol-0', False, 'x 1/1/2010 10:00')
+        del self.image.cls('Class4').instanceMethods['method2']
+        self.indexer.scan(self.sn)
+        assert(self.index.search('frobnicate') == [('Class3', False, 'method0')])
+        assert(('Class3', False, 'method0') not in self.index.search('constant'))
+        assert(('Class4', False, 'method2') not in self.index.search('method2'))
+
+    def test_Parser(self):
+        self.indexer.scan(self.sn)
+        parser = search.SearchPathParser(self.index)
+        assert('Class1>>method1:with:' in parser.parse('/sum').readdir(0))
+        link = parser.parse('/sum/Class1>>method1:with:')
+        assert(link.readlink() == '../../flat/Class1/instance/method1:with:')
+        assert(parser.parse('/sum/Class1>>method0').getattr() < 0)
+        assert(parser.parse('/new0/Class1 class>>new0').readlink() == '../../flat/Class1/class/new0')
@@ -0,0 +1,130 @@
+import os
+import shutil
+import tempfile
+
+import cache
+import namecodec
+import sourcefiles
+import squeakNet
+import squeakfs
+import standin
+import stats
+
+class OldImage(standin.Image):
+    """ An image whose server does not know the pointer commands. """
+
+    commands = dict([(k, v) for k, v in standin.Image.commands.items() if 'Pointers' not in k])
+
+class TestSourceFiles():
+    def setup_method(self, method):
+        self.dir = tempfile.mkdtemp()
+        self.sources = os.path.join(self.dir, 'Squeak.sources')
+        self.changes = os.path.join(self.dir, 'Squeak.changes')
+        self.image = standin.synthesize(classes=4, methods=4)
+        self.image.addMethod('Class1', 'bang', "bang\r\t^ 'wow!' , '!!'", 'exclamations')
+        self.image.writeSources(self.sources)
+        open(self.changes, 'wb').close()
+        self.server = standin.StandInServer(self.image)
+        self.server.start()
+        self.stats = stats.Stats()
+        self.files = sourcefiles.SourceFiles([self.sources, self.changes])
+        self.plain = squeakNet.SqueakNet(self.server.port)
+        self.sn = self.connect()
+
+    def teardown_method(self, method):
+        self.files.close()
+        self.server.stop()
+        shutil.rmtree(self.dir)
+
+    def connect(self):
+        return sourcefiles.SourceSqueakNet(squeakNet.SqueakNet(self.server.port), self.files,
+                                           self.stats, cache.Cache('test-pointers'))
+
+    def test_Chunks(self):
+        f = open(self.changes, 'wb')
+        f.write("!Foo methodsFor: 'x'!\rfoo\r\t^ 'a!!b'! !\rbar! !")
+        f.close()
+        position = len("!Foo methodsFor: 'x'!\r")
+        assert(self.files.chunk(2, position) == "foo\r\t^ 'a!b'")
+        assert(self.files.chunk(2, position + len("foo\r\t^ 'a!!b'! !\r")) == 'bar')
+        assert(self.files.chunk(2, 10000) is None)
+        # Without a terminator, not even after remapping.
+        f = open(self.changes, 'ab')
+        f.write("\rbaz\r\t^ 1")
+        f.close()
+        assert(self.files.chunk(2, len("!Foo methodsFor: 'x'!\rfoo\r\t^ 'a!!b'! !\rbar! !\r")) is None)
+        # Until the rest of the chunk is written.
+        f = open(self.changes, 'ab')
+        f.write("0! !")
+        f.close()
+        assert(self.files.chunk(2, len("!Foo methodsFor: 'x'!\rfoo\r\t^ 'a!!b'! !\rbar! !\r")) == "baz\r\t^ 10")
+        assert(self.files.chunk(3, 0) is None)
+
+    def test_SameSources(self):
+        for name in ['Object', 'Class1', 'Class3']:
+            for classSide, side in [(False, 'Instance'), (True, 'Class')]:
+                selectors = self.image.cls(name).methods(classSide).keys()
+                for sel in namecodec.encodeAll(selectors):
+                    for command, args in [('get%sMethod', ()), ('get%sMethodSize', ()),
+                                          ('get%sMethodHash', ()), ('get%sMethodRange', (3, 10))]:
+                        command = command % side
+                        assert(getattr(self.sn, command)(name, sel, *args) ==
+                               getattr(self.plain, command)(name, sel, *args))
+        assert(self.sn.getInstanceMethod('Class1', 'bang') == "bang\n\t^ 'wow!' , '!!'\n")
+
+    def test_NoSourceTraffic(self):
+        self.sn.getInstanceMethod('Class2', 'method0')
+        requests = self.server.requests
+        for sel in self.image.cls('Class2').methods(False):
+            self.sn.getInstanceMethod('Class2', sel)
+            self.sn.getInstanceMethodSize('Class2', sel)
+        # One pointers command per side of a class, the sources come from the file.
+        assert(self.server.requests == requests)
+        assert(self.stats.counters['source file reads'] == 1 + 2 * 4)
+
+    def test_Changes(self):
+        assert(self.sn.getInstanceMethod('Class1', 'method0').startswith('method0\n'))
+        self.image.addMethod('Class1', 'method0', 'method0\r\t^ #changed!', 'protocol-0')
+        self.image.writeSources(self.changes, 2, [('Class1', False, 'method0')])
+        # Until the pointers expire the old source is served.
+        assert(self.sn.getInstanceMethod('Class1', 'method0') != self.plain.getInstanceMethod('Class1', 'method0'))
+        self.sn.pointers.clear()
+        assert(self.sn.getInstanceMethod('Class1', 'method0') == 'method0\n\t^ #changed!\n')
+        # The changes file grows past its map.
+        self.image.addMethod('Class1', 'method1:with:', 'method1: a with: b\r\t^ a', 'protocol-1')
+        self.image.writeSources(self.changes, 2, [('Class1', False, 'method1:with:')])
+        self.sn.pointers.clear()
+        assert(self.sn.getInstanceMethod('Class1', 'method1:with:') == 'method1: a with: b\n\t^ a\n')
+
+    def test_Fallback(self):
+        # Compiled after the files were written, without a pointer.
+        self.image.addMethod('Class2', 'fresh', 'fresh\r\t^ 1')
+        assert(self.sn.getInstanceMethod('Class2', 'fresh') == 'fresh\n\t^ 1\n')
+        # A missing file.
+        self.image.writeSources(os.path.join(self.dir, 'other'), 3, [('Class2', False, 'fresh')])
+        self.sn.pointers.clear()
+        assert(self.sn.getInstanceMethodSize('Class2', 'fresh') == len('fresh\n\t^ 1\n'))
+        assert('source file reads' not in self.stats.counters)
+        try:
+            self.sn.getInstanceMethod('Nothing', 'method0')
+            assert(False)
+        except squeakNet.SqueakNetException, e:
+            assert(e.errnum == -1)
+
+    def test_OldImage(self):
+        self.image.__class__ = OldImage
+        assert(self.sn.getInstanceMethod('Class1', 'method0').startswith('method0\n'))
+        assert(not self.sn.enabled)
+
+    def test_Mount(self):
+        fs = squeakfs.SqueakFS()
+        fs.initializeConnection(self.server.port)
+        fs.initializeSources(','.join([self.sources, self.changes]))
+        try:
+            assert(isinstance(fs.sn, sourcefiles.SourceSqueakNet))
+            assert(isinstance(fs.backend(), sourcefiles.SourceSqueakNet))
+            res = fs.parser.parse('/flat/Class1/instance/bang')
+            assert(res.read(100, 0) == "bang\n\t^ 'wow!' , '!!'\n")
+            assert(fs.stats.counters['source file reads'] > 0)
+        finally:
+            fs.sourcefiles.close()
@@ -0,0 +1,77 @@
+import time
+
+import cache
+import squeakNet
+import stale
+import standin
+import stats
+
+class TestStale():
+    def setup_method(self, method):
+        self.image = standin.synthesize(classes=5, methods=4)
+        self.server = standin.StandInServer(self.image)
+        self.server.start()
+        self.stats = stats.Stats()
+        self.sn = stale.StaleSqueakNet(squeakNet.SqueakNet(self.server.port),
+                                       lambda: squeakNet.SqueakNet(self.server.port),
+                                       {'classes': stale.Policy(0.1, 1), 'checks': stale.Policy(0.1, 0.2)},
+                                       self.stats, cache.Cache('test-stale'))
+
+    def teardown_method(self, method):
+        self.sn.stop()
+        self.server.stop()
+
+    def cost(self, fn, *args):
+        self.sn.beginOperation()
+        result = fn(*args)
+        return result, self.sn.endOperation()[0]
+
+    def settle(self):
+        for i in range(100):
+            if not self.sn.pending:
+                return
+            time.sleep(0.02)
+
+    def test_parsePolicy(self):
+        policy = stale.parsePolicy('10:300')
+        assert(policy.ttl == 10 and policy.maxage == 300)
+        assert(stale.parsePolicy('') is None)
+        assert(stale.parsePolicy('10:5').maxage == 10)
+
+    def test_Fresh(self):
+        classes, n = self.cost(self.sn.getAllClasses)
+        assert(n == 1)
+        assert(self.cost(self.sn.getAllClasses) == (classes, 0))
+        # Superclasses have no policy here.
+        assert(self.cost(self.sn.getSuperClass, 'Class1')[1] == 1)
+        assert(self.cost(self.sn.getSuperClass, 'Class1')[1] == 1)
+
+    def test_StaleWhileRevalidate(self):
+        self.sn.start()
+        classes = self.sn.getAllClasses()
+        self.image.addClass('Frob', 'Object', 'Category-0')
+        time.sleep(0.15)
+        # Expired but within maxage: the old answer, at once.
+        assert(self.cost(self.sn.getAllClasses) == (classes, 0))
+        assert(self.stats.counters['stale answers'] == 1)
+        self.settle()
+        assert('Frob' in self.cost(self.sn.getAllClasses)[0])
+
+    def test_MaxAge(self):
+        assert(self.sn.isClassAvailable('Class1'))
+        time.sleep(0.25)
+        # Older than maxage: the caller waits for the image.
+        assert(self.cost(self.sn.isClassAvailable, 'Class1') == (True, 1))
+
+    def test_Gone(self):
+        self.sn.start()
+        assert(self.sn.getSubClasses('Class4') == [])
+        del self.image.classes['Class4']
+        time.sleep(0.15)
+        assert(self.sn.getSubClasses('Class4') == [])
+        self.settle()
+        try:
+            self.sn.getSubClasses('Class4')
+            assert(False)
+        except squeakNet.SqueakNetException:
+            pass
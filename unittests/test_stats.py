@@ -0,0 +1,58 @@
+import time
+
+import stats
+import cache
+
+class TestStats():
+    def setup_method(self, method):
+        self.stats = stats.Stats()
+
+    def test_Histogram(self):
+        h = stats.Histogram()
+        h.add(0.00005)
+        h.add(0.002)
+        h.add(10)
+        assert(h.count == 3)
+        assert(h.buckets[0] == 1 and h.buckets[3] == 1 and h.buckets[-1] == 1)
+        assert(h.max == 10)
+
+    def test_recordOp(self):
+        self.stats.recordOp("getattr", 0.001)
+        self.stats.recordOp("getattr", 0.003)
+        assert(self.stats.ops["getattr"].count == 2)
+        assert("getattr count=2" in self.stats.report())
+
+    def test_recordCommand(self):
+        self.stats.recordCommand("getSuperClass:", 20, 12, 0.0005)
+        self.stats.recordCommand("getSuperClass:", 20, 30, 0.0005, True)
+        c = self.stats.commands["getSuperClass:"]
+        assert(c.sent == 40 and c.received == 42 and c.errors == 1)
+
+    def test_reset(self):
+        self.stats.increment("reconnects")
+        self.stats.reset()
+        assert("reconnects" not in self.stats.report())
+
+    def test_CacheHitRate(self):
+        c = cache.Cache("test")
+        c.put("Object", "ProtoObject")
+        assert(c.get("Object") == "ProtoObject")
+        try:
+            c.get("Morph")
+        except KeyError:
+            pass
+        assert("test entries=1 hits=1 misses=1 hitrate=50.0%" in self.stats.report([c]))
+        cache.flush()
+        assert(len(c) == 0)
+
+    def test_ExpiredIn(self):
+        c = cache.Cache("test-groups", 0, lambda key: key[0])
+        c.put(("Object", "new"), 1)
+        c.put(("Object", "copy"), 2)
+        c.put(("Morph", "new"), 3)
+        time.sleep(0.01)
+        assert(sorted(c.expiredIn("Object")) == [(("Object", "copy"), 2), (("Object", "new"), 1)])
+        c.discard(("Morph", "new"))
+        assert(c.expiredIn("Morph") == [] and "Morph" not in c.groups)
+        c.clear()
+        assert(c.expiredIn("Object") == [])
@@ -0,0 +1,78 @@
+import time
+
+import cache
+import squeakNet
+import standin
+import timestamps
+
+class OldImage(standin.Image):
+    """ An image whose server has the stamp commands but not the stat ones. """
+
+    commands = dict([(k, v) for k, v in standin.Image.commands.items()
+                     if not k.startswith('getLatest') and 'Stat:' not in k])
+
+class TestTimestamps():
+    def test_parseStamp(self):
+        expected = time.mktime((2008, 3, 14, 12, 34, 0, 0, 0, -1))
+        assert(timestamps.parseStamp('jbj 3/14/2008 12:34') == expected)
+        assert(timestamps.parseStamp('jbj 3/14/08 12:34') == expected)
+        assert(timestamps.parseStamp('jbj 3/14/2008 12:34 pm') == expected)
+        assert(timestamps.parseStamp('jbj 3/14/2008 12:34:00') == expected)
+        assert(timestamps.parseStamp('jbj 3/14/2008') == time.mktime((2008, 3, 14, 0, 0, 0, 0, 0, -1)))
+        assert(timestamps.parseStamp('') == 0)
+        assert(timestamps.parseStamp('<historical>') == 0)
+
+    def test_Latest(self):
+        image = standin.synthesize(classes=2, methods=4)
+        image.addMethod('Class1', 'newest', 'newest', 'recent', False, 'x 5/5/2009 10:00')
+        server = standin.StandInServer(image)
+        server.start()
+        try:
+            cache.flush()
+            sn = squeakNet.SqueakNet(server.port)
+            newest = timestamps.parseStamp('x 5/5/2009 10:00')
+            assert(timestamps.methodTime(sn, 'Class1', 'newest', False) == newest)
+            assert(timestamps.latest(sn, 'Class1') == newest)
+            assert(timestamps.latest(sn, 'Class1', False, ['method0']) < newest)
+            assert(timestamps.methodTime(sn, 'NoSuchClass', 'newest', False) == 0)
+        finally:
+            server.stop()
+
+    def test_OneCommand(self):
+        image = standin.synthesize(classes=2, methods=4)
+        image.addMethod('Class1', 'newest', 'newest', 'recent', False, 'x 5/5/2009 10:00')
+        server = standin.StandInServer(image)
+        server.start()
+        try:
+            cache.flush()
+            sn = squeakNet.SqueakNet(server.port)
+            newest = timestamps.parseStamp('x 5/5/2009 10:00')
+            sn.beginOperation()
+            assert(timestamps.classTime(sn, 'Class1') == newest)
+            assert(timestamps.methodStat(sn, 'Class1', 'newest', False, None) == (len('newest\n'), newest))
+            assert(sn.endOperation()[0] == 2)
+            try:
+                timestamps.classTime(sn, 'NoSuchClass')
+                assert(False)
+            except squeakNet.SqueakNetException, e:
+                assert(e.errnum == -1)
+        finally:
+            server.stop()
+
+    def test_OldServer(self):
+        image = OldImage()
+        image.addClass('Class1', 'Object', 'Category-1')
+        image.addMethod('Class1', 'newest', 'newest', 'recent', False, 'x 5/5/2009 10:00')
+        server = standin.StandInServer(image)
+        server.start()
+        try:
+            cache.flush()
+            sn = squeakNet.SqueakNet(server.port)
+            newest = timestamps.parseStamp('x 5/5/2009 10:00')
+            size = lambda: sn.getInstanceMethodSize('Class1', 'newest')
+            assert(timestamps.methodStat(sn, 'Class1', 'newest', False, size) == (len('newest\n'), newest))
+            assert(timestamps.classTime(sn, 'Class1') == newest)
+            assert(timestamps.nolatest and timestamps.unstatted)
+        finally:
+            del timestamps.nolatest[:], timestamps.unstatted[:]
+            server.stop()
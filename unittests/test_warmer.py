@@ -0,0 +1,127 @@
+import os
+import time
+import tempfile
+
+import cache
+import squeakNet
+import squeakfs
+import standin
+import stats
+import warmer
+
+class TestWarmer():
+    def setup_method(self, method):
+        self.server = standin.StandInServer(standin.synthesize(classes=5, methods=8))
+        self.server.start()
+        cache.flush()
+        self.sn = warmer.CachingSqueakNet(squeakNet.SqueakNet(self.server.port))
+        self.parser = squeakfs.PathParser(self.sn, stats.Stats())
+        self.logfile = tempfile.mktemp('.log')
+        self.warmer = warmer.Warmer(lambda: squeakNet.SqueakNet(self.server.port), self.logfile)
+
+    def teardown_method(self, method):
+        self.warmer.stop()
+        self.server.stop()
+        if os.path.exists(self.logfile):
+            os.unlink(self.logfile)
+
+    def cost(self, path):
+        self.sn.beginOperation()
+        self.parser.parse(path).read(4096, 0)
+        return self.sn.endOperation()[0]
+
+    def test_ClassListing(self):
+        self.warmer.listed(self.parser.parse('/flat/Class2'))
+        self.warmer.start()
+        self.warmer.queue.join()
+        assert(self.cost('/flat/Class2/instance/method3:with:') == 0)
+        assert(self.cost('/flat/Class2/class/new1') == 0)
+        assert(self.cost('/flat/Class3/instance/method3:with:') == 1)
+
+    def test_ProtocolListing(self):
+        self.warmer.listed(self.parser.parse('/category/Category-2/Class2/instance/protocol-1'))
+        self.warmer.start()
+        self.warmer.queue.join()
+        assert(self.cost('/flat/Class2/instance/method5:with:') == 0)
+        assert(self.cost('/flat/Class2/instance/method2') == 1)
+
+    def test_YieldsToForeground(self):
+        self.warmer.enter()
+        self.warmer.listed(self.parser.parse('/flat/Class2'))
+        self.warmer.start()
+        requests = self.server.requests
+        time.sleep(0.3)
+        assert(self.server.requests == requests)
+        self.warmer.leave()
+        self.warmer.queue.join()
+        assert(self.server.requests > requests)
+
+    def test_FailedOperationLeaves(self):
+        class Failing:
+            def classify(self, pid, path):
+                raise RuntimeError('classify')
+        fs = squeakfs.SqueakFS()
+        fs.initializeConnection(self.server.port)
+        fs.warmer = self.warmer
+        fs.scheduler = Failing()
+        fs.GetContext = lambda: {'pid': 1}
+        try:
+            fs.getattr('/flat/Class2')
+            assert(False)
+        except RuntimeError:
+            pass
+        assert(self.warmer.active == 0)
+
+    def test_Mount(self):
+        fs = squeakfs.SqueakFS()
+        fs.initializeConnection(self.server.port)
+        fs.initializeResponses('on')
+        assert(isinstance(fs.sn, warmer.CachingSqueakNet))
+        assert(isinstance(fs.backend(), squeakNet.SqueakNet))
+        fs.initializeWarmer('on', None)
+        # The warmer shares the layer rather than adding another.
+        assert(isinstance(fs.sn.sn, squeakNet.SqueakNet))
+        source = fs.sn.getInstanceMethod('Class2', 'method0')
+        requests = self.server.requests
+        assert(fs.sn.getInstanceMethodSize('Class2', 'method0') == len(source))
+        assert(self.server.requests == requests)
+
+    def test_AccessLog(self):
+        for i in range(3):
+            self.warmer.accessed(self.parser.parse('/flat/Class4/instance'))
+        self.warmer.accessed(self.parser.parse('/flat/Class1/comment'))
+        self.warmer.stop()
+        assert(open(self.logfile).read() == '3\tClass4\n1\tClass1\n')
+
+        cache.flush()
+        self.warmer = warmer.Warmer(lambda: squeakNet.SqueakNet(self.server.port), self.logfile, top=1)
+        self.warmer.start()
+        self.warmer.queue.join()
+        assert(self.cost('/flat/Class4/instance/method0') == 0)
+        assert(self.cost('/flat/Class1/instance/method0') == 1)
+
+    def test_ConditionalCommands(self):
+        sn = squeakNet.SqueakNet(self.server.port)
+        source = sn.getInstanceMethod('Class2', 'method0')
+        hash = squeakNet.contentHash(source)
+        assert(sn.getInstanceMethodIfChanged('Class2', 'method0', hash) is None)
+        assert(sn.getInstanceMethodIfChanged('Class2', 'method0', 'x') == source)
+        comment = sn.getClassComment('Class2')
+        assert(sn.getClassCommentIfChanged('Class2', squeakNet.contentHash(comment)) is None)
+        changed = sn.getInstanceMethodsIfChanged('Class2', {'method0': hash, 'method2': hash, 'gone': hash})
+        assert(sorted(changed) == ['gone', 'method2'])
+
+    def test_Revalidation(self):
+        responses = cache.Cache('test-revalidation', 0.1, warmer.commandClass)
+        sn = warmer.CachingSqueakNet(squeakNet.SqueakNet(self.server.port), responses)
+        self.sn = sn
+        self.parser = squeakfs.PathParser(sn, stats.Stats())
+        for sel in ('method0', 'method2', 'method4'):
+            sn.getInstanceMethod('Class2', sel)
+        time.sleep(0.2)
+        self.server.image.addMethod('Class2', 'method2', 'method2\r\t^ 42')
+        # One command confirms method0 and method4 and reports method2.
+        assert(self.cost('/flat/Class2/instance/method0') == 1)
+        assert(self.cost('/flat/Class2/instance/method4') == 0)
+        assert(self.cost('/flat/Class2/instance/method2') == 1)
+        assert(sn.getInstanceMethod('Class2', 'method2') == 'method2\n\t^ 42\n')
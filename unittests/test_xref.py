@@ -0,0 +1,56 @@
+import indexer
+import xref
+import squeakNet
+import standin
+
+class TestXref():
+    def setup_method(self, method):
+        self.image = standin.synthesize(classes=5, methods=4)
+        self.server = standin.StandInServer(self.image)
+        self.server.start()
+        self.index = xref.XrefIndex()
+        self.indexer = indexer.Indexer(lambda: squeakNet.SqueakNet(self.server.port), depth=4)
+        self.indexer.addConsumer(self.index)
+        self.sn = squeakNet.SqueakNet(self.server.port)
+
+    def teardown_method(self, method):
+        self.server.stop()
+
+    def test_MessagesSent(self):
+        sent = standin.messagesSent('foo\r\t| x |\r\tx := (Array new: 3) at: 1 put: self size; yourself.\r\t^ x + 1')
+        assert(sent == ['+', 'at:put:', 'new:', 'size', 'yourself'])
+        assert(self.sn.getInstanceMessagesSent('Class1')['method0'] == ['method1:with:'])
+        assert(self.sn.getInstanceMessagesSent('Object')['__SLASH__'] == ['primitiveFailed'])
+
+    def test_Implementors(self):
+        self.indexer.scan(self.sn)
+        assert(self.index.implementorsOf('new0') == [('Class%d' % i, True) for i in range(5)])
+        assert(('Object', False) in self.index.implementorsOf('__SLASH__'))
+        assert(self.index.implementorsOf('frobnicate') == [])
+
+    def test_Senders(self):
+        self.indexer.scan(self.sn)
+        assert(('Class2', False, 'method0') in self.index.sendersOf('method1:with:'))
+        assert(('Object', False, '__SLASH__') in self.index.sendersOf('primitiveFailed'))
+
+    def test_IncrementalUpdate(self):
+        self.indexer.scan(self.sn)
+        self.image.addMethod('Class3', 'method0', 'method0\r\t^ self frobnicate', 'protocol-0', False, 'x 1/1/2010 10:00')
+        del self.image.cls('Class4').instanceMethods['method2']
+        self.indexer.scan(self.sn)
+        assert(self.index.sendersOf('frobnicate') == [('Class3', False, 'method0')])
+        assert(('Class3', False, 'method0') not in self.index.sendersOf('method1:with:'))
+        assert(('Class4', False) not in self.index.implementorsOf('method2'))
+        assert(('Class4', False, 'method2') not in self.index.sendersOf('method3:with:'))
+
+    def test_Parsers(self):
+        self.indexer.scan(self.sn)
+        implementors = xref.ImplementorsPathParser(self.index)
+        assert(implementors.parse('/new0').readdir(0) == ['Class%d class' % i for i in range(5)])
+        assert(implementors.parse('/new0/Class1 class').readlink() == '../../flat/Class1/class/new0')
+        assert(implementors.parse('/new0/Class1').getattr() < 0)
+        assert(implementors.parse('/frobnicate').getattr() < 0)
+        senders = xref.SendersPathParser(self.index)
+        assert('Class1>>method0' in senders.parse('/method1:with:').readdir(0))
+        assert(senders.parse('/method1:with:/Class1>>method0').readlink() == '../../flat/Class1/instance/method0')
+        assert(senders.parse('/method1:with:/Class1>>method2').getattr() < 0)
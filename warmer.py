@@ -0,0 +1,337 @@
+import os
+import Queue
+import logging
+import itertools
+import threading
+
+import cache
+import names
+import resource
+import category
+import hierarchy
+from squeakNet import SqueakNetException, contentHash
+
+""" Prefetching what is likely to be read next while the image is idle.
+
+The first look at a directory pays a round trip per entry. The warmer guesses
+what comes next and fetches it on its own connection into the responses
+cache, which CachingSqueakNet consults before asking the image:
+
+    class directory listed      its selectors, then the sources of its methods
+    method directory listed     the sources of its methods
+    protocol listed             the sources of the methods in it
+    mount                       the classes used most in earlier sessions
+
+Work from listings goes first, most recent listing first. The warmer only
+sends a command while no FUSE operation is running, so it never makes an
+interactive request wait behind it at the image. Cached listings are kept as
+ID vectors of the shared names.table.
+
+"""
+
+# How long prefetched and fetched responses are trusted, in seconds.
+ttl = 10
+
+def commandClass(key):
+    """ Groups responses by command and class, to revalidate the sources of a class at once. """
+
+    return (key[0], key[1][:1])
+
+responses = cache.Cache('responses', ttl, commandClass)
+
+HIGH = 0
+LOW = 1
+
+# The command fetching the sources behind each listing command.
+sources = {
+    'getInstanceMethodsInClass': 'getInstanceMethod',
+    'getClassMethodsInClass': 'getClassMethod',
+    'getMethodsInInstanceProtocol': 'getInstanceMethod',
+    'getMethodsInClassProtocol': 'getClassMethod',
+}
+
+class CachingSqueakNet:
+    """ Answers the commands the warmer prefetches from the responses cache.
+
+    Sizes, ranges and hashes of cached sources and comments are answered
+    from them.
+    Expired sources and comments are revalidated by their contentHash rather
+    than fetched again; the sources of all expired methods on one side of a
+    class are revalidated with one command.
+
+    """
+
+    cached = ['getInstanceMethodsInClass', 'getClassMethodsInClass', 'getInstanceMethod',
+              'getClassMethod', 'getMethodsInInstanceProtocol', 'getMethodsInClassProtocol',
+              'getClassComment']
+
+    # Commands answered from the cached response of another command, and the
+    # number of leading arguments they share with it.
+    derived = {'getInstanceMethodSize': ('getInstanceMethod', 2),
+               'getClassMethodSize': ('getClassMethod', 2),
+               'getClassCommentSize': ('getClassComment', 1),
+               'getInstanceMethodRange': ('getInstanceMethod', 2),
+               'getClassMethodRange': ('getClassMethod', 2),
+               'getClassCommentRange': ('getClassComment', 1),
+               'getInstanceMethodHash': ('getInstanceMethod', 2),
+               'getClassMethodHash': ('getClassMethod', 2),
+               'getClassCommentHash': ('getClassComment', 1)}
+
+    # The commands revalidating many sources of a class at once.
+    batches = {'getInstanceMethod': 'getInstanceMethodsIfChanged',
+               'getClassMethod': 'getClassMethodsIfChanged'}
+
+    def __init__(self, sn, responses=responses):
+        self.sn = sn
+        self.responses = responses
+        # Cleared when the image does not know the conditional commands.
+        self.conditional = True
+
+    def __getattr__(self, name):
+        fn = getattr(self.sn, name)
+        if name in self.derived:
+            return lambda *args: self.derive(name, fn, args)
+        if name not in self.cached:
+            return fn
+        def call(*args):
+            key = (name, args)
+            try:
+                return names.unpack(self.responses.get(key))
+            except KeyError:
+                pass
+            if self.conditional:
+                result = self.revalidate(name, args)
+                if result is not None:
+                    return result
+            result = fn(*args)
+            self.responses.put(key, names.pack(result))
+            return result
+        return call
+
+    def derive(self, name, fn, args):
+        """ Answers a size, range or hash command from a cached source or comment. """
+
+        full, n = self.derived[name]
+        try:
+            text = self.responses.get((full, args[:n]))
+        except KeyError:
+            text = self.conditional and self.revalidate(full, args[:n]) or None
+            if text is None:
+                return fn(*args)
+        if name.endswith('Size'):
+            return len(text)
+        if name.endswith('Hash'):
+            return contentHash(text)
+        offset, size = args[n:]
+        return text[offset:offset + size]
+
+    def revalidate(self, name, args):
+        """ Returns the expired response for args if the image confirms it, else None. """
+
+        key = (name, args)
+        try:
+            old = self.responses.stale(key)
+        except KeyError:
+            return None
+        values = {}
+        hashes = {}
+        try:
+            if name == 'getClassComment':
+                text = self.sn.getClassCommentIfChanged(args[0], contentHash(old))
+                if text is None:
+                    text = old
+                self.responses.put(key, text)
+                return text
+            if name not in self.batches:
+                return None
+            for k, value in self.responses.expiredIn((name, args[:1])):
+                values[k] = value
+                hashes[k[1][1]] = contentHash(value)
+            changed = getattr(self.sn, self.batches[name])(args[0], hashes)
+        except SqueakNetException, e:
+            if e.errnum != -1:
+                raise
+            if 'Unknown command' in e.errmsg:
+                logging.info("Server has no conditional commands, expired responses are fetched again")
+                self.conditional = False
+            self.responses.discard(key)
+            return None
+        for k, value in values.items():
+            if k[1][1] in changed:
+                self.responses.discard(k)
+            else:
+                self.responses.put(k, value)
+        if args[1] in changed or args[1] not in hashes:
+            return None
+        return old
+
+class Warmer:
+    """ Prefetches into responses on a connection from connect().
+
+    Arguments:
+        logfile     where the classes used in a session are counted, so the
+                    next session can start warming them. None to disable.
+        top         how many classes to warm at mount.
+        limit       the most commands waiting to be prefetched.
+
+    """
+
+    def __init__(self, connect, logfile=None, top=50, limit=10000, responses=responses, stats=None):
+        self.connect = connect
+        self.logfile = logfile
+        self.top = top
+        self.limit = limit
+        self.responses = responses
+        self.stats = stats
+        self.queue = Queue.PriorityQueue()
+        self.sequence = itertools.count()
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.active = 0
+        self.counts = {}
+        self.stopped = threading.Event()
+        self.thread = None
+
+    # Foreground
+
+    def enter(self):
+        """ Called when a FUSE operation starts. """
+
+        self.lock.acquire()
+        self.active += 1
+        self.lock.release()
+
+    def leave(self):
+        self.lock.acquire()
+        self.active -= 1
+        if not self.active:
+            self.idle.notifyAll()
+        self.lock.release()
+
+    def listed(self, res):
+        """ Called with every resource listed by readdir. """
+
+        if isinstance(res, (resource.ClassDirectoryResource, hierarchy.HierarchyClassDirectoryResource)):
+            self.add(HIGH, 'getInstanceMethodsInClass', (res.cls,))
+            self.add(HIGH, 'getClassMethodsInClass', (res.cls,))
+        elif isinstance(res, resource.InstanceMethodsDirectoryResource):
+            self.add(HIGH, 'getInstanceMethodsInClass', (res.cls,))
+        elif isinstance(res, resource.ClassMethodsDirectoryResource):
+            self.add(HIGH, 'getClassMethodsInClass', (res.cls,))
+        elif isinstance(res, category.CategoryInstanceProtocolResource):
+            self.add(HIGH, 'getMethodsInInstanceProtocol', (res.cls, res.protocol))
+        elif isinstance(res, category.CategoryClassProtocolResource):
+            self.add(HIGH, 'getMethodsInClassProtocol', (res.cls, res.protocol))
+
+    def accessed(self, res):
+        """ Called with every resource listed or opened, for the access log. """
+
+        cls = getattr(res, 'cls', None)
+        if cls:
+            self.lock.acquire()
+            self.counts[cls] = self.counts.get(cls, 0) + 1
+            self.lock.release()
+
+    def add(self, priority, name, args):
+        if self.queue.qsize() < self.limit:
+            # The most recent work of a priority goes first.
+            self.queue.put((priority, -self.sequence.next(), name, args))
+
+    # Background
+
+    def start(self):
+        for cls in self.load()[:self.top]:
+            self.add(LOW, 'getInstanceMethodsInClass', (cls,))
+            self.add(LOW, 'getClassMethodsInClass', (cls,))
+        self.thread = threading.Thread(target=self.run, name='squeakfs-warmer')
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.save()
+
+    def waitIdle(self):
+        self.lock.acquire()
+        try:
+            while self.active and not self.stopped.isSet():
+                self.idle.wait(0.1)
+        finally:
+            self.lock.release()
+
+    def run(self):
+        sn = None
+        while not self.stopped.isSet():
+            try:
+                priority, sequence, name, args = self.queue.get(True, 0.5)
+            except Queue.Empty:
+                continue
+            try:
+                self.waitIdle()
+                if sn is None:
+                    sn = self.connect()
+                self.perform(sn, priority, name, args)
+            except SqueakNetException:
+                logging.debug("Prefetch %s %s failed", name, args, exc_info=True)
+                if self.stats is not None:
+                    self.stats.increment('prefetch errors')
+            except Exception:
+                logging.error("Prefetch %s %s failed", name, args, exc_info=True)
+                sn = None
+            self.queue.task_done()
+
+    def perform(self, sn, priority, name, args):
+        key = (name, args)
+        try:
+            result = names.unpack(self.responses.get(key))
+        except KeyError:
+            result = getattr(sn, name)(*args)
+            self.responses.put(key, names.pack(result))
+            if self.stats is not None:
+                self.stats.increment('prefetches')
+        if name in sources:
+            for sel in result:
+                self.add(priority, sources[name], (args[0], sel))
+
+    # The access log
+
+    def load(self):
+        """ Returns the classes of the access log, most used first. """
+
+        if self.logfile is None or not os.path.exists(self.logfile):
+            return []
+        counts = {}
+        try:
+            for line in open(self.logfile):
+                count, cls = line.rstrip('\n').split('\t', 1)
+                counts[cls] = int(count)
+        except (IOError, ValueError):
+            logging.warning("Ignoring the unreadable access log %s", self.logfile, exc_info=True)
+            return []
+        self.lock.acquire()
+        try:
+            # Earlier sessions count half as much as this one.
+            for cls, count in counts.items():
+                self.counts[cls] = self.counts.get(cls, 0) + count // 2
+        finally:
+            self.lock.release()
+        return sorted(counts, key=lambda cls: -counts[cls])
+
+    def save(self):
+        if self.logfile is None:
+            return
+        self.lock.acquire()
+        try:
+            counts = sorted(self.counts.items(), key=lambda item: -item[1])
+        finally:
+            self.lock.release()
+        try:
+            f = open(self.logfile, 'w')
+            try:
+                for cls, count in counts:
+                    if count:
+                        f.write('%d\t%s\n' % (count, cls))
+            finally:
+                f.close()
+        except IOError:
+            logging.warning("Could not write the access log %s", self.logfile, exc_info=True)
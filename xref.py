@@ -0,0 +1,225 @@
+import re
+import errno
+import threading
+from array import array
+
+import names
+import resource
+from search import entryName, parseEntry, entry_exp
+from defstat import *
+
+""" Cross references between methods, served as the implementors/ and senders/ trees.
+
+The index maps every selector to the classes implementing it and to the
+methods sending it. Like the search index it is fed by an indexer.Indexer,
+which fetches the sent selectors of a whole class side with one command, so
+both trees are answered from memory.
+
+    implementors/<sel>/                 classes implementing sel
+    implementors/<sel>/Class            symlink to flat/Class/instance/sel
+    implementors/<sel>/Class class      symlink to flat/Class/class/sel
+    senders/<sel>/                      methods sending sel
+    senders/<sel>/Class>>method         symlink to flat/Class/instance/method
+    senders/<sel>/Class class>>method   symlink to flat/Class/class/method
+
+"""
+
+def implementorName(cls, classSide):
+    if classSide:
+        return '%s class' % cls
+    return cls
+
+def parseImplementor(name):
+    """ Returns the (class, classSide) of an implementorName. """
+
+    if name.endswith(' class'):
+        return name[:-len(' class')], True
+    return name, False
+
+class XrefIndex:
+    """ Implementors and senders of every selector in the image.
+
+    Selectors, implementors and methods are kept as IDs of a names.NameTable,
+    an implementor by the ID of its implementorName and a method by the ID of
+    its entryName.
+
+    """
+
+    wantsMessages = True
+
+    def __init__(self, table=names.table):
+        self.lock = threading.Lock()
+        self.table = table
+        self.implementors = {}  # selector -> array of implementors
+        self.senders = {}       # selector -> array of methods
+        self.sends = {}         # method -> array of selectors sent
+
+    def methodsChanged(self, cls, classSide, changed, removed):
+        implementor = self.table.intern(implementorName(cls, classSide))
+        self.lock.acquire()
+        try:
+            for sel in removed + changed.keys():
+                method = self.table.find(entryName(cls, classSide, sel))
+                for sent in self.sends.pop(method, ()):
+                    self.discard(self.senders, sent, method)
+                if sel in removed:
+                    self.discard(self.implementors, self.table.find(sel), implementor)
+            for sel, m in changed.items():
+                found = self.implementors.setdefault(self.table.intern(sel), array('I'))
+                if implementor not in found:
+                    found.append(implementor)
+                if m.messages is None:
+                    continue
+                method = self.table.intern(entryName(cls, classSide, sel))
+                sent = self.table.encode(sorted(set(m.messages)))
+                self.sends[method] = sent
+                for s in sent:
+                    self.senders.setdefault(s, array('I')).append(method)
+        finally:
+            self.lock.release()
+
+    def discard(self, table, key, value):
+        found = table.get(key)
+        if found is not None and value in found:
+            found.remove(value)
+            if not found:
+                del table[key]
+
+    def implementorsOf(self, selector):
+        """ Returns the sorted (class, classSide) pairs implementing selector. """
+
+        self.lock.acquire()
+        try:
+            found = self.implementors.get(self.table.find(selector), ())
+            return sorted([parseImplementor(self.table.name(i)) for i in found])
+        finally:
+            self.lock.release()
+
+    def sendersOf(self, selector):
+        """ Returns the sorted (class, classSide, selector) methods sending selector. """
+
+        self.lock.acquire()
+        try:
+            found = self.senders.get(self.table.find(selector), ())
+            return sorted([parseEntry(self.table.name(m)) for m in found])
+        finally:
+            self.lock.release()
+
+class XrefRootResource(resource.Resource):
+    """ The implementors/ or senders/ directory. Selectors are looked up, not listed. """
+
+    def getattr(self):
+        return DirStat(2)
+
+    def readdir(self, offset):
+        return []
+
+class ImplementorsResource(resource.Resource):
+    """ A directory of links to the implementations of a selector. """
+
+    def __init__(self, index, selector):
+        resource.Resource.__init__(self)
+        self.index = index
+        self.selector = selector
+
+    def getattr(self):
+        found = self.index.implementorsOf(self.selector)
+        if not found:
+            return -errno.ENOENT
+        return DirStat(len(found) + 2)
+
+    def readdir(self, offset):
+        return [implementorName(*m) for m in self.index.implementorsOf(self.selector)]
+
+class SendersResource(resource.Resource):
+    """ A directory of links to the methods sending a selector. """
+
+    def __init__(self, index, selector):
+        resource.Resource.__init__(self)
+        self.index = index
+        self.selector = selector
+
+    def getattr(self):
+        found = self.index.sendersOf(self.selector)
+        if not found:
+            return -errno.ENOENT
+        return DirStat(len(found) + 2)
+
+    def readdir(self, offset):
+        return [entryName(*m) for m in self.index.sendersOf(self.selector)]
+
+class XrefLinkResource(resource.Resource):
+    """ A link from an implementor or sender to the method in flat/. """
+
+    def __init__(self, exists, cls, classSide, method):
+        resource.Resource.__init__(self)
+        self.exists = exists
+        self.method = (cls, classSide, method)
+
+    def target(self):
+        cls, classSide, method = self.method
+        return '../../flat/%s/%s/%s' % (cls, classSide and 'class' or 'instance', method)
+
+    def getattr(self):
+        if not self.exists():
+            return -errno.ENOENT
+        return LinkStat(len(self.target()))
+
+    def readlink(self):
+        return self.target()
+
+class ImplementorsPathParser(resource.Parser):
+    """ Converts a path below implementors/ into a resource. """
+
+    path_exp = re.compile('^/((?P<selector>[^/]+)(/(?P<entry>[^/]+))?)?$')
+    entry_exp = re.compile('^(?P<class>\w+)(?P<meta> class)?$')
+
+    def __init__(self, index):
+        self.index = index
+
+    def parse(self, path):
+        try:
+            res = self.path_exp.match(path).groupdict()
+        except AttributeError:
+            return resource.IllegalResource()
+
+        selector = res['selector']
+        if res['entry']:
+            entry = self.entry_exp.match(res['entry'])
+            if entry is None:
+                return resource.IllegalResource()
+            cls, classSide = entry.group('class'), entry.group('meta') is not None
+            exists = lambda: (cls, classSide) in self.index.implementorsOf(selector)
+            return XrefLinkResource(exists, cls, classSide, selector)
+        elif selector:
+            return ImplementorsResource(self.index, selector)
+        else:
+            return XrefRootResource()
+
+class SendersPathParser(resource.Parser):
+    """ Converts a path below senders/ into a resource. """
+
+    path_exp = re.compile('^/((?P<selector>[^/]+)(/(?P<entry>[^/]+))?)?$')
+    entry_exp = entry_exp
+
+    def __init__(self, index):
+        self.index = index
+
+    def parse(self, path):
+        try:
+            res = self.path_exp.match(path).groupdict()
+        except AttributeError:
+            return resource.IllegalResource()
+
+        selector = res['selector']
+        if res['entry']:
+            entry = self.entry_exp.match(res['entry'])
+            if entry is None:
+                return resource.IllegalResource()
+            method = (entry.group('class'), entry.group('meta') is not None, entry.group('method'))
+            exists = lambda: method in self.index.sendersOf(selector)
+            return XrefLinkResource(exists, *method)
+        elif selector:
+            return SendersResource(self.index, selector)
+        else:
+            return XrefRootResource()